@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Benchmarks, run with `python3 bench_all.py [--json] [--scale=small,medium,large] [benchmark names]`.
+`--json` prints one JSON object per benchmark and scale.
+"""
+from contextlib import contextmanager
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import yaml
+from mcserverstats import logalyzer, logcache, loggen, sessiontable, timeutils
+
+# generated servers, see `loggen.LogGenerator`
+SCALES = {
+    'small': dict(players=10, days=7, rotations=2),
+    'medium': dict(players=50, days=90, rotations=2, events_per_day=500),
+    'large': dict(players=200, days=365, rotations=3, events_per_day=2000),
+}
+
+benchmarks = []
+def benchmark(fun):
+    benchmarks.append(fun)
+    return fun
+
+def scaled_benchmark(fun):
+    """Registers a benchmark that is run once per selected scale."""
+    fun.scaled = True
+    return benchmark(fun)
+
+def timed(fun, *args, **kwargs):
+    """Returns the seconds it took to run `fun`."""
+    start = time.perf_counter()
+    fun(*args, **kwargs)
+    return time.perf_counter() - start
+
+def allocated(fun, *args, **kwargs):
+    """Returns the bytes still allocated by `fun` while its result is alive, and the result."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fun(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+def fake_log_data(log_nr, num_sessions=30, num_online=5):
+    day_start = 1420070400 + log_nr * 8 * 3600
+    times = [['%08x-1234-1234-1234-1234567890ab' % (i % 50), day_start + i * 60,
+              day_start + i * 60 + 1800, 'player%i' % (i % 50)] for i in range(num_sessions)]
+    online = dict(('player%i' % i, ['%08x-1234-1234-1234-1234567890ab' % i, day_start + i, 1])
+                  for i in range(num_online))
+    return {'started': True, 'stopped': log_nr % 3 == 0, 'first_event': day_start,
+            'last_event': day_start + 8 * 3600, 'online': online, 'times': times}
+
+@benchmark
+def bench_cache_load(num_logs=1000):
+    """Load times of YAML and binary caches of converted logs."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        for log_nr in range(num_logs):
+            log_path = os.path.join(logs_dir, '2015-01-01-%i.log' % log_nr)
+            data = fake_log_data(log_nr)
+            with open(log_path + '.yaml', 'w') as yaml_file:
+                yaml.dump(data, stream=yaml_file)
+            logcache.write_cache(log_path + '.bin', data)
+
+        def load_all(ext, load):
+            for log_nr in range(num_logs):
+                with open(os.path.join(logs_dir, '2015-01-01-%i.log%s' % (log_nr, ext)), 'rb') as f:
+                    load(f)
+
+        return {
+            'logs': num_logs,
+            'yaml_s': timed(load_all, '.yaml', yaml.safe_load),
+            'binary_s': timed(load_all, '.bin', logcache.load),
+        }
+
+@benchmark
+def bench_directory_open(num_logs=50000):
+    """Opening a directory with many logs and finding the logs of a date range."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        for log_nr in range(num_logs):
+            day = time.gmtime(1420070400 + (log_nr // 3) * 86400)
+            log_name = '%i-%02i-%02i-%i' % (day.tm_year, day.tm_mon, day.tm_mday, log_nr % 3 + 1)
+            open(os.path.join(logs_dir, log_name + '.log.gz'), 'wb').close()
+
+        logs = []
+        open_s = timed(lambda: logs.append(logalyzer.LogDirectory(logs_dir)))
+        logs = logs[0]
+
+        def query_setup(num_queries=1000):
+            for i in range(num_queries):
+                day = time.gmtime(1420070400 + i * 86400)
+                from_log = '%i-%02i-%02i' % (day.tm_year, day.tm_mon, day.tm_mday)
+                for name_tuple in logs.iter_log_name_tuples_between(from_log, from_log, inclusive_to=True):
+                    logs.log_files[name_tuple]
+
+        return {
+            'logs': num_logs,
+            'open_s': open_s,
+            'query_setup_s': timed(query_setup),
+        }
+
+@benchmark
+def bench_scan_log(events=40000):
+    """Throughput of parsing a compressed log, line by line and in blocks."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        loggen.generate_logs(logs_dir, players=50, days=2, events_per_day=events)
+        log_path = os.path.join(logs_dir, '2015-01-01-1.log.gz')
+        with gzip.open(log_path, 'rb') as log_file:
+            megabytes = len(log_file.read()) / 1e6
+
+        def scan_lines():
+            scanner = logalyzer.LogScanner('2015-01-01')
+            with gzip.open(log_path, 'rb') as log_file:
+                for line in log_file:
+                    scanner.feed(line)
+
+        return {
+            'megabytes': megabytes,
+            'lines_mb_s': megabytes / timed(scan_lines),
+            'blocks_mb_s': megabytes / timed(logalyzer.scan_log, log_path, '2015-01-01'),
+        }
+
+@benchmark
+def bench_event_overhead(events=40000, runs=3):
+    """Parsing throughput with and without the death, advancement and chat actions."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        loggen.generate_logs(logs_dir, players=50, days=2, events_per_day=events)
+        with gzip.open(os.path.join(logs_dir, '2015-01-01-1.log.gz'), 'rb') as log_file:
+            data = log_file.read()
+    session_actions = [(regex, action) for regex, action in logalyzer.log_actions
+                       if action.__name__ not in ('found_death', 'found_advancement', 'found_chat')]
+
+    def scan(actions):
+        scanner = logalyzer.LogScanner('2015-01-01')
+        scanner.dispatcher = logalyzer.ActionDispatcher(actions)
+        scanner.feed_block(data)
+        log_file = logalyzer.LogFile(logs_dir, '2015-01-01-1')
+        log_file.replay_events(scanner.events)
+
+    megabytes = len(data) / 1e6
+    sessions_s = min(timed(scan, session_actions) for i in range(runs))
+    all_s = min(timed(scan, logalyzer.log_actions) for i in range(runs))
+    return {
+        'megabytes': megabytes,
+        'sessions_only_mb_s': megabytes / sessions_s,
+        'all_actions_mb_s': megabytes / all_s,
+        'overhead_percent': 100 * (all_s / sessions_s - 1),
+    }
+
+@contextmanager
+def generated_logs(scale):
+    """Temporary directory with the logs of a server of the given scale."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        loggen.generate_logs(logs_dir, **SCALES[scale])
+        yield logs_dir
+
+def logs_megabytes(logs_dir):
+    return sum(os.path.getsize(os.path.join(logs_dir, name)) for name in os.listdir(logs_dir)
+               if name.endswith(('.log.gz', 'latest.log'))) / 1e6
+
+def random_ranges(logs, num_ranges, max_days=7):
+    """`(from_date, to_date)` pairs of whole days within the logs"""
+    rand = random.Random(0)
+    first_day = logs.join_from_compare(logs.sorted_log_name_tuples[0])[:10]
+    num_days = len(set(logs.sorted_log_days))
+    ranges = []
+    for i in range(num_ranges):
+        start = rand.randrange(num_days)
+        from_date = timeutils.add_to_date_str(first_day, days=start)
+        ranges.append((from_date, timeutils.add_to_date_str(from_date, days=rand.randint(1, max_days))))
+    return ranges
+
+@scaled_benchmark
+def bench_convert(scale):
+    """Reading all logs of a directory, converting them and loading the caches."""
+    with generated_logs(scale) as logs_dir:
+        return {
+            'logs': len(logalyzer.LogDirectory(logs_dir).log_files),
+            'megabytes': logs_megabytes(logs_dir),
+            'cold_s': timed(lambda: logalyzer.LogDirectory(logs_dir).collect_data()),
+            'warm_s': timed(lambda: logalyzer.LogDirectory(logs_dir).collect_data()),
+        }
+
+@scaled_benchmark
+def bench_refresh_stale(scale):
+    """Converting everything again, against only the logs that changed since they were converted."""
+    with generated_logs(scale) as logs_dir:
+        logs = logalyzer.LogDirectory(logs_dir)
+        logs.collect_data()  # convert everything
+        # same lines, compressed differently, like a log restored from a backup
+        replaced = logs.log_files[logs.sorted_log_name_tuples[len(logs.sorted_log_name_tuples) // 2]]
+        with gzip.open(replaced.source_path, 'rb') as log_file:
+            log_bytes = log_file.read()
+        with gzip.open(replaced.source_path, 'wb', compresslevel=1) as log_file:
+            log_file.write(log_bytes)
+        converted = []
+        return {
+            'logs': len(logs.sorted_log_name_tuples),
+            'refresh_s': timed(lambda: converted.extend(logalyzer.LogDirectory(logs_dir).refresh_stale())),
+            'converted': len(converted),
+            'unchanged_s': timed(lambda: logalyzer.LogDirectory(logs_dir).refresh_stale()),
+            'force_convert_s': timed(lambda: list(logalyzer.LogDirectory(logs_dir).read_interval_iter(
+                force_convert=True))),
+        }
+
+@scaled_benchmark
+def bench_queries(scale, num_queries=100):
+    """Sessions and uptimes of random date ranges, from converted logs."""
+    with generated_logs(scale) as logs_dir:
+        logalyzer.LogDirectory(logs_dir).collect_data()  # convert everything
+        logs = logalyzer.LogDirectory(logs_dir)
+        ranges = random_ranges(logs, num_queries)
+
+        def sessions(logs_for_query):
+            for from_date, to_date in ranges:
+                logs_for_query().collect_user_sessions(from_date, to_date)
+
+        def uptimes():
+            for from_date, to_date in ranges:
+                list(logs.collect_uptimes(from_date, to_date))
+
+        return {
+            'queries': num_queries,
+            'sessions_s': timed(sessions, lambda: logs),
+            'sessions_new_directory_s': timed(sessions, lambda: logalyzer.LogDirectory(logs_dir)),
+            'uptimes_s': timed(uptimes),
+        }
+
+@benchmark
+def bench_session_memory(num_sessions=1000000, num_players=500, num_logs=10000):
+    """Memory of a million sessions as lists and in a SessionTable, and of many LogFiles."""
+    uuids = ['%08x-1234-1234-1234-1234567890ab' % i for i in range(num_players)]
+    names = ['player%i' % i for i in range(num_players)]
+
+    def sessions():
+        rand = random.Random(0)
+        for i in range(num_sessions):
+            player = rand.randrange(num_players)
+            t_from = 1420070400 + i * 60
+            yield [uuids[player], t_from, t_from + rand.randrange(7200), names[player]]
+
+    lists_bytes, lists = allocated(list, sessions())
+    table_bytes, table = allocated(sessiontable.SessionTable, sessions())
+    assert table == lists
+    del lists, table
+    with tempfile.TemporaryDirectory() as logs_dir:
+        strings = sessiontable.StringTable()  # shared, as in a LogDirectory
+        log_files_bytes, log_files = allocated(lambda: [logalyzer.LogFile(logs_dir, '2015-01-01-%i' % i,
+                                                                          strings=strings)
+                                                        for i in range(num_logs)])
+    return {
+        'sessions': num_sessions,
+        'lists_bytes_per_session': lists_bytes / num_sessions,
+        'table_bytes_per_session': table_bytes / num_sessions,
+        'log_file_bytes': log_files_bytes / num_logs,
+    }
+
+@benchmark
+def bench_punchcard(num_sessions=1000000, num_players=500, years=5):
+    """Hour-of-week and daily activity of a million sessions."""
+    try:
+        from mcserverstats import punchcard
+    except ImportError:
+        return None  # needs numpy
+    rand = random.Random(0)
+    sessions = []
+    for i in range(num_sessions):
+        t_from = 1420070400 + rand.randrange(years * 365 * 24 * 3600)
+        sessions.append(['%08x-1234-1234-1234-1234567890ab' % rand.randrange(num_players), t_from,
+                         t_from + int(rand.expovariate(1 / 3600)), 'player'])
+    return {
+        'sessions': num_sessions,
+        'activity_s': timed(punchcard.compute_activity, sessions),
+    }
+
+@benchmark
+def bench_draw_timeline(num_sessions=1000, num_players=50, days=7):
+    """PNG timeline of many short sessions, drawn in batches and one session after another."""
+    try:
+        from mcserverstats import timeline
+    except ImportError:
+        return None  # needs cairo
+    rand = random.Random(0)
+    t_start = 1420070400
+    t_end = t_start + days * 24 * 3600
+    names = ['%s_%i' % ('Herobrine' * rand.randrange(1, 4), i) for i in range(num_players)]
+    lines = [[] for name in names]
+    for i in range(num_sessions):
+        player = i % num_players
+        t_from = rand.randrange(t_start, t_end - 7200)
+        lines[player].append(['%08x-1234-1234-1234-1234567890ab' % player, t_from,
+                              t_from + rand.randrange(60, 7200), names[player]])
+    for line in lines:
+        line.sort(key=lambda session: session[1])
+    for name in names:  # do not download skins
+        timeline.skin_cache[name] = timeline.cairo.ImageSurface(timeline.cairo.FORMAT_ARGB32, 64, 32)
+    timeline_data = t_start, t_end, lines, [(t_start, t_end)]
+    with tempfile.TemporaryDirectory() as out_dir:
+        img_path = os.path.join(out_dir, 'timeline.png')
+        return {
+            'sessions': num_sessions,
+            'batched_s': timed(timeline.draw_timeline, timeline_data, img_path, 'bench',
+                               settings=dict(timeline.default_settings)),
+            'unbatched_s': timed(timeline.draw_timeline, timeline_data, img_path, 'bench',
+                                 settings=dict(timeline.default_settings, batch_drawing=False)),
+        }
+
+@scaled_benchmark
+def bench_render(scale, days=7):
+    """Drawing the PNG, HTML and tiled timelines of the last days."""
+    try:
+        from mcserverstats import timeline
+    except ImportError:
+        return None  # needs cairo
+    with generated_logs(scale) as logs_dir, tempfile.TemporaryDirectory() as out_dir:
+        logs = logalyzer.LogDirectory(logs_dir)
+        to_date = timeutils.add_to_date_str(timeutils.latest_log_date_str(logs_dir), days=1)
+        from_date = timeutils.add_to_date_str(to_date, days=-days)
+        timeline_data = timeline.get_timeline_data(logs, from_date, to_date)
+        for sessions in timeline_data[2]:  # do not download skins
+            timeline.skin_cache[sessions[0][3]] = timeline.cairo.ImageSurface(timeline.cairo.FORMAT_ARGB32, 64, 32)
+        return {
+            'sessions': sum(len(sessions) for sessions in timeline_data[2]),
+            'png_s': timed(timeline.draw_timeline, timeline_data, os.path.join(out_dir, 'timeline.png'), 'bench'),
+            'html_s': timed(timeline.write_timeline_html_page, timeline_data,
+                            os.path.join(out_dir, 'timeline.html'), 'bench'),
+            'tiles_s': timed(timeline.write_timeline_tiles, timeline_data, os.path.join(out_dir, 'tiles'), 'bench'),
+        }
+
+def main(args):
+    as_json = '--json' in args
+    scales = ['small']
+    for arg in args:
+        if arg.startswith('--scale='):
+            scales = arg[len('--scale='):].split(',')
+    names = [arg for arg in args if not arg.startswith('--')]
+    for fun in benchmarks:
+        name = fun.__name__[len('bench_'):]
+        if names and name not in names:
+            continue
+        for scale in scales if getattr(fun, 'scaled', False) else [None]:
+            result = fun(scale) if scale else fun()
+            label = '%s%s:' % (name, '[%s]' % scale if scale else '')
+            if as_json:
+                print(json.dumps({'benchmark': name, 'scale': scale, 'result': result}, sort_keys=True))
+            elif result is None:
+                print('%-20s skipped' % label)
+            else:
+                print('%-20s %s' % (label, '  '.join(
+                    '%s=%.4g' % (key, value) for key, value in sorted(result.items()))))
+
+if __name__ == '__main__':
+    logalyzer.logger.setLevel('ERROR')  # generated logs have double joins
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+"""
+asyncio wrapper around `LogDirectory`, for serving stats from an event loop.
+
+Reading logs decompresses and parses files, so every call runs in an
+executor thread. A `LogDirectory` is not thread safe, so calls are run one
+at a time; to still convert the logs in parallel, pass a `LogDirectory`
+with `workers` set. Identical calls made while one is still running wait
+for that one instead of starting again, so many page loads at once only
+convert the logs once. They all get the same result object, which must
+not be modified.
+"""
+import asyncio
+import threading
+from mcserverstats import logalyzer, stats
+
+class AsyncLogDirectory:
+    """
+    Awaitable versions of the queries of `LogDirectory`.
+
+    :param logs: a `LogDirectory`, or the path of one
+    :param executor: `concurrent.futures.Executor` to run the queries in,
+                     the default executor of the event loop if None
+    """
+
+    def __init__(self, logs, executor=None):
+        self.logs = logs if isinstance(logs, logalyzer.LogDirectory) else logalyzer.LogDirectory(logs)
+        self.executor = executor
+        self.lock = threading.Lock()  # one call into the LogDirectory at a time
+        self.pending = {}  # (function, args) -> future of the running call
+
+    def call_locked(self, fun, *args):
+        with self.lock:
+            return fun(*args)
+
+    def run(self, fun, *args):
+        """Runs `fun(*args)` in the executor, holding the lock. Returns a future."""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, self.call_locked, fun, *args)
+
+    async def query(self, fun, *args):
+        """
+        Awaits `fun(*args)` run in the executor,
+        or the identical call that is already running.
+        """
+        key = (fun,) + args
+        future = self.pending.get(key)
+        if future is None:
+            future = self.pending[key] = self.run(fun, *args)
+            future.add_done_callback(lambda done: self.pending.pop(key, None))
+        else:
+            stats.count('async requests joined')
+        # a cancelled waiter must not cancel the call the others are waiting for
+        return await asyncio.shield(future)
+
+    async def collect_data(self, from_date=None, to_date=None, inclusive_to=False):
+        return await self.query(self.logs.collect_data, from_date, to_date, inclusive_to)
+
+    async def collect_user_sessions(self, from_date=None, to_date=None, inclusive_to=False, whitelist=None):
+        whitelist = frozenset(whitelist) if whitelist else None  # hashable for joining calls
+        return await self.query(self.logs.collect_user_sessions, from_date, to_date, inclusive_to, whitelist)
+
+    async def collect_totals(self, from_date=None, to_date=None, inclusive_to=False):
+        return await self.query(self.logs.collect_totals, from_date, to_date, inclusive_to)
+
+    async def collect_uptimes(self, from_date=None, to_date=None, inclusive_to=False):
+        return await self.query(self.list_uptimes, from_date, to_date, inclusive_to)
+
+    def list_uptimes(self, *args):
+        return list(self.logs.collect_uptimes(*args))
+
+    async def latest_log_date_str(self):
+        return await self.query(self.logs.latest_log_date_str)
+
+    async def read_interval_iter(self, from_log=None, to_log=None, inclusive_to=False, force_convert=False):
+        """
+        Async iterator over the `LogFile`s of `LogDirectory.read_interval_iter`,
+        each one read in the executor.
+        """
+        done = object()
+        log_files = await self.run(self.logs.read_interval_iter, from_log, to_log, inclusive_to, force_convert)
+        while True:
+            log_file = await self.run(next, log_files, done)
+            if log_file is done:
+                return
+            yield log_file
@@ -0,0 +1,152 @@
+"""
+Renders many timelines from logs read once, see `timelineBatch`.
+
+The sessions and uptimes of the whole range are collected once into a
+`SessionSnapshot`, which answers the queries `timeline.get_timeline_data`
+makes, so each timeline is cut out of it instead of reading the logs again.
+The skins of all players in it are fetched once as well. Both are handed
+to every worker process when it starts, then the timelines are drawn in
+parallel, one job per output file.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import os
+from mcserverstats import intervals, stats, timeutils
+
+TimelineJob = namedtuple('TimelineJob', 'out_path from_date to_date title whitelist')
+
+class SessionSnapshot:
+    """
+    The sessions and uptimes of a `LogDirectory` or `ServerNetwork` in one range,
+    with the same queries as those, for any range within it.
+
+    :param user_sessions: `uuid -> [sessions]`, see `LogDirectory.collect_user_sessions`
+    :param uptimes: list of `(t_from, t_to)`, see `LogDirectory.collect_uptimes`
+    :param latest_date_str: see `LogDirectory.latest_log_date_str`, the end of open ranges
+    """
+
+    def __init__(self, user_sessions, uptimes, latest_date_str):
+        self.index = intervals.SessionIntervalIndex(
+            [session for sessions in user_sessions.values() for session in sessions])
+        self.uptimes = uptimes
+        self.latest_date_str = latest_date_str
+
+    @classmethod
+    @stats.timed('batch snapshot')
+    def from_logs(cls, logs, from_date=None, to_date=None):
+        """Reads the sessions and uptimes from `from_date` to `to_date` out of `logs`."""
+        return cls(logs.collect_user_sessions(from_date, to_date),
+                   list(logs.collect_uptimes(from_date, to_date)),
+                   logs.latest_log_date_str())
+
+    def latest_log_date_str(self):
+        return self.latest_date_str
+
+    def range_epochs(self, from_date, to_date):
+        return (timeutils.date_str_to_epoch(from_date) or float('-inf'),
+                timeutils.date_str_to_epoch(to_date or self.latest_date_str))
+
+    def collect_user_sessions(self, from_date=None, to_date=None, inclusive_to=False, whitelist=None):
+        """Same as `LogDirectory.collect_user_sessions`."""
+        t_start, t_end = self.range_epochs(from_date, to_date)
+        user_sessions = {}
+        for uuid, t_from, t_to, name in self.index.overlapping(t_start, t_end):
+            if whitelist and uuid not in whitelist:
+                continue
+            t_from, t_to = max(t_from, t_start), min(t_to, t_end)
+            if t_from < t_to:
+                user_sessions.setdefault(uuid, []).append([uuid, t_from, t_to, name])
+        return user_sessions
+
+    def collect_uptimes(self, from_date=None, to_date=None, inclusive_to=False):
+        """Yields the uptimes overlapping the range, cropped to it."""
+        t_start, t_end = self.range_epochs(from_date, to_date)
+        for t_from, t_to in self.uptimes:
+            t_from, t_to = max(t_from, t_start), min(t_to, t_end)
+            if t_from < t_to:
+                yield t_from, t_to
+
+    def players(self, from_date=None, to_date=None):
+        """Returns `uuid -> name` of the players online in the range, with the name of their last session."""
+        return dict((uuid, max(sessions, key=lambda session: session[1])[3])
+                    for uuid, sessions in self.collect_user_sessions(from_date, to_date).items())
+
+    def names(self):
+        """Returns all names used in any session, to fetch their skins."""
+        return sorted(set(session[3] for session in self.index.overlapping(float('-inf'), float('inf'))))
+
+def range_title(from_date, to_date):
+    return '%s to %s' % (timeutils.human_date_str(from_date),
+                         timeutils.human_date_str(to_date) or 'last activity')
+
+def iter_days(from_day, to_day, step_days=1):
+    """Yields the full dates from `from_day` up to, excluding, `to_day`, `step_days` apart."""
+    date_str = timeutils.ensure_full_date(from_day)
+    end = timeutils.ensure_full_date(to_day)
+    while date_str < end:
+        yield date_str
+        date_str = timeutils.add_to_date_str(date_str, days=step_days)
+
+def day_jobs(from_day, to_day, out_dir, ext='png'):
+    """One timeline per day, as `<out_dir>/<YYYY-MM-DD>.<ext>`."""
+    return [TimelineJob(os.path.join(out_dir, '%s.%s' % (timeutils.ensure_day_only(date_str), ext)),
+                        date_str, timeutils.add_to_date_str(date_str, days=1),
+                        timeutils.human_date_str(date_str), None)
+            for date_str in iter_days(from_day, to_day)]
+
+def week_jobs(from_day, to_day, out_dir, ext='png'):
+    """One timeline per week, Monday to Monday, as `<out_dir>/<YYYY>-W<ww>.<ext>`."""
+    weekday = datetime.date(*map(int, timeutils.ensure_day_only(from_day).split('-'))).weekday()
+    jobs = []
+    for date_str in iter_days(timeutils.add_to_date_str(from_day, days=-weekday), to_day, 7):
+        year, week, day = datetime.date(*map(int, timeutils.ensure_day_only(date_str).split('-'))).isocalendar()
+        next_week = timeutils.add_to_date_str(date_str, days=7)
+        jobs.append(TimelineJob(os.path.join(out_dir, '%i-W%02i.%s' % (year, week, ext)),
+                                date_str, next_week, range_title(date_str, next_week), None))
+    return jobs
+
+def player_jobs(snapshot, from_date, to_date, out_dir, ext='png'):
+    """One timeline per player over the whole range, as `<out_dir>/<name>.<ext>`."""
+    title = range_title(from_date, to_date)
+    return [TimelineJob(os.path.join(out_dir, '%s.%s' % (name, ext)), from_date, to_date,
+                        '%s, %s' % (name, title), frozenset((uuid,)))
+            for uuid, name in sorted(snapshot.players(from_date, to_date).items(),
+                                     key=lambda player: player[1].lower())]
+
+# state of a worker process, set by init_worker
+worker_snapshot = None
+
+def init_worker(snapshot, skin_bytes):
+    """Takes over the snapshot and the fetched skins, so rendering needs no logs or downloads."""
+    global worker_snapshot
+    from mcserverstats import timeline  # needs cairo
+    worker_snapshot = snapshot
+    for name, png_bytes in skin_bytes.items():
+        timeline.skin_cache[name] = timeline.skin_surface(png_bytes, name)
+
+def render_job(job):
+    from mcserverstats import timeline  # needs cairo
+    timeline_data = timeline.get_timeline_data(worker_snapshot, job.from_date, job.to_date, job.whitelist)
+    out_dir = os.path.dirname(job.out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    timeline.write_timeline(timeline_data, job.out_path, job.title)
+    return job.out_path
+
+@stats.timed('batch render')
+def render_jobs(snapshot, jobs, workers=0):
+    """
+    Renders all `jobs` from `snapshot`. Returns the paths written.
+
+    :param workers: number of worker processes, 0 for one per CPU,
+                    None to render in this process
+    """
+    from mcserverstats import timeline  # needs cairo
+    skin_bytes = timeline.skin_store.prefetch(snapshot.names())
+    if workers is None or len(jobs) < 2:
+        init_worker(snapshot, skin_bytes)
+        return [render_job(job) for job in jobs]
+    with ProcessPoolExecutor(min(workers or os.cpu_count() or 1, len(jobs)),
+                             initializer=init_worker, initargs=(snapshot, skin_bytes)) as executor:
+        return list(executor.map(render_job, jobs))
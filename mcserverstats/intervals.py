@@ -0,0 +1,46 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from mcserverstats.sessiontable import SessionTable
+
+class SessionIntervalIndex:
+    """
+    Finds the sessions `[uuid, t_from, t_to, name]` overlapping a time range
+    without looking at every session.
+
+    Sessions are sorted by their start, along with the running maximum of
+    their ends. All sessions before the first running maximum after the
+    range start end too early, all sessions starting after the range end
+    start too late, so only the ones in between have to be checked.
+
+    Given a `SessionTable`, the sorted sessions are kept in one as well,
+    and starts and ends in arrays, so the index stays small.
+    """
+
+    def __init__(self, sessions):
+        if isinstance(sessions, SessionTable):
+            order = sorted(range(len(sessions)), key=sessions.t_from.__getitem__)
+            self.sessions = sessions.select(order)
+            self.positions = array('q', order)
+            self.starts = array('d', map(float, self.sessions.t_from))
+            self.max_ends = array('d', accumulate((t_to for uuid, t_from, t_to, name in self.sessions), max))
+            return
+        order = sorted(range(len(sessions)), key=lambda i: sessions[i][1])
+        self.sessions = [sessions[i] for i in order]
+        self.positions = order  # to return sessions in their original order
+        self.starts = [session[1] for session in self.sessions]
+        self.max_ends = list(accumulate((session[2] for session in self.sessions), max))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def overlapping(self, t_from, t_to):
+        """
+        Returns the sessions starting before `t_to` and ending after `t_from`,
+        in the order they were given.
+        """
+        first = bisect_right(self.max_ends, t_from)
+        end = bisect_left(self.starts, t_to)
+        found = [i for i in range(first, end) if self.sessions[i][2] > t_from]
+        found.sort(key=self.positions.__getitem__)
+        return [self.sessions[i] for i in found]
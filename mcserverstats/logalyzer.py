@@ -1,17 +1,46 @@
-import glob
+from bisect import bisect_left, bisect_right
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import copy
 import gzip
 import errno
-from mcserverstats import timeutils
+import hashlib
+import io
+from mcserverstats import intervals, logcache, logindex, rollups, sessiontable, stats, timeutils
 import logging
 import os
 import re
+import time
 import yaml
 
 logging.basicConfig(format='[%(levelname)s %(lineno)s] %(message)s', datefmt='%H:%M:%S')
 logger = logging.getLogger('logalyzer')
 logger.setLevel(logging.INFO)
 
+CHUNK_SIZE = 1 << 20  # bytes read from a log at once
+
+# recorded in every cache and checkpoint, increase it when a change to the
+# parsing changes what is read from the logs, so they are converted again
+PARSER_VERSION = 1
+
+# start of a line with a timestamp that is not command block output,
+# in a block of lines that is prefixed with a `\n`
+RE_TIME_LINE = re.compile(rb'\n\[([\d:]{8})\] (?!.{21} \[@)')
+RE_COMMAND_BLOCK_LINE = re.compile(rb'\n.{32} \[@')
+RE_CLOCK_TIMES = re.compile(rb'(?:\d\d:\d\d:\d\d)*')
+
 log_actions = []
+
+# what follows the player name in vanilla death messages, see `LogFile.found_death`
+DEATH_PHRASES = (
+    'was (?:shot|pummeled|pricked|blown up|killed|squashed|squished|burnt|struck|frozen|slain|fireballed'
+    '|stung|obliterated|skewered|impaled|squeezed|poked|doomed|roasted|speared|sniped|stomped)',
+    'walked into', 'drowned', 'experienced kinetic energy', 'blew up', 'hit the ground too hard', 'fell',
+    'went up in flames', 'went off with a bang', 'burned to death', 'tried to swim in lava',
+    'discovered the floor was lava', 'froze to death', 'starved to death', 'suffocated in a wall',
+    'left the confines of this world', "didn't want to live", 'withered away', 'died',
+)
 def log_action(regex_str):
     def inner(fun):
         regex_comp = re.compile(regex_str)
@@ -19,99 +48,493 @@ def log_action(regex_str):
         return fun
     return inner
 
+RE_META = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+def literal_prefix(regex_str):
+    """
+    Returns the literal text every match of `regex_str` has to start with,
+    e.g. `[Server thread/INFO]: ` for `^\[Server thread/INFO\]: (.*)$`.
+    Stops at the first character with a special meaning.
+    Returns an empty string if the regex has a top level alternation.
+    """
+    depth = 0
+    escaped = False
+    for char in regex_str:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return ''
+    prefix = []
+    i = 1 if regex_str.startswith('^') else 0
+    while i < len(regex_str):
+        char = regex_str[i]
+        if char == '\\' and i + 1 < len(regex_str) and RE_META.match(regex_str[i + 1]):
+            char = regex_str[i + 1]
+            i += 1
+        elif RE_META.match(char):
+            break
+        elif char == '\\':
+            break  # character class like \d
+        prefix.append(char)
+        i += 1
+    if prefix and i < len(regex_str) and regex_str[i] in '*?{':
+        prefix.pop()  # last character is optional or repeated
+    return ''.join(prefix)
+
+class ActionDispatcher:
+    """
+    Matches a line against all `log_action`s at once.
+
+    All action regexes are joined into one alternation, each alternative
+    wrapped in its own group so the matching action can be looked up by
+    `match.lastindex`. Alternatives are tried in registration order,
+    just like looping over `log_actions` and stopping at the first match.
+    Lines not starting with any of the actions' literal prefixes
+    are rejected without running the regex at all.
+    Action regexes must not use named groups or numbered backreferences.
+    """
+
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.groups = {}  # wrapper group index -> (action, first group, last group)
+        alternatives = []
+        group_index = 1
+        for regex, action in self.actions:
+            alternatives.append('(%s)' % regex.pattern)
+            self.groups[group_index] = (action, group_index + 1, group_index + 1 + regex.groups)
+            group_index += 1 + regex.groups
+        self.regex = re.compile('|'.join(alternatives)) if alternatives else None
+        prefixes = tuple(set(literal_prefix(regex.pattern) for regex, action in self.actions))
+        # an empty prefix would let every line through anyway
+        self.prefixes = prefixes if all(prefixes) else None
+        self.block_regex = self.compile_block_regex()
+
+    def compile_block_regex(self):
+        """
+        Returns a bytes regex finding the lines in a block of undecoded lines
+        that could match an action: lines with a timestamp, that are not
+        command block output, followed by one of the literal prefixes.
+        Matches extend to the end of the line.
+        Every line has to be preceded by a `\\n`, see `LogScanner.feed_block`.
+        """
+        if self.prefixes is None:
+            return re.compile(RE_TIME_LINE.pattern + b'.*')
+        encoded = []
+        for prefix in self.prefixes:
+            try:
+                encoded.append(re.escape(prefix.encode('latin_1')))
+            except UnicodeEncodeError:
+                pass  # can never match a line decoded as latin_1
+        return re.compile(RE_TIME_LINE.pattern + b'(?:' + b'|'.join(encoded or [b'(?!)']) + b').*')
+
+    def match(self, line):
+        """
+        Returns `(action, args)` for the first action matching `line`,
+        or `None` if no action matches.
+        """
+        if self.regex is None:
+            return None
+        if self.prefixes is not None and not line.startswith(self.prefixes):
+            return None
+        match = self.regex.match(line)
+        if not match:
+            return None
+        action, first, end = self.groups[match.lastindex]
+        return action, match.groups()[first - 1:end - 1]
+
+_dispatcher = None
+
+def action_dispatcher():
+    """
+    Returns an `ActionDispatcher` for all currently registered `log_action`s,
+    rebuilding it when actions were added since the last call.
+    """
+    global _dispatcher
+    if _dispatcher is None or len(_dispatcher.actions) != len(log_actions):
+        _dispatcher = ActionDispatcher(log_actions)
+    return _dispatcher
+
 class LogFile:
     RE_TIME = re.compile('^\[([\d:]{8})\] ')
     RE_START = re.compile('^\[([\d:]{8})\] \[Server thread/INFO\]: Starting minecraft server version ')
 
-    def __init__(self, logs_dir, log_name, prev_log=None):
+    # a LogFile is kept for every log of a directory, so no per-instance __dict__
+    __slots__ = ('log_name', '_prev_log', 'prev_log_loader', 'log_path', 'day_str', 'name_tuple',
+                 'checkpoint_meta', 'uuids',
+                 'been_read', 'converted', 'index', 'pending_scan', 'strings',
+                 'started', 'stopped', 'first_event', 'last_event', 'online', 'times',
+                 'deaths', 'advancements', 'chat')
+    yaml_attributes = ('started', 'stopped', 'first_event', 'last_event', 'online', 'times',
+                       'deaths', 'advancements', 'chat')
+
+    def __init__(self, logs_dir, log_name, prev_log=None, prev_log_loader=None, strings=None):
+        """
+        :param prev_log: the LogFile written before this one, if any
+        :param prev_log_loader: called to get `prev_log` when it is first used,
+                                instead of passing it in right away
+        :param strings: `StringTable` for the UUIDs and names of `times`,
+                        shared by the logs of a directory
+        """
         self.log_name = log_name
-        self.prev_log = prev_log
+        self._prev_log = prev_log
+        self.prev_log_loader = prev_log_loader
         self.log_path = os.path.join(logs_dir, log_name + '.log')
         if self.log_name == 'latest':
             # for timestamps in log lines
             self.day_str = timeutils.ensure_day_only(timeutils.latest_log_date_str(logs_dir))
+            self.name_tuple = None
         else:
             self.day_str = self.log_name.rsplit('-', 1)[0]
+            self.name_tuple = LogDirectory.split_for_compare(self.log_name)
+        self.checkpoint_meta = None  # where the converted data came from, see `stale_reason`
         self.uuids = {}  # name -> last associated UUID
         self.been_read = False
+        self.converted = False  # whether the log was converted, instead of read from its cache
+        self.index = None  # LogIndex to read from instead of the cache file
+        self.pending_scan = None  # result of scan_log, if it was run in advance
+        self.strings = strings if strings is not None else sessiontable.StringTable()
 
-        self.yaml_attributes = 'started', 'stopped', 'first_event', 'last_event', 'online', 'times'
         self.started = None
         self.stopped = None
         self.first_event = None
         self.last_event = None
         self.online = {}
-        self.times = []
+        self.times = sessiontable.SessionTable(strings=self.strings)
+        self.deaths = []  # [uuid, seconds, message, name]
+        self.advancements = []  # [uuid, seconds, advancement, name]
+        self.chat = {}  # name -> [uuid, last message seconds, number of messages]
+
+    @property
+    def cache_path(self):
+        return self.log_path + '.bin'
+
+    @property
+    def checkpoint_path(self):
+        return self.log_path + '.checkpoint'
+
+    @property
+    def source_path(self):
+        return self.log_path if self.log_name == 'latest' else self.log_path + '.gz'
+
+    @property
+    def prev_log(self):
+        if self.prev_log_loader is not None:
+            self._prev_log = self.prev_log_loader()
+            self.prev_log_loader = None
+        return self._prev_log
+
+    @prev_log.setter
+    def prev_log(self, prev_log):
+        self._prev_log = prev_log
+        self.prev_log_loader = None
 
     def read_log(self, force_convert=False):
         if self.been_read:
             logger.debug('Already read %s', self.log_name)
             return
+        if force_convert or not (self.load_index() or self.load_cache()):
+            # no converted file exists, create it
+            self.convert_log(force_convert)
+        self.been_read = True
+        for attr in self.yaml_attributes:
+            logger.debug('%s.%s = %s', self.log_name, attr, getattr(self, attr))
+        logger.debug('Done reading %s ------------------------------', self.log_name)
+
+    def load_index(self):
+        return self.index is not None and self.index.load_logs([self]) > 0
+
+    def load_cache(self):
+        """
+        Reads the converted log from its binary cache. If there is none,
+        a YAML file from older versions is read and migrated instead.
+        Returns whether a converted log was found.
+        """
+        try:
+            with stats.timer('cache load'):
+                data, meta = logcache.read_cache(self.cache_path)
+        except (OSError, IOError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except logcache.CacheFormatError as e:
+            logger.warn('Ignoring cache of %s: %s', self.log_name, e)
+        else:
+            source = self.source_meta(meta.get('source'))
+            reason = self.stale_reason(meta, source)
+            if reason is not None:
+                logger.info('Converting %s again, %s', self.log_name, reason)
+                stats.count('stale caches')
+                return False
+            self.set_data(data)
+            stats.count('cache hits')
+            if source != meta['source']:
+                # only touched or copied, remember the new mtime to not hash it again
+                self.checkpoint_meta = meta
+                self.write_cache(source)
+            return True
         try:
-            if force_convert:
-                raise Exception  # force re-conversion
             yaml_file = open(self.log_path + '.yaml', 'r')
         except (OSError, IOError) as e:
             if e.errno != errno.ENOENT:
                 raise
-            # no converted file exists, create it
-            self.convert_log(force_convert)
-        else:  # converted file exists, read it
-            with yaml_file:
-                data = yaml.load(yaml_file)
-                for attr in self.yaml_attributes:
-                    setattr(self, attr, data[attr])
-        self.been_read = True
+            stats.count('cache misses')
+            return False
+        with yaml_file, stats.timer('yaml load'):
+            data = yaml.safe_load(yaml_file)
+        if any(attr not in data for attr in self.yaml_attributes):
+            logger.info('%s was converted before deaths and chat were read, converting it again', self.log_name)
+            stats.count('cache misses')
+            return False
+        self.set_data(data)
+        stats.count('yaml migrations')
+        logger.info('Migrating %s to binary cache', self.log_name)
+        # YAML files do not say where their data came from, trust them like before
+        self.checkpoint_meta = {'prev_log': self.prev_log.log_name if self.prev_log else None}
+        self.write_cache()
+        return True
+
+    def source_meta(self, known=None):
+        """
+        Returns the size, mtime and SHA-1 of the log, recorded in its cache
+        to notice when it was replaced. The log is only hashed if its size and mtime
+        differ from those in `known`, the `source_meta` of an earlier call.
+        """
+        stat = os.stat(self.source_path)
+        source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            source['sha1'] = known['sha1']
+            return source
+        sha1 = hashlib.sha1()
+        with open(self.source_path, 'rb') as log_file:
+            for chunk in iter(lambda: log_file.read(CHUNK_SIZE), b''):
+                sha1.update(chunk)
+        source['sha1'] = sha1.hexdigest()
+        return source
+
+    def stale_reason(self, meta, source=None):
+        """
+        Returns why the cache with `meta` is out of date, or None if it can be used:
+        when it was written by another `PARSER_VERSION`, when the log or the log
+        before it were replaced, or when the log before it was read already
+        and ended with other players online than this log started with.
+        Logs only get converted again in order, so the last check stops
+        a changed log from being carried further than the players online changed.
+
+        :param source: the current `source_meta`, if it was just looked up
+        """
+        if meta.get('parser_version') != PARSER_VERSION:
+            return 'it was converted by another parser version'
+        prev_log = self.prev_log
+        if meta.get('prev_log') != (prev_log.log_name if prev_log else None):
+            return 'the log before it changed'
+        if prev_log and prev_log.been_read and 'prev_online' in meta \
+                and meta['prev_online'] != prev_log.online:
+            return '%s ended with other players online' % prev_log.log_name
+        if source is None:
+            source = self.source_meta(meta.get('source'))
+        if not meta.get('source') or meta['source']['sha1'] != source['sha1']:
+            return 'it was replaced'
+        return None
+
+    def get_data(self):
+        return dict((attr, getattr(self, attr)) for attr in self.yaml_attributes)
+
+    def set_data(self, data):
         for attr in self.yaml_attributes:
-            logger.debug('%s.%s = %s' % (self.log_name, attr, getattr(self, attr)))
-        logger.debug('Done reading %s ------------------------------', self.log_name)
+            setattr(self, attr, data[attr])
+        self.times = sessiontable.SessionTable(self.times, self.strings)
 
     def convert_log(self, force_convert=False):
-        self.peek_start()
+        if self.log_name == 'latest' and not force_convert and self.pending_scan is None:
+            meta = self.restore_checkpoint()
+            if meta is not None:
+                self.apply_scan(scan_log(self.source_path, self.day_str, self.log_name,
+                                         meta['offset'], meta['line_no']))
+                return
+        if self.pending_scan is not None:
+            scan, self.pending_scan = self.pending_scan, None
+        else:
+            scan = scan_log(self.source_path, self.day_str, self.log_name)
+        self.begin_convert(scan, force_convert)
+        self.apply_scan(scan)
+
+    def begin_convert(self, scan, force_convert=False):
+        """
+        Takes over the online players from the previous log,
+        leaving them if the server was restarted.
+        """
+        self.started = scan['started']
+        self.checkpoint_meta = {'day_str': self.day_str, 'inode': scan['inode'], 'prev_log': None,
+                                'parser_version': PARSER_VERSION}
         if self.prev_log:
             self.prev_log.read_log(force_convert)
-            self.online = self.prev_log.online
+            self.checkpoint_meta.update(prev_log=self.prev_log.log_name,
+                                        prev_online=copy.deepcopy(self.prev_log.online))
+            # a copy, so the previous log keeps the players online at its end
+            self.online = copy.deepcopy(self.prev_log.online)
             if self.started:
-                # TODO crash, update previous yaml instead?
-                for name in list(self.online.keys())[:]:
-                    self.found_leave(-1, self.prev_log.last_event, name, 'Server Crash')
-                    logger.info('Server started, leaving %s at %s' % (name, self.log_name))
+                self.leave_all(self.prev_log.last_event, 'Server Crash')
         elif not self.started:
             raise ValueError('First log and no server start')
         if self.log_name == 'latest': logger.debug('Converting latest')
         else: logger.info('Converting %s', self.log_name)
+
+    def leave_all(self, seconds, reason):
+        """
+        Leaves all online players at `seconds`,
+        because of a server crash (at start) or stop (at the end of the log).
+        Returns their names.
+        """
+        names = list(self.online.keys())
+        for name in names:
+            self.found_leave(-1, seconds, name, reason)
+            if reason == 'Server Crash':
+                # TODO crash, update previous yaml instead?
+                logger.info('Server started, leaving %s at %s' % (name, self.log_name))
+            else:
+                logger.info('Server stopped, leaving %s at %s' % (name, self.log_name))
+        return names
+
+    def apply_scan(self, scan, finish=True):
+        """
+        Replays the actions found by `scan_log`, then leaves everyone
+        still online if the server was stopped, and writes the cache.
+        For `latest.log`, a checkpoint is written after the last complete line.
+        If `finish` is not set, stops at the last complete line
+        and returns the position there, see `scan_log`.
+        """
+        checkpoint = scan['checkpoint']
+        events = scan['events']
+        if stats.enabled:
+            stats.count('logs scanned')
+            stats.count('bytes decompressed' if self.source_path.endswith('.gz') else 'bytes read', scan['bytes'])
+            stats.count('lines scanned', scan['lines'])
+            for action_name, line_no, seconds, args in events:
+                stats.count('lines matched: ' + action_name)
+        self.update_events(checkpoint['first_event'], checkpoint['last_event'])
+        self.replay_events(events[:checkpoint['events']])
+        if not finish:
+            return checkpoint
         if self.log_name == 'latest':
-            log_file = open(self.log_path, 'rb')
-        else:
-            log_file = gzip.open(self.log_path + '.gz', 'rb')
-        with log_file:
-            line_no = 0
-            for line in log_file:
-                if b' [@' == line[32:35]:
-                    continue  # ignore command block activity
-                logger.debug('[Log %s@%i] %s', self.log_name, line_no, line)
-                line_no += 1
-                line = line.decode('latin_1')
-                time_match = self.RE_TIME.match(line)
-                if time_match:  # only look at lines with a timestamp
-                    seconds = timeutils.date_str_to_epoch(self.day_str, line[1:9])
-                    if self.first_event is None:
-                        self.first_event = seconds
-                    if self.last_event is None or self.last_event < seconds:
-                        self.last_event = seconds
-                    line_after_time = line[11:]  # strip off the `[12:34:56] `
-                    for regex, action in log_actions:
-                        match = regex.match(line_after_time)
-                        if match:
-                            args = match.groups()
-                            logger.debug('Action: %s (%2i %i) %s: %s' % (self.log_name, line_no, seconds, action.__name__, args))
-                            action(self, line_no, seconds, *args)
-                            break
+            self.write_checkpoint(checkpoint['offset'], checkpoint['line_no'])
+        self.update_events(scan['first_event'], scan['last_event'])
+        self.replay_events(events[checkpoint['events']:])
+        self.finish_convert()
+
+    def finish_convert(self):
         if self.stopped:
-            for name in list(self.online.keys())[:]:
-                self.found_leave(-1, self.last_event, name, 'Server Stop')
-                logger.info('Server stopped, leaving %s at %s' % (name, self.log_name))
-        self.write_yaml()
+            self.leave_all(self.last_event, 'Server Stop')
+        self.converted = True
+        self.write_cache()
+
+    def start_follow(self):
+        """
+        Reads `latest.log` up to its last complete line, like `convert_log`
+        but without finishing it, so it can be followed by a `LogFollower`.
+        Returns the position to continue at, see `scan_log`.
+        """
+        meta = self.restore_checkpoint()
+        if meta is None:
+            scan = scan_log(self.source_path, self.day_str, self.log_name)
+            self.begin_convert(scan)
+        else:
+            scan = scan_log(self.source_path, self.day_str, self.log_name, meta['offset'], meta['line_no'])
+        return self.apply_scan(scan, finish=False)
+
+    def update_events(self, first_event, last_event):
+        if self.first_event is None:
+            self.first_event = first_event
+        if self.last_event is None or (last_event is not None and self.last_event < last_event):
+            self.last_event = last_event
+
+    @stats.timed('replay')
+    def replay_events(self, events):
+        actions = dict((action.__name__, action) for regex, action in log_actions)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for action_name, line_no, seconds, args in events:
+            if debug:
+                logger.debug('Action: %s (%2i %i) %s: %s', self.log_name, line_no, seconds, action_name, args)
+            actions[action_name](self, line_no, seconds, *args)
+
+    @stats.timed('checkpoint write')
+    def write_checkpoint(self, offset, line_no):
+        """
+        Saves the state after parsing `latest.log` up to `offset`,
+        so the next run only has to parse what was appended since.
+        """
+        meta = dict(self.checkpoint_meta, offset=offset, line_no=line_no,
+                    uuids=self.uuids, tail_hash=self.tail_hash(offset))
+        logger.debug('Writing checkpoint for %s at %i', self.log_name, offset)
+        logcache.write_cache(self.checkpoint_path, self.get_data(), meta)
+
+    def tail_hash(self, offset):
+        """Hash of the bytes just before `offset`, to detect rewritten logs."""
+        with open(self.source_path, 'rb') as log_file:
+            log_file.seek(max(0, offset - 256))
+            return hashlib.sha1(log_file.read(min(offset, 256))).hexdigest()
+
+    def restore_checkpoint(self):
+        """
+        Restores the state from the checkpoint of `latest.log`,
+        so only the lines appended since have to be parsed.
+        Returns the checkpoint's metadata, or `None` if there is no usable checkpoint,
+        for example because the log was rotated or truncated.
+        """
+        try:
+            data, meta = logcache.read_cache(self.checkpoint_path)
+        except (OSError, IOError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        except logcache.CacheFormatError as e:
+            logger.warn('Ignoring checkpoint of %s: %s', self.log_name, e)
+            return None
+        stat = os.stat(self.source_path)
+        prev_name = self.prev_log.log_name if self.prev_log else None
+        if meta.get('parser_version') != PARSER_VERSION:
+            logger.info('%s was parsed by another parser version, parsing it again', self.log_name)
+            return None
+        if meta['inode'] != stat.st_ino or stat.st_size < meta['offset'] \
+                or meta['day_str'] != self.day_str or meta['prev_log'] != prev_name \
+                or meta['tail_hash'] != self.tail_hash(meta['offset']):
+            logger.info('%s was rotated or rewritten, parsing it again', self.log_name)
+            return None
+        if self.prev_log:
+            self.prev_log.read_log()
+            if meta['prev_online'] != self.prev_log.online:
+                logger.info('%s changed, parsing %s again', self.prev_log.log_name, self.log_name)
+                return None
+        self.set_data(dict(self.get_data(), **data))
+        self.uuids = meta['uuids']
+        self.checkpoint_meta = dict((key, meta[key]) for key in ('day_str', 'inode', 'prev_log', 'prev_online',
+                                                                 'parser_version')
+                                    if key in meta)
+        logger.debug('Resuming %s at %i', self.log_name, meta['offset'])
+        return meta
+
+    def needs_convert(self, force_convert=False):
+        """
+        Returns whether reading this log will convert it,
+        instead of loading the converted file.
+        """
+        if self.been_read:
+            return False
+        if force_convert or self.log_name == 'latest':
+            return True
+        try:
+            meta = logcache.read_meta(self.cache_path)
+        except (OSError, IOError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return not os.path.isfile(self.log_path + '.yaml')
+        except logcache.CacheFormatError:
+            return True
+        return self.stale_reason(meta) is not None
 
     @log_action('^\[User Authenticator #(\d+)/INFO\]: UUID of player ([^ ]+) is ([-\da-f]{36})$')
     def found_uuid(self, line_nr, seconds, auth_nr, name, uuid):
@@ -149,52 +572,436 @@ class LogFile:
             logger.error('Stopped two times at %s %i', self.log_name, line_nr)
         self.stopped = True
 
+    def player_uuid(self, name):
+        return self.online[name][0] if name in self.online else self.uuids.get(name, name)
+
+    @log_action('^\[Server thread/INFO\]: ([^ <\[]+) ((?:%s)(?: .*)?)$' % '|'.join(DEATH_PHRASES))
+    def found_death(self, line_nr, seconds, name, message):
+        if name not in self.online:
+            return  # a named mob, or a message that only looks like a death
+        self.deaths.append([self.online[name][0], seconds, message, name])
+
+    @log_action('^\[Server thread/INFO\]: ([^ <\[]+) has (?:made the advancement|completed the challenge'
+                '|reached the goal|just earned the achievement) \[(.+)\]$')
+    def found_advancement(self, line_nr, seconds, name, advancement):
+        self.advancements.append([self.player_uuid(name), seconds, advancement, name])
+
+    # only who wrote and when is kept, not the message
+    @log_action('^\[Server thread/INFO\]: (?:\[Not Secure\] )?<([^ >]+)> ')
+    @log_action('^\[Async Chat Thread - #\d+/INFO\]: (?:\[Not Secure\] )?<([^ >]+)> ')
+    def found_chat(self, line_nr, seconds, name):
+        if name in self.chat:
+            self.chat[name][1] = seconds
+            self.chat[name][2] += 1
+        else:
+            self.chat[name] = [self.player_uuid(name), seconds, 1]
+
+    @stats.timed('cache write')
+    def write_cache(self, source=None):
+        if self.log_name == 'latest':
+            logger.debug('Not writing cache for latest.log, aborting')
+            return
+        logger.debug('Writing %s', self.cache_path)
+        meta = {'parser_version': PARSER_VERSION, 'source': source or self.source_meta()}
+        for key in ('prev_log', 'prev_online'):
+            if key in self.checkpoint_meta:
+                meta[key] = self.checkpoint_meta[key]
+        logcache.write_cache(self.cache_path, self.get_data(), meta)
+
     def write_yaml(self):
+        """
+        Exports the converted log as YAML, as written by older versions.
+        """
         if self.log_name == 'latest':
             logger.debug('Not writing YAML for latest.log, aborting')
             return
         with open(self.log_path + '.yaml', 'w') as yaml_file:
             logger.debug('Writing %s', self.log_path + '.yaml')
-            data = {}
-            for attr in self.yaml_attributes:
-                data[attr] = getattr(self, attr)
-            yaml.dump(data, stream=yaml_file)
-
-    def peek_start(self):
-        if self.started is not None:
-            # already peeked
-            logger.warn('peek_start: Already peeked')
-            return self.started
-        if self.log_name == 'latest':
-            log_file = open(self.log_path, 'rb')
+            yaml.dump(dict(self.get_data(), times=self.times.to_lists()), stream=yaml_file)
+
+
+class LogScanner:
+    """
+    Parses log lines one at a time, collecting what `scan_log` returns.
+    """
+
+    def __init__(self, day_str, log_name=None, offset=0, line_no=0):
+        self.log_name = log_name
+        self.day_str = day_str
+        self.clock = timeutils.DayClock(day_str)
+        self.dispatcher = action_dispatcher()
+        self.first_line = not offset
+        self.started = None
+        self.first_event = self.last_event = None
+        self.line_no = line_no
+        self.events = []
+        # when following a running server, timestamps going back mean a new day
+        self.roll_over_days = False
+
+    def feed(self, line):
+        """
+        Parses one line, as bytes including its line break.
+        """
+        if self.first_line:
+            self.first_line = False
+            self.started = bool(LogFile.RE_START.match(line.decode('latin_1')))
+            logger.debug('scan_log: Started in log: %s', self.started)
+        if b' [@' == line[32:35]:
+            return  # ignore command block activity
+        logger.debug('[Log %s@%i] %s', self.log_name, self.line_no, line)
+        self.line_no += 1
+        line = line.decode('latin_1')
+        time_match = LogFile.RE_TIME.match(line)
+        if time_match:  # only look at lines with a timestamp
+            seconds = self.clock.to_epoch(line[1:9])
+            if self.roll_over_days and self.last_event is not None \
+                    and seconds < self.last_event - 12 * 3600:
+                self.day_str = timeutils.ensure_day_only(timeutils.add_to_date_str(self.day_str, days=1))
+                self.clock = timeutils.DayClock(self.day_str)
+                seconds = self.clock.to_epoch(line[1:9])
+            if self.first_event is None:
+                self.first_event = seconds
+            if self.last_event is None or self.last_event < seconds:
+                self.last_event = seconds
+            line_after_time = line[11:]  # strip off the `[12:34:56] `
+            found = self.dispatcher.match(line_after_time)
+            if found:
+                action, args = found
+                self.events.append((action.__name__, self.line_no, seconds, args))
+
+    def feed_block(self, block):
+        """
+        Parses many lines at once, as bytes ending with a line break.
+        Gives the same results as feeding the lines one by one,
+        but only decodes the lines that could match an action.
+        """
+        if not block:
+            return
+        if self.first_line or self.roll_over_days:
+            end = block.index(b'\n') + 1
+            self.feed(block[:end])
+            if self.roll_over_days:  # has to look at the timestamps in order
+                for line in io.BytesIO(block[end:]):
+                    self.feed(line)
+                return
+            block = block[end:]
+        data = b'\n' + block  # so every line starts after a line break
+
+        time_strs = RE_TIME_LINE.findall(data)
+        if time_strs:
+            if self.first_event is None:
+                self.first_event = self.clock.to_epoch(time_strs[0].decode('latin_1'))
+            time_strs = set(time_strs)
+            if self.clock.uniform and RE_CLOCK_TIMES.fullmatch(b''.join(time_strs)):
+                time_strs = [max(time_strs)]  # sorts like the times on days without DST change
+            last_event = max(self.clock.to_epoch(time_str.decode('latin_1')) for time_str in time_strs)
+            if self.last_event is None or self.last_event < last_event:
+                self.last_event = last_event
+
+        line_breaks = 0  # in data before `counted`
+        counted = 0
+        # found in one pass, command block lines before an event are counted by bisecting
+        command_blocks = [match.start() for match in RE_COMMAND_BLOCK_LINE.finditer(data)]
+        # the block regex already checked the prefixes, see `ActionDispatcher.match`
+        regex, groups = self.dispatcher.regex, self.dispatcher.groups
+        to_epoch, append = self.clock.to_epoch, self.events.append
+        for match in self.dispatcher.block_regex.finditer(data):
+            # the block regex stops right before the line break
+            action_match = regex.match(data[match.start() + 12:match.end() + 1].decode('latin_1'))
+            if action_match:
+                start = match.start()
+                line_breaks += data.count(b'\n', counted, start + 1)
+                counted = start + 1
+                action, first, end = groups[action_match.lastindex]
+                append((action.__name__, self.line_no + line_breaks - bisect_left(command_blocks, start),
+                        to_epoch(match.group(1).decode('latin_1')), action_match.groups()[first - 1:end - 1]))
+        self.line_no += block.count(b'\n') - len(command_blocks)
+
+    def checkpoint(self, offset):
+        return {
+            'offset': offset,
+            'line_no': self.line_no,
+            'events': len(self.events),
+            'first_event': self.first_event,
+            'last_event': self.last_event,
+        }
+
+@stats.timed('scan')
+def scan_log(source_path, day_str, log_name=None, offset=0, line_no=0):
+    """
+    Reads a log file and collects everything that does not depend on
+    the previous logs, so it can be run in a separate process.
+    Starts reading at byte `offset` of an uncompressed log,
+    with `line_no` lines already read before it.
+    Returns a dict with the keys
+    `started`: whether the log starts with a server start, `None` if `offset` is set,
+    `first_event`, `last_event`: epoch of the first and latest timestamp,
+    `events`: all matched actions, as `(action_name, line_no, seconds, args)`,
+    `inode`: inode of an uncompressed log,
+    `checkpoint`: dict with `offset`, `line_no`, the number of `events`
+                  and `first_event`, `last_event` after the last complete line,
+    `bytes`, `lines`: how much was read, for `stats`.
+    """
+    if source_path.endswith('.gz'):
+        log_file = gzip.open(source_path, 'rb')
+        inode = None
+    else:
+        log_file = open(source_path, 'rb')
+        inode = os.fstat(log_file.fileno()).st_ino
+    scanner = LogScanner(day_str, log_name, offset, line_no)
+    num_bytes = num_lines = 0
+    with log_file:
+        if offset:
+            log_file.seek(offset)
+        rest = b''
+        while True:
+            data = log_file.read(CHUNK_SIZE)
+            if not data:
+                break
+            num_bytes += len(data)
+            rest += data
+            end = rest.rfind(b'\n') + 1
+            block, rest = rest[:end], rest[end:]
+            scanner.feed_block(block)
+            num_lines += block.count(b'\n')
+            offset += len(block)
+    checkpoint = scanner.checkpoint(offset)
+    if rest:  # last line is still being written
+        scanner.feed(rest)
+    if scanner.first_line:
+        scanner.started = False  # empty log
+        logger.error('scan_log: Empty log %s', log_name)
+    return {
+        'started': scanner.started,
+        'first_event': scanner.first_event,
+        'last_event': scanner.last_event,
+        'events': scanner.events,
+        'inode': inode,
+        'checkpoint': checkpoint,
+        'bytes': num_bytes,
+        'lines': num_lines + bool(rest),
+    }
+
+@stats.timed('parallel scan')
+def scan_logs_parallel(log_files, workers=None):
+    """
+    Runs `scan_log` for all `log_files` in a process pool
+    and stores the results for their next `convert_log`.
+    """
+    with ProcessPoolExecutor(workers) as pool:
+        scans = pool.map(scan_log,
+                         [log_file.source_path for log_file in log_files],
+                         [log_file.day_str for log_file in log_files],
+                         [log_file.log_name for log_file in log_files])
+        for log_file, scan in zip(log_files, scans):
+            log_file.pending_scan = scan
+
+
+LogEvent = namedtuple('LogEvent', 'kind log_name line_no seconds name uuid detail')
+
+class LogFollower:
+    """
+    Follows the `latest.log` of a running server, see `LogDirectory.follow`.
+    Iterating over it yields `LogEvent`s as lines are appended to the log.
+    """
+
+    def __init__(self, logs_dir, prev_log=None, poll_interval=1.0):
+        self.logs_dir = logs_dir
+        self.poll_interval = poll_interval
+        self.log_file = LogFile(logs_dir, 'latest', prev_log)
+        checkpoint = self.log_file.start_follow()
+        self.open(checkpoint['offset'], checkpoint['line_no'])
+
+    @property
+    def online(self):
+        """online players: `player_name -> [uuid, join_time, login_count]`"""
+        return self.log_file.online
+
+    def open(self, offset, line_no):
+        self.source = open(self.log_file.source_path, 'rb')
+        self.source.seek(offset)
+        self.inode = os.fstat(self.source.fileno()).st_ino
+        self.scanner = LogScanner(self.log_file.day_str, self.log_file.log_name, offset, line_no)
+        self.scanner.roll_over_days = True
+        self.scanner.last_event = self.log_file.last_event
+        self.buffer = b''
+
+    def close(self):
+        self.source.close()
+
+    def __iter__(self):
+        while True:
+            data = self.source.read(CHUNK_SIZE)
+            if data:
+                self.buffer += data
+                end = self.buffer.rfind(b'\n') + 1
+                lines, self.buffer = self.buffer[:end], self.buffer[end:]
+                for line in lines.splitlines(True):
+                    for event in self.feed(line):
+                        yield event
+            elif self.rotated():
+                for event in self.rotate():
+                    yield event
+            else:
+                time.sleep(self.poll_interval)
+
+    def rotated(self):
+        try:
+            stat = os.stat(self.log_file.source_path)
+        except (OSError, IOError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False  # wait for the new log
+        return stat.st_ino != self.inode or stat.st_size < self.source.tell()
+
+    def rotate(self):
+        """
+        Finishes the current log and continues with the new `latest.log`,
+        carrying over the online players like `convert_log` does.
+        """
+        if self.buffer:  # the old log is complete now
+            for event in self.feed(self.buffer):
+                yield event
+        self.close()
+        old_log = self.log_file
+        for event in self.leave_events(old_log.finish_convert, old_log.last_event, 'Server Stop'):
+            yield event
+        old_log.been_read = True
+        logger.info('Following new latest.log')
+        self.log_file = LogFile(self.logs_dir, 'latest', old_log)
+        self.log_file.online = old_log.online
+        self.open(0, 0)
+
+    def leave_events(self, fun, seconds, reason):
+        """
+        Runs `fun` and yields a leave event for each player it made leave.
+        """
+        online_before = dict(self.online)
+        fun()
+        for name, (uuid, t_from, num_logins) in online_before.items():
+            if name not in self.online:
+                yield LogEvent('leave', self.log_file.log_name, -1, seconds, name, uuid, reason)
+
+    def feed(self, line):
+        """
+        Parses one line and yields the resulting events.
+        """
+        log_file = self.log_file
+        scanner = self.scanner
+        first_line = scanner.first_line
+        num_events = len(scanner.events)
+        scanner.feed(line)
+        if first_line:
+            log_file.started = scanner.started
+            if scanner.started:
+                if log_file.prev_log:
+                    prev_log = log_file.prev_log
+                    for event in self.leave_events(lambda: log_file.leave_all(prev_log.last_event, 'Server Crash'),
+                                                   prev_log.last_event, 'Server Crash'):
+                        yield event
+                yield LogEvent('start', log_file.log_name, 1, scanner.first_event, None, None, None)
+        log_file.update_events(scanner.first_event, scanner.last_event)
+        for event in scanner.events[num_events:]:
+            action_name, line_no, seconds, args = event
+            kind = action_name[len('found_'):] if action_name.startswith('found_') else action_name
+            name = uuid = detail = None
+            if action_name == 'found_uuid':
+                name, uuid = args[1:]
+            elif action_name == 'found_leave':
+                name, detail = args
+                if name in log_file.online:
+                    uuid = log_file.online[name][0]
+            elif action_name in ('found_death', 'found_advancement', 'found_chat'):
+                name, detail = args[0], args[1] if len(args) > 1 else None
+                if action_name == 'found_death' and name not in log_file.online:
+                    continue  # not a player, nothing changed
+                uuid = log_file.player_uuid(name)
+            elif action_name != 'found_join':
+                detail = args
+            log_file.replay_events([event])
+            if action_name == 'found_join':
+                name = args[0]
+                uuid, t_from, detail = log_file.online[name]
+            elif action_name == 'found_leave' and uuid is None:
+                continue  # left without joining, nothing changed
+            yield LogEvent(kind, log_file.log_name, line_no, seconds, name, uuid, detail)
+
+
+class LogFileMap(Mapping):
+    """
+    Maps the log name tuples of a `LogDirectory` and `'latest'` to their LogFiles.
+    LogFiles are only created when they are first accessed,
+    so opening a directory with many logs stays cheap.
+    """
+
+    def __init__(self, logs):
+        self.logs = logs
+        self.created = {}  # log_name_tuple -> LogFile
+
+    def __getitem__(self, log_name_tuple):
+        log_file = self.created.get(log_name_tuple)
+        if log_file is not None:
+            return log_file
+        name_tuples = self.logs.sorted_log_name_tuples
+        if log_name_tuple == 'latest':
+            pos = len(name_tuples)
+            log_name = 'latest'
         else:
-            log_file = gzip.open(self.log_path + '.gz', 'rb')
-        with log_file:
-            for line in log_file:
-                line = line.decode('latin_1')
-                self.started = bool(self.RE_START.match(line))
-                if self.started:
-                    self.first_event = timeutils.date_str_to_epoch(self.day_str, line[1:9])
-                logger.debug('peek_start: In log: %s', self.started)
-                return self.started
-            self.started = False  # empty log or no start
-            logger.error('peek_start: Empty log')
-            return self.started
+            pos = bisect_left(name_tuples, log_name_tuple)
+            if pos == len(name_tuples) or name_tuples[pos] != log_name_tuple:
+                raise KeyError(log_name_tuple)
+            log_name = LogDirectory.join_from_compare(log_name_tuple)
+        prev_log_loader = None
+        if pos > 0:
+            prev_log_loader = lambda: self[name_tuples[pos - 1]]
+        log_file = LogFile(self.logs.logs_dir, log_name, prev_log_loader=prev_log_loader,
+                           strings=self.logs.strings)
+        log_file.index = self.logs.index
+        self.created[log_name_tuple] = log_file
+        return log_file
 
+    def __iter__(self):
+        yield from self.logs.sorted_log_name_tuples
+        yield 'latest'
+
+    def __len__(self):
+        return len(self.logs.sorted_log_name_tuples) + 1
 
 class LogDirectory:
-    def __init__(self, logs_dir):
+    def __init__(self, logs_dir, workers=None, index=False, max_session_indexes=16):
+        """
+        :param logs_dir: directory containing the `*.log.gz` files and `latest.log`
+        :param workers: if set, logs that need converting are parsed in parallel
+                        by this many processes (`0` means one per CPU)
+        :param index: if set, keep all converted logs in one `LogIndex` database
+                      in `logs_dir` and answer queries from it
+        :param max_session_indexes: number of `session_index`es to keep,
+                                    least recently used ones are dropped
+        """
         self.logs_dir = logs_dir
-        unsorted_log_names = map(lambda p: os.path.split(p)[1][:-7], glob.iglob(logs_dir + '/*.log.gz'))
+        self.workers = workers
+        self.index = None
+        self.max_session_indexes = max_session_indexes
+        self.session_indexes = OrderedDict()  # log day range -> SessionIntervalIndex
+        self.strings = sessiontable.StringTable()  # UUIDs and names of all sessions
+        self.rollups = None  # Rollups, opened by collect_totals
+        unsorted_log_names = [entry.name[:-7] for entry in os.scandir(logs_dir)
+                              if entry.name.endswith('.log.gz') and not entry.name.startswith('.')]
         self.sorted_log_name_tuples = sorted(map(self.split_for_compare, unsorted_log_names))
-        self.log_files = {}  # log_name_tuple -> LogFile
-        prev_log_file = None  # arg for LogFile constructor
-        for log_name_tuple in self.sorted_log_name_tuples:
-            log_name = self.join_from_compare(log_name_tuple)
-            log_file = LogFile(logs_dir, log_name, prev_log_file)
-            prev_log_file = log_file
-            self.log_files[log_name_tuple] = log_file
-        self.log_files['latest'] = LogFile(logs_dir, 'latest', prev_log_file)
+        self.sorted_log_days = [log[:3] for log in self.sorted_log_name_tuples]  # for bisecting
+        self.log_files = LogFileMap(self)  # log_name_tuple -> LogFile
+        if index:
+            self.open_index()
+
+    def open_index(self):
+        """
+        Opens the `LogIndex` of this directory and ingests all new or changed logs.
+        """
+        index = logindex.LogIndex(os.path.join(self.logs_dir, logindex.INDEX_NAME), PARSER_VERSION)
+        index.update(self)  # the logs being indexed are read from their caches
+        self.index = index
+        for log_file in self.log_files.created.values():
+            log_file.index = self.index
 
     def read_interval_iter(self, from_log=None, to_log=None, inclusive_to=False, force_convert=False):
         """
@@ -202,8 +1009,19 @@ class LogDirectory:
         These are also read and converted if necessary.
         """
         logger.debug('read_interval: from_log=%s to_log=%s', from_log, to_log)
+        name_tuples = list(self.iter_log_name_tuples_between(from_log, to_log, inclusive_to))
+        if self.index is not None and name_tuples:
+            log_files = [self.log_files[name_tuple] for name_tuple in name_tuples]
+            if log_files[0].prev_log:
+                log_files.insert(0, log_files[0].prev_log)
+            self.index.load_logs(log_files)
+        if self.workers is not None:
+            log_files = [self.log_files[name_tuple] for name_tuple in name_tuples]
+            if not to_log:
+                log_files.append(self.log_files['latest'])
+            self.prepare_convert(log_files, force_convert)
         prev_log = None
-        for name_tuple in self.iter_log_name_tuples_between(from_log, to_log, inclusive_to):
+        for name_tuple in name_tuples:
             log_file = self.log_files[name_tuple]
             log_file.read_log(force_convert)
             yield log_file
@@ -213,20 +1031,108 @@ class LogDirectory:
             log_file.read_log(force_convert)
             yield log_file
 
+    def follow(self, poll_interval=1.0):
+        """
+        Returns a `LogFollower` for the running server.
+        Iterating over it yields a `LogEvent` for each join, leave, uuid,
+        start and stop, as soon as it is written to `latest.log`,
+        polling every `poll_interval` seconds. Its `online` players are
+        kept up to date. When the log gets rotated, the follower
+        continues with the new `latest.log`.
+        """
+        return LogFollower(self.logs_dir, self.log_files['latest'].prev_log, poll_interval)
+
+    def forget_latest(self):
+        """
+        Drops everything read from `latest.log`, so the next query reads it again.
+        For long-lived LogDirectories, after `latest.log` has grown.
+        """
+        self.log_files.created.pop('latest', None)
+        self.session_indexes.clear()
+
+    def refresh_stale(self):
+        """
+        Reads all logs again and converts those whose cache is out of date,
+        see `LogFile.stale_reason`: logs that were replaced or converted by another
+        `PARSER_VERSION`, and the logs after them as long as the players online
+        at their start changed. Queries check the logs they read, but a log replaced
+        before their range is only noticed by a query reading it, or by this.
+        Returns the names of the converted logs.
+        """
+        index, self.index = self.index, None
+        self.log_files.created.clear()
+        self.session_indexes.clear()
+        converted = [log_file.log_name for log_file in self.read_interval_iter()
+                     if log_file.converted and log_file.log_name != 'latest']
+        if index is not None:
+            index.close()
+            self.open_index()  # ingests the converted logs
+        return converted
+
+    def latest_log_date_str(self):
+        """Date of the last change to `latest.log`, see `timeutils.latest_log_date_str`."""
+        return timeutils.latest_log_date_str(self.logs_dir)
+
+    @staticmethod
+    def enable_stats(on=True):
+        """
+        Starts recording where the time of reading and rendering logs goes,
+        see `get_stats`. Recording is shared by all LogDirectories.
+        """
+        stats.enable(on)
+
+    @staticmethod
+    def get_stats():
+        """
+        Returns the counters and timers recorded since `enable_stats`,
+        see `stats.snapshot`.
+        """
+        return stats.snapshot()
+
+    def prepare_convert(self, log_files, force_convert=False):
+        """
+        Parses all logs that reading `log_files` would convert in parallel,
+        including earlier logs they depend on.
+        Carrying the online players from log to log still happens in order,
+        when the logs are read.
+        """
+        to_scan = []
+        seen = set()
+        for log_file in log_files:
+            while log_file is not None and log_file.log_name not in seen \
+                    and log_file.needs_convert(force_convert):
+                seen.add(log_file.log_name)
+                resumable = log_file.log_name == 'latest' and not force_convert \
+                    and os.path.isfile(log_file.checkpoint_path)
+                if log_file.pending_scan is None and not resumable:
+                    to_scan.append(log_file)
+                log_file = log_file.prev_log
+        if len(to_scan) > 1:
+            scan_logs_parallel(to_scan, self.workers or None)
+
     def collect_data(self, from_date=None, to_date=None, inclusive_to=False):
         """
         Returns a tuple of `times` and `online`:
         `times`: a list of all sessions,
         `online`: a map of online players: `player_name -> [uuid, join_time, login_count]`
         """
+        times, online = self.collect_session_table(from_date, to_date, inclusive_to)
+        return times.to_lists(), online
+
+    def collect_session_table(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Same as `collect_data`, but returns `times` as a `SessionTable`,
+        which takes a fraction of the memory of a list of sessions.
+        """
         from_day, to_day, inclusive_to = self.date_to_log_day(from_date, to_date, inclusive_to)
-        times = []
+        times = sessiontable.SessionTable(strings=self.strings)
         last_log = None
         for log_file in self.read_interval_iter(from_day, to_day, inclusive_to):
             times.extend(log_file.times)
             last_log = log_file
         return times, (last_log.online if last_log else {})
 
+    @stats.timed('collect sessions')
     def collect_user_sessions(self, from_date=None, to_date=None, inclusive_to=False, whitelist=None):
         t_start = timeutils.date_str_to_epoch(from_date) or float('-inf')
         t_end = timeutils.date_str_to_epoch(to_date or timeutils.latest_log_date_str(self.logs_dir))
@@ -246,14 +1152,108 @@ class LogDirectory:
                 user_sessions[uuid] = []
             user_sessions[uuid].append([uuid, t_from, t_to, name])
 
-        times, online = self.collect_data(from_date, to_date, inclusive_to)
-        for uuid, t_from, t_to, name in times:
+        index = self.session_index(from_date, to_date, inclusive_to)
+        for uuid, t_from, t_to, name in index.overlapping(t_start, t_end):
             crop_and_add(uuid, t_from, t_to, name)
-        for name, sess_begin in online.items():
-            uuid, t_from = sess_begin[:2]
-            crop_and_add(uuid, t_from, t_end, name)
         return user_sessions
 
+    @stats.timed('collect totals')
+    def collect_totals(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns the online seconds of each player, as `uuid -> [seconds, name]`,
+        the same as summing up the sessions of `collect_user_sessions`.
+        `name` is the one of the player's last session.
+
+        Whole days are summed up from the `Rollups` of the logs,
+        only at partial days at the edges of the range sessions are looked at,
+        and only in the logs that have sessions overlapping them.
+        """
+        t_start = timeutils.date_str_to_epoch(from_date) or float('-inf')
+        t_end = timeutils.date_str_to_epoch(to_date or timeutils.latest_log_date_str(self.logs_dir))
+        from_day, to_day, inclusive_to = self.date_to_log_day(from_date, to_date, inclusive_to)
+        log_files = [self.log_files[name_tuple] for name_tuple
+                     in self.iter_log_name_tuples_between(from_day, to_day, inclusive_to)]
+        if self.workers is not None:
+            self.prepare_convert(log_files)
+        # same as in read_interval_iter
+        if not to_day or not log_files or self.read_last_event(log_files[-1]) < timeutils.date_str_to_epoch(to_day):
+            latest = self.log_files['latest']
+            latest.read_log()
+        else:
+            latest = None
+        if self.rollups is None:
+            self.rollups = rollups.Rollups(os.path.join(self.logs_dir, rollups.ROLLUPS_NAME))
+        log_rollups = [self.rollups.get(log_file) for log_file in log_files]
+        self.rollups.save()
+
+        totals = {}  # uuid -> [seconds, name, t_from]
+        # days between the edges
+        first_day = '' if t_start == float('-inf') else rollups.day_of(t_start)
+        if first_day and not rollups.is_midnight(t_start):
+            first_day = rollups.day_of(rollups.next_midnight(first_day))
+        end_day = rollups.day_of(t_end)
+        for rollup in log_rollups:
+            for day_str, day_totals in rollup['days'].items():
+                if first_day <= day_str < end_day:
+                    for uuid, (seconds, name, t_from) in day_totals.items():
+                        rollups.add_seconds(totals, uuid, seconds, name, t_from)
+
+        def add_cropped(uuid, t_from, t_to, name, window_start, window_end):
+            seconds = min(t_to, window_end) - max(t_from, window_start)
+            if seconds > 0:
+                rollups.add_seconds(totals, uuid, seconds, name, t_from)
+
+        # partial days at the edges
+        windows = []
+        if first_day and t_start < timeutils.date_str_to_epoch(first_day):
+            windows.append((t_start, min(t_end, timeutils.date_str_to_epoch(first_day))))
+        if not rollups.is_midnight(t_end) and (not windows or windows[0][1] < t_end):
+            windows.append((max(t_start, timeutils.date_str_to_epoch(end_day)), t_end))
+        for window_start, window_end in windows:
+            for log_file, rollup in zip(log_files, log_rollups):
+                if rollup['first_start'] is not None and rollup['first_start'] < window_end \
+                        and rollup['last_end'] > window_start:
+                    log_file.read_log()
+                    for uuid, t_from, t_to, name in log_file.times:
+                        add_cropped(uuid, t_from, t_to, name, window_start, window_end)
+
+        # latest.log and players still online at the end
+        last_log = latest or (log_files[-1] if log_files else None)
+        if latest is not None:
+            for uuid, t_from, t_to, name in latest.times:
+                add_cropped(uuid, t_from, t_to, name, t_start, t_end)
+        if last_log is not None:
+            last_log.read_log()
+            for name, (uuid, t_from, logins) in last_log.online.items():
+                add_cropped(uuid, t_from, float('inf'), name, t_start, t_end)
+        return dict((uuid, [seconds, name]) for uuid, (seconds, name, t_from) in totals.items())
+
+    @staticmethod
+    def read_last_event(log_file):
+        log_file.read_log()
+        return log_file.last_event
+
+    @stats.timed('session index')
+    def session_index(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns a `SessionIntervalIndex` over the sessions of `collect_data`,
+        with players still online at the end having sessions ending at infinity.
+        Indexes are kept for the `max_session_indexes` most recently used ranges of logs,
+        so repeated queries for the same days only have to look at the overlapping sessions.
+        They are dropped by `forget_latest` and `refresh_stale`.
+        """
+        key = self.date_to_log_day(from_date, to_date, inclusive_to)
+        if key not in self.session_indexes:
+            sessions, online = self.collect_session_table(from_date, to_date, inclusive_to)
+            for name, sess_begin in online.items():
+                uuid, t_from = sess_begin[:2]
+                sessions.append([uuid, t_from, float('inf'), name])
+            self.session_indexes[key] = intervals.SessionIntervalIndex(sessions)
+            while len(self.session_indexes) > self.max_session_indexes:
+                self.session_indexes.popitem(last=False)
+        self.session_indexes.move_to_end(key)
+        return self.session_indexes[key]
+
     def collect_uptimes(self, from_date=None, to_date=None, inclusive_to=False):
         from_day, to_day, inclusive_to = self.date_to_log_day(from_date, to_date, inclusive_to)
         first_event = None
@@ -274,23 +1274,100 @@ class LogDirectory:
             yield (first_event, timeutils.date_str_to_epoch(
                 to_date or timeutils.latest_log_date_str(self.logs_dir)))
 
+    def iter_player_events(self, attr, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Yields the rows `[uuid, seconds, detail, name]` of the `LogFile` attribute `attr`,
+        `deaths` or `advancements`, that happened between `from_date` and `to_date`.
+        """
+        t_start = timeutils.date_str_to_epoch(from_date) or float('-inf')
+        t_end = timeutils.date_str_to_epoch(to_date or timeutils.latest_log_date_str(self.logs_dir))
+        from_day, to_day, inclusive_to = self.date_to_log_day(from_date, to_date, inclusive_to)
+        for log_file in self.read_interval_iter(from_day, to_day, inclusive_to):
+            for row in getattr(log_file, attr):
+                if t_start <= row[1] < t_end:
+                    yield row
+
+    @stats.timed('collect deaths')
+    def collect_deaths(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns how often each player died, as `uuid -> [deaths, name]`,
+        `name` being the one at the player's last death.
+        """
+        deaths = {}
+        for uuid, seconds, message, name in self.iter_player_events('deaths', from_date, to_date, inclusive_to):
+            if uuid in deaths:
+                deaths[uuid][0] += 1
+                deaths[uuid][1] = name
+            else:
+                deaths[uuid] = [1, name]
+        return deaths
+
+    @stats.timed('collect advancements')
+    def collect_advancements(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns the advancements (or achievements, on old servers) each player made,
+        as `uuid -> [[seconds, advancement, name]]`, in the order they were made.
+        """
+        advancements = {}
+        for uuid, seconds, advancement, name in self.iter_player_events('advancements', from_date, to_date,
+                                                                         inclusive_to):
+            advancements.setdefault(uuid, []).append([seconds, advancement, name])
+        return advancements
+
+    @stats.timed('collect activity')
+    def collect_last_activity(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns when each player was last active, as `uuid -> [last_active, last_chat, messages, name]`:
+        `last_active` is the last join, leave, death, advancement or chat message,
+        or the end of the range for players still online,
+        `last_chat` the time of the last chat message, or None,
+        `messages` the number of chat messages,
+        `name` the one used at `last_active`.
+        Chat is only counted per log, so at partial days at the edges of the range
+        a log's messages are counted if its last one is in the range.
+        """
+        t_start = timeutils.date_str_to_epoch(from_date) or float('-inf')
+        t_end = timeutils.date_str_to_epoch(to_date or timeutils.latest_log_date_str(self.logs_dir))
+        activity = {}
+
+        def update(uuid, seconds, name):
+            entry = activity.setdefault(uuid, [seconds, None, 0, name])
+            if seconds >= entry[0]:
+                entry[0] = seconds
+                entry[3] = name
+            return entry
+
+        for uuid, sessions in self.collect_user_sessions(from_date, to_date, inclusive_to).items():
+            for uuid, t_from, t_to, name in sessions:
+                update(uuid, t_to, name)
+        for attr in ('deaths', 'advancements'):
+            for uuid, seconds, detail, name in self.iter_player_events(attr, from_date, to_date, inclusive_to):
+                update(uuid, seconds, name)
+        from_day, to_day, inclusive_to = self.date_to_log_day(from_date, to_date, inclusive_to)
+        for log_file in self.read_interval_iter(from_day, to_day, inclusive_to):
+            for name, (uuid, last_chat, messages) in log_file.chat.items():
+                if t_start <= last_chat < t_end:
+                    entry = update(uuid, last_chat, name)
+                    entry[1] = max(entry[1] or last_chat, last_chat)
+                    entry[2] += messages
+        return activity
+
     def iter_log_name_tuples_between(self, from_log=None, to_log=None, inclusive_to=False):
         """
         from_log, to_log are in format yyyy-mm-dd or yyyy-mm-dd-n,
         from_log may be None to accept all logs before to_log,
         to_log may be None to accept all logs after from_log
         """
-        between = self.sorted_log_name_tuples
+        first, end = 0, len(self.sorted_log_days)
         if from_log is not None:
-            from_split = self.split_for_compare(from_log)
-            between = filter(lambda log: from_split <= log[:3], between)
+            first = bisect_left(self.sorted_log_days, self.split_for_compare(from_log))
         if to_log is not None:
             to_split = self.split_for_compare(to_log)
             if inclusive_to:
-                between = filter(lambda log: log[:3] <= to_split, between)
+                end = bisect_right(self.sorted_log_days, to_split)
             else:
-                between = filter(lambda log: log[:3] < to_split, between)
-        return between
+                end = bisect_left(self.sorted_log_days, to_split)
+        return self.sorted_log_name_tuples[first:end]
 
     @staticmethod
     def date_to_log_day(from_date, to_date, inclusive_to=False):
@@ -0,0 +1,184 @@
+"""
+Compact binary format for converted logs.
+
+Layout, all integers little endian:
+
+    magic `MCSL`, format version (u16)
+    length-prefixed JSON: scalar attributes and metadata
+    length-prefixed string table, NUL separated UTF-8
+    `times`: count (u32), then int64 rows of (uuid, from, to, name)
+    `online`: count (u32), then int64 rows of (name, uuid, from, logins)
+    `deaths`: count (u32), then int64 rows of (uuid, time, message, name)
+    `advancements`: count (u32), then int64 rows of (uuid, time, advancement, name)
+    `chat`: count (u32), then int64 rows of (name, uuid, last time, messages)
+
+All strings in the tables are indices into the string table,
+so loading is one JSON parse, one `split` and one `array.frombytes` per table.
+"""
+from array import array
+import json
+import os
+import struct
+import sys
+
+MAGIC = b'MCSL'
+CACHE_VERSION = 2
+NONE = -2 ** 63  # stored for `None` in the int64 columns
+
+HEADER = struct.Struct('<4sH')
+LENGTH = struct.Struct('<I')
+
+# attributes stored as tables, in file order, with the kind of each of their 4 columns:
+# `s` for strings, `i` for ints or None; dict tables store the key in the first column
+LIST_TABLES = {'times': 'siis', 'deaths': 'siss', 'advancements': 'siss'}
+DICT_TABLES = {'online': 'ssii', 'chat': 'ssii'}
+TABLES = 'times', 'online', 'deaths', 'advancements', 'chat'
+
+class CacheFormatError(ValueError):
+    pass
+
+def _to_int(value):
+    return NONE if value is None else value
+
+def _from_int(value):
+    return None if value == NONE else value
+
+def dump(data, cache_file, meta=None):
+    """
+    Writes the attributes in `data` to the binary `cache_file`.
+    The attributes in `TABLES` are packed into int64 columns,
+    all other attributes and `meta` have to be JSON serializable.
+    """
+    scalars = dict((attr, value) for attr, value in data.items() if attr not in TABLES)
+    strings = {}  # string -> index
+
+    def intern(string):
+        if string not in strings:
+            strings[string] = len(strings)
+        return strings[string]
+
+    columns = []
+    for attr in TABLES:
+        if attr in DICT_TABLES:
+            kinds = DICT_TABLES[attr]
+            rows = ([key] + list(value) for key, value in data.get(attr, {}).items())
+        else:
+            kinds = LIST_TABLES[attr]
+            rows = data.get(attr, [])
+        column = array('q')
+        for row in rows:
+            column.extend(intern(value) if kind == 's' else _to_int(value) for kind, value in zip(kinds, row))
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns.append(column)
+
+    json_bytes = json.dumps({'data': scalars, 'meta': meta or {}}).encode()
+    strings_bytes = '\0'.join(strings).encode()
+    cache_file.write(HEADER.pack(MAGIC, CACHE_VERSION))
+    for blob in (json_bytes, strings_bytes):
+        cache_file.write(LENGTH.pack(len(blob)))
+        cache_file.write(blob)
+    for column in columns:
+        cache_file.write(LENGTH.pack(len(column) // 4))
+        cache_file.write(column.tobytes())
+
+def _unpack_rows(column, kinds, strings):
+    """Returns the rows of a 4 column table as lists."""
+    if not column:
+        return []
+    values = []
+    for i, kind in enumerate(kinds):
+        part = column[i::4].tolist()
+        if kind == 's':
+            part = list(map(strings.__getitem__, part))
+        elif NONE in part:
+            part = [_from_int(value) for value in part]
+        values.append(part)
+    return list(map(list, zip(*values)))
+
+def _check_header(buf):
+    if len(buf) < HEADER.size:
+        raise CacheFormatError('Truncated cache file')
+    magic, version = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise CacheFormatError('Not a cache file')
+    if version != CACHE_VERSION:
+        raise CacheFormatError('Unsupported cache version %i' % version)
+
+def load(cache_file):
+    """
+    Reads a file written by `dump`.
+    Returns a tuple of the attributes `data` and `meta`.
+    Raises `CacheFormatError` if the file has an unknown format or version.
+    """
+    buf = cache_file.read()
+    _check_header(buf)
+    pos = HEADER.size
+    try:
+        blobs = []
+        for i in range(2):
+            length, = LENGTH.unpack_from(buf, pos)
+            pos += LENGTH.size
+            blobs.append(buf[pos:pos + length])
+            pos += length
+            if len(blobs[-1]) != length:
+                raise CacheFormatError('Truncated cache file')
+        columns = []
+        for attr in TABLES:
+            rows, = LENGTH.unpack_from(buf, pos)
+            pos += LENGTH.size
+            column = array('q')
+            column_bytes = buf[pos:pos + rows * 4 * column.itemsize]
+            if len(column_bytes) != rows * 4 * column.itemsize:
+                raise CacheFormatError('Truncated cache file')
+            column.frombytes(column_bytes)
+            pos += len(column_bytes)
+            if sys.byteorder != 'little':
+                column.byteswap()
+            columns.append(column)
+        if pos != len(buf):
+            raise CacheFormatError('%i bytes after the last table' % (len(buf) - pos))
+        json_data = json.loads(blobs[0].decode())
+        strings = blobs[1].decode().split('\0')
+        data = json_data['data']
+        for attr, column in zip(TABLES, columns):
+            if attr in DICT_TABLES:
+                data[attr] = dict((row[0], row[1:]) for row in _unpack_rows(column, DICT_TABLES[attr], strings))
+            else:
+                data[attr] = _unpack_rows(column, LIST_TABLES[attr], strings)
+        return data, json_data['meta']
+    except CacheFormatError:
+        raise
+    except (struct.error, ValueError, KeyError, IndexError, TypeError) as e:
+        # ValueError includes broken UTF-8 and JSON
+        raise CacheFormatError('Corrupt cache file: %r' % e)
+
+def write_cache(cache_path, data, meta=None):
+    """
+    Writes `data` to `cache_path`, replacing the file at once
+    so readers never see a partially written cache.
+    """
+    tmp_path = '%s.%i.tmp' % (cache_path, os.getpid())
+    with open(tmp_path, 'wb') as cache_file:
+        dump(data, cache_file, meta)
+    os.replace(tmp_path, cache_path)
+
+def read_cache(cache_path):
+    with open(cache_path, 'rb') as cache_file:
+        return load(cache_file)
+
+def read_meta(cache_path):
+    """Returns only the `meta` of the cache at `cache_path`, without reading its tables."""
+    with open(cache_path, 'rb') as cache_file:
+        buf = cache_file.read(HEADER.size + LENGTH.size)
+        _check_header(buf)
+        if len(buf) < HEADER.size + LENGTH.size:
+            raise CacheFormatError('Truncated cache file')
+        length, = LENGTH.unpack_from(buf, HEADER.size)
+        json_bytes = cache_file.read(length)
+    if len(json_bytes) < length:
+        raise CacheFormatError('Truncated cache file')
+    try:
+        return json.loads(json_bytes.decode())['meta']
+    except (ValueError, KeyError, TypeError) as e:
+        raise CacheFormatError('Corrupt cache file: %r' % e)
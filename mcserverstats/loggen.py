@@ -0,0 +1,172 @@
+"""
+Writes realistic vanilla server logs, for tests and benchmarks.
+
+The same arguments always produce the same logs.
+Each day has `rotations` logs: the first one continues the server run of
+the previous day, every following one starts after a restart, which is
+either a clean stop or, with `crash_chance`, a crash without any stop.
+The last log is written as `latest.log`, all others as `*.log.gz`.
+"""
+import gzip
+import os
+import random
+from mcserverstats import timeutils
+
+DAY_SECONDS = 24 * 3600
+
+def player_names(num_players, rand):
+    prefixes = 'Notch', 'Steve', 'Alex', 'Herobrine', 'Creeper', 'Miner', 'Builder', 'Redstone'
+    return ['%s%i' % (rand.choice(prefixes), i) for i in range(num_players)]
+
+def player_uuid(rand):
+    return '%08x-%04x-4%03x-%04x-%012x' % (rand.getrandbits(32), rand.getrandbits(16), rand.getrandbits(12),
+                                           rand.getrandbits(16) & 0x3fff | 0x8000, rand.getrandbits(48))
+
+def time_str(seconds):
+    return '%02i:%02i:%02i' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+class LogGenerator:
+    """
+    Simulates a server with `players` players over `days` days.
+
+    :param events_per_day: joins and leaves per day, across all logs of the day
+    :param noise_per_event: other lines (chat, deaths, advancements, warnings, command blocks) per join or leave
+    :param double_join_chance: chance that a player joins again while online,
+                               kicking the older connection
+    """
+
+    def __init__(self, players=20, days=7, rotations=1, crash_chance=0.1, double_join_chance=0.02,
+                 events_per_day=100, noise_per_event=10, start_day='2015-01-01', seed=0):
+        self.rand = random.Random(seed)
+        self.days = days
+        self.rotations = rotations
+        self.crash_chance = crash_chance
+        self.double_join_chance = double_join_chance
+        self.events_per_day = events_per_day
+        self.noise_per_event = noise_per_event
+        self.start_day = timeutils.ensure_day_only(start_day)
+        self.names = player_names(players, self.rand)
+        self.uuids = dict((name, player_uuid(self.rand)) for name in self.names)
+        self.online = set()
+        self.entity_id = 1000
+        self.messages = {}  # name -> number of chat messages written
+        self.deaths = {}  # name -> number of deaths written
+        self.advancements = {}  # name -> advancements made, in order
+
+    def write(self, logs_dir):
+        """
+        Writes all logs to `logs_dir`.
+        Returns the names of the written logs, the last one being `latest`.
+        """
+        log_names = []
+        for day in range(self.days):
+            day_str = timeutils.ensure_day_only(timeutils.add_to_date_str(self.start_day, days=day))
+            restarts = sorted(self.rand.sample(range(3600, DAY_SECONDS - 3600), self.rotations - 1))
+            bounds = [0] + restarts + [DAY_SECONDS]
+            for log_nr in range(self.rotations):
+                is_latest = day == self.days - 1 and log_nr == self.rotations - 1
+                t_from, t_to = bounds[log_nr], bounds[log_nr + 1]
+                lines = []
+                if log_nr > 0 or day == 0:
+                    lines.extend(self.start_lines(t_from))
+                if is_latest:
+                    t_to = t_from + (t_to - t_from) // 2  # still running
+                self.add_events(lines, t_from, t_to)
+                if log_nr < self.rotations - 1 and self.rand.random() >= self.crash_chance:
+                    lines.extend(self.stop_lines(t_to - 1))
+                elif log_nr < self.rotations - 1:
+                    self.online.clear()  # crashed, nobody leaves
+                if is_latest:
+                    log_path = os.path.join(logs_dir, 'latest.log')
+                    with open(log_path, 'w', encoding='latin_1') as log_file:
+                        log_file.writelines(lines)
+                    # the date of latest.log is taken from its mtime
+                    mtime = timeutils.date_str_to_epoch(day_str, time_str(t_to - 1))
+                    os.utime(log_path, (mtime, mtime))
+                    log_names.append('latest')
+                else:
+                    log_name = '%s-%i' % (day_str, log_nr + 1)
+                    with gzip.open(os.path.join(logs_dir, log_name + '.log.gz'), 'wt', encoding='latin_1') as log_file:
+                        log_file.writelines(lines)
+                    log_names.append(log_name)
+        return log_names
+
+    def start_lines(self, seconds):
+        t = time_str(seconds)
+        return [
+            '[%s] [Server thread/INFO]: Starting minecraft server version 1.8.3\n' % t,
+            '[%s] [Server thread/INFO]: Loading properties\n' % t,
+            '[%s] [Server thread/INFO]: Preparing level "world"\n' % t,
+            '[%s] [Server thread/INFO]: Done (5.188s)! For help, type "help" or "?"\n' % t,
+        ]
+
+    def stop_lines(self, seconds):
+        t = time_str(seconds)
+        lines = ['[%s] [Server thread/INFO]: Stopping server\n' % t]
+        for name in sorted(self.online):
+            lines.append('[%s] [Server thread/INFO]: %s lost connection: Server closed\n' % (t, name))
+            lines.append('[%s] [Server thread/INFO]: %s left the game\n' % (t, name))
+        self.online.clear()
+        return lines
+
+    def add_events(self, lines, t_from, t_to):
+        num_events = self.events_per_day * (t_to - t_from) // DAY_SECONDS
+        is_event = [True] * num_events + [False] * (num_events * self.noise_per_event)
+        times = [self.rand.randrange(t_from, t_to) for i in is_event]
+        for seconds, event in sorted(zip(times, is_event), key=lambda item: item[0]):
+            t = time_str(seconds)
+            if not event:
+                lines.append(self.noise_line(t))
+                continue
+            name = self.rand.choice(self.names)
+            if name not in self.online:
+                lines.extend(self.join_lines(t, name))
+                self.online.add(name)
+            elif self.rand.random() < self.double_join_chance:
+                lines.extend(self.join_lines(t, name))
+                lines.append("[%s] [Server thread/INFO]: %s lost connection: TextComponent{text='You logged in"
+                             " from another location', siblings=[], style=Style{hasParent=false}}\n" % (t, name))
+            else:
+                lines.append('[%s] [Server thread/INFO]: %s lost connection: Disconnected\n' % (t, name))
+                lines.append('[%s] [Server thread/INFO]: %s left the game\n' % (t, name))
+                self.online.remove(name)
+
+    def join_lines(self, t, name):
+        self.entity_id += 1
+        return [
+            '[%s] [User Authenticator #%i/INFO]: UUID of player %s is %s\n'
+            % (t, self.rand.randrange(1, 10), name, self.uuids[name]),
+            '[%s] [Server thread/INFO]: %s[/10.0.%i.%i:%i] logged in with entity id %i at (%.1f, %.1f, %.1f)\n'
+            % (t, name, self.rand.randrange(256), self.rand.randrange(256), self.rand.randrange(1024, 65536),
+               self.entity_id, self.rand.uniform(-5000, 5000), self.rand.uniform(5, 200), self.rand.uniform(-5000, 5000)),
+            '[%s] [Server thread/INFO]: %s joined the game\n' % (t, name),
+        ]
+
+    def noise_line(self, t):
+        kind = self.rand.random()
+        if kind < 0.5 and self.online:
+            name = self.rand.choice(sorted(self.online))
+            if kind < 0.4:
+                self.messages[name] = self.messages.get(name, 0) + 1
+                return '[%s] [Server thread/INFO]: <%s> %s\n' % (t, name, self.rand.choice(
+                    ('hi', 'brb', 'anyone got iron?', 'gg')))
+            if kind < 0.45:
+                self.deaths[name] = self.deaths.get(name, 0) + 1
+                return '[%s] [Server thread/INFO]: %s %s\n' % (t, name, self.rand.choice(
+                    ('was slain by Zombie', 'was shot by Skeleton', 'drowned', 'fell from a high place',
+                     'tried to swim in lava')))
+            advancement = self.rand.choice(('Stone Age', 'Getting an Upgrade', 'Acquire Hardware', 'Diamonds!'))
+            self.advancements.setdefault(name, []).append(advancement)
+            return '[%s] [Server thread/INFO]: %s has made the advancement [%s]\n' % (t, name, advancement)
+        if kind < 0.8:
+            return '[%s] [Server thread/INFO]: [@: Set block %i,64,%i to minecraft:redstone_block]\n' \
+                   % (t, self.rand.randrange(-100, 100), self.rand.randrange(-100, 100))
+        return "[%s] [Server thread/WARN]: Can't keep up! Did the system time change," \
+               " or is the server overloaded? Running 2500ms behind, skipping 50 tick(s)\n" % t
+
+def generate_logs(logs_dir, **kwargs):
+    """
+    Writes logs to `logs_dir`, see `LogGenerator` for the arguments.
+    Returns the names of the written logs.
+    """
+    return LogGenerator(**kwargs).write(logs_dir)
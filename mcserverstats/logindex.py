@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import sqlite3
+from mcserverstats import stats
+
+logger = logging.getLogger('logalyzer')
+
+INDEX_NAME = 'mcserverstats.sqlite'
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS logs (
+    log_key INTEGER PRIMARY KEY,
+    log_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    started INTEGER,
+    stopped INTEGER,
+    first_event INTEGER,
+    last_event INTEGER,
+    online TEXT NOT NULL,
+    extra TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    log_key INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    uuid TEXT NOT NULL,
+    t_from INTEGER,
+    t_to INTEGER,
+    name TEXT NOT NULL,
+    PRIMARY KEY (log_key, seq)
+);
+'''
+
+SCALAR_ATTRIBUTES = 'started', 'stopped', 'first_event', 'last_event'
+
+def log_key(log_name_tuple):
+    """`(2015, 1, 4, 2)` -> `2015010400002`, sorts like the tuple"""
+    year, month, day, num = log_name_tuple
+    return ((year * 100 + month) * 100 + day) * 100000 + num
+
+def to_bool(value):
+    return None if value is None else bool(value)
+
+class LogIndex:
+    """
+    SQLite database holding the converted data of all logs in a directory,
+    so range queries do not need to open one cache file per log.
+    `latest.log` is never indexed, as it is still being written to.
+    """
+
+    def __init__(self, index_path, parser_version=None):
+        """
+        :param parser_version: `logalyzer.PARSER_VERSION`, all logs are indexed again
+                               when it differs from the one they were indexed with
+        """
+        self.index_path = index_path
+        # LogDirectory serializes access, allow using it from executor threads
+        self.db = sqlite3.connect(index_path, check_same_thread=False)
+        versions = {}
+        try:
+            versions = dict(self.db.execute('SELECT key, value FROM meta'))
+        except sqlite3.OperationalError:
+            pass  # new database
+        if 'version' in versions and int(versions['version']) != SCHEMA_VERSION:
+            logger.info('Rebuilding index %s, schema version changed', index_path)
+            self.db.executescript('DROP TABLE IF EXISTS logs; DROP TABLE IF EXISTS sessions;')
+        elif parser_version is not None and versions.get('parser_version') not in (None, str(parser_version)):
+            logger.info('Rebuilding index %s, parser version changed', index_path)
+            self.db.executescript('DROP TABLE IF EXISTS logs; DROP TABLE IF EXISTS sessions;')
+        self.db.executescript(SCHEMA)
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+        if parser_version is not None:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('parser_version', ?)", (str(parser_version),))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, logs):
+        """
+        Ingests all logs of the `LogDirectory` that are new or have changed
+        since they were indexed, and drops logs that no longer exist.
+        A log after an ingested one is ingested as well if the players online
+        at the end of the ingested one changed, as it starts with them.
+        Returns the names of the ingested logs.
+        """
+        known = dict((key, (size, mtime, online)) for key, size, mtime, online
+                     in self.db.execute('SELECT log_key, size, mtime, online FROM logs'))
+        entries = []  # [key, name_tuple, stat, indexed online, changed]
+        for name_tuple in logs.sorted_log_name_tuples:
+            # only create LogFiles for the logs that have to be read
+            source_path = os.path.join(logs.logs_dir, logs.join_from_compare(name_tuple) + '.log.gz')
+            stat = os.stat(source_path)
+            key = log_key(name_tuple)
+            size, mtime, online = known.pop(key, (None, None, None))
+            entries.append([key, name_tuple, stat, online, (size, mtime) != (stat.st_size, stat.st_mtime_ns)])
+        if logs.workers is not None:
+            logs.prepare_convert([logs.log_files[entry[1]] for entry in entries if entry[4]])
+        ingested = []
+        online_changed = False
+        for key, name_tuple, stat, online, changed in entries:
+            if not (changed or online_changed):
+                continue
+            log_file = logs.log_files[name_tuple]
+            logger.info('Indexing %s', log_file.log_name)
+            log_file.read_log()
+            self.store(key, log_file, stat)
+            ingested.append(log_file.log_name)
+            online_changed = online is None or json.loads(online) != log_file.online
+        for key in known:
+            self.delete(key)
+        self.db.commit()
+        return ingested
+
+    def store(self, key, log_file, stat):
+        data = log_file.get_data()
+        times = data.pop('times')
+        online = data.pop('online')
+        scalars = [data.pop(attr) for attr in SCALAR_ATTRIBUTES]
+        self.delete(key)
+        self.db.execute('INSERT INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [key, log_file.log_name, stat.st_size, stat.st_mtime_ns] + scalars
+                        + [json.dumps(online), json.dumps(data)])
+        self.db.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)',
+                            ((key, seq, uuid, t_from, t_to, name)
+                             for seq, (uuid, t_from, t_to, name) in enumerate(times)))
+
+    def delete(self, key):
+        self.db.execute('DELETE FROM logs WHERE log_key = ?', (key,))
+        self.db.execute('DELETE FROM sessions WHERE log_key = ?', (key,))
+
+    @stats.timed('index load')
+    def load_logs(self, log_files):
+        """
+        Fills the unread `LogFile`s in `log_files` with their indexed data,
+        using one query for the logs and one for their sessions.
+        Returns the number of logs that were found in the index.
+        """
+        by_key = {}
+        for log_file in log_files:
+            if log_file.been_read or log_file.log_name == 'latest':
+                continue
+            by_key[log_key(log_file.name_tuple)] = log_file
+        if not by_key:
+            return 0
+        key_range = min(by_key), max(by_key)
+        data = {}
+        for row in self.db.execute(
+                'SELECT log_key, started, stopped, first_event, last_event, online, extra'
+                ' FROM logs WHERE log_key BETWEEN ? AND ?', key_range):
+            key, started, stopped, first_event, last_event, online, extra = row
+            if key not in by_key:
+                continue
+            log_data = json.loads(extra)
+            log_data.update(started=to_bool(started), stopped=to_bool(stopped),
+                            first_event=first_event, last_event=last_event,
+                            online=json.loads(online), times=[])
+            data[key] = log_data
+        for key, uuid, t_from, t_to, name in self.db.execute(
+                'SELECT log_key, uuid, t_from, t_to, name FROM sessions'
+                ' WHERE log_key BETWEEN ? AND ? ORDER BY log_key, seq', key_range):
+            if key in data:
+                data[key]['times'].append([uuid, t_from, t_to, name])
+        for key, log_data in data.items():
+            log_file = by_key[key]
+            log_file.set_data(log_data)
+            log_file.been_read = True
+            logger.debug('Loaded %s from index', log_file.log_name)
+        stats.count('index hits', len(data))
+        stats.count('index misses', len(by_key) - len(data))
+        return len(data)
@@ -0,0 +1,196 @@
+"""
+A network of servers, each with its own log directory, queried together.
+
+Every query runs once per server, in a process pool, and the results are
+merged by UUID. Network-wide sessions are the union of a player's sessions
+on all servers, so a player hopping from one server to another counts as
+online once, without a gap or an overlap.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+from mcserverstats import logalyzer, rollups, stats
+
+def server_name(logs_dir):
+    """`/srv/lobby/logs` -> `lobby`, `/srv/lobby-logs` -> `lobby-logs`"""
+    path = os.path.normpath(os.path.abspath(logs_dir))
+    name = os.path.basename(path)
+    if name == 'logs':
+        name = os.path.basename(os.path.dirname(path)) or name
+    return name
+
+def split_logs_dirs(logs_dirs_arg):
+    """Splits a command line argument of log directories, separated by `os.pathsep`."""
+    return [logs_dir for logs_dir in logs_dirs_arg.split(os.pathsep) if logs_dir]
+
+def open_logs(logs_dirs_arg, workers=0):
+    """
+    Returns a `LogDirectory` for a single directory,
+    or a `ServerNetwork` for several, separated by `os.pathsep`.
+    """
+    logs_dirs = split_logs_dirs(logs_dirs_arg)
+    if len(logs_dirs) == 1:
+        return logalyzer.LogDirectory(logs_dirs[0])
+    return ServerNetwork(logs_dirs, workers)
+
+def union_sessions(sessions):
+    """
+    Merges the overlapping or touching sessions `[uuid, t_from, t_to, name]` of one player.
+    A merged session has the name of the last session that started in it.
+    Returns the merged sessions, sorted by their start.
+    """
+    merged = []
+    for uuid, t_from, t_to, name in sorted(sessions, key=lambda session: session[1]):
+        if merged and t_from <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], t_to)
+            merged[-1][3] = name
+        else:
+            merged.append([uuid, t_from, t_to, name])
+    return merged
+
+# run in the worker processes, one LogDirectory per call
+
+def directory_user_sessions(logs_dir, from_date, to_date, inclusive_to):
+    return logalyzer.LogDirectory(logs_dir).collect_user_sessions(from_date, to_date, inclusive_to)
+
+def directory_totals(logs_dir, from_date, to_date, inclusive_to):
+    return logalyzer.LogDirectory(logs_dir).collect_totals(from_date, to_date, inclusive_to)
+
+def directory_uptimes(logs_dir, from_date, to_date, inclusive_to):
+    return list(logalyzer.LogDirectory(logs_dir).collect_uptimes(from_date, to_date, inclusive_to))
+
+def directory_online(logs_dir):
+    log_file = logalyzer.LogDirectory(logs_dir).log_files['latest']
+    log_file.read_log()
+    return log_file.online
+
+def directory_convert(logs_dir):
+    times, online = logalyzer.LogDirectory(logs_dir).collect_data()
+    return len(times)
+
+class ServerNetwork:
+    """
+    Answers the queries of `LogDirectory` for several log directories at once.
+
+    :param logs_dirs: one log directory per server, named by `server_name`
+    :param workers: number of worker processes, 0 for one per CPU,
+                    None to query all servers in this process
+    """
+
+    def __init__(self, logs_dirs, workers=0):
+        self.servers = {}  # server name -> logs_dir
+        for logs_dir in logs_dirs:
+            name = base_name = server_name(logs_dir)
+            number = 1
+            while name in self.servers:
+                number += 1
+                name = '%s-%i' % (base_name, number)
+            self.servers[name] = logs_dir
+        self.workers = workers
+        self.executor = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def map_servers(self, fun, *args):
+        """
+        Calls `fun(logs_dir, *args)` for each server, in the worker processes.
+        Returns `server name -> result`.
+        """
+        logs_dirs = list(self.servers.values())
+        if self.workers is None or len(logs_dirs) < 2:
+            results = [fun(logs_dir, *args) for logs_dir in logs_dirs]
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(min(self.workers or os.cpu_count() or 1, len(logs_dirs)))
+            results = list(self.executor.map(fun, logs_dirs, *[repeat(arg) for arg in args]))
+        return dict(zip(self.servers, results))
+
+    @stats.timed('network convert')
+    def convert(self):
+        """Reads and converts the logs of all servers. Returns `server name -> number of sessions`."""
+        return self.map_servers(directory_convert)
+
+    def latest_log_date_str(self):
+        return max(logalyzer.LogDirectory(logs_dir).latest_log_date_str() for logs_dir in self.servers.values())
+
+    @stats.timed('network sessions')
+    def collect_server_user_sessions(self, from_date=None, to_date=None, inclusive_to=False):
+        """Returns `server name -> uuid -> [sessions]`, see `LogDirectory.collect_user_sessions`."""
+        return self.map_servers(directory_user_sessions, from_date, to_date, inclusive_to)
+
+    def collect_user_sessions(self, from_date=None, to_date=None, inclusive_to=False, whitelist=None):
+        """
+        Returns the network-wide sessions of each player, as `uuid -> [sessions]`,
+        see `union_sessions`.
+        """
+        all_sessions = {}  # uuid -> sessions on any server
+        for user_sessions in self.collect_server_user_sessions(from_date, to_date, inclusive_to).values():
+            for uuid, sessions in user_sessions.items():
+                if not whitelist or uuid in whitelist:
+                    all_sessions.setdefault(uuid, []).extend(sessions)
+        return dict((uuid, union_sessions(sessions)) for uuid, sessions in all_sessions.items())
+
+    @stats.timed('network totals')
+    def collect_server_totals(self, from_date=None, to_date=None, inclusive_to=False):
+        """Returns `server name -> uuid -> [seconds, name]`, see `LogDirectory.collect_totals`."""
+        return self.map_servers(directory_totals, from_date, to_date, inclusive_to)
+
+    def collect_totals(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns the network-wide online seconds of each player, as `uuid -> [seconds, name]`.
+        Time online on several servers at once is only counted once.
+        """
+        totals = {}
+        for uuid, sessions in self.collect_user_sessions(from_date, to_date, inclusive_to).items():
+            for uuid, t_from, t_to, name in sessions:
+                rollups.add_seconds(totals, uuid, t_to - t_from, name, t_from)
+        return dict((uuid, [seconds, name]) for uuid, (seconds, name, t_from) in totals.items())
+
+    def collect_uptimes(self, from_date=None, to_date=None, inclusive_to=False):
+        """Yields the `(t_from, t_to)` during which any server of the network was running."""
+        uptimes = []
+        for server_uptimes in self.map_servers(directory_uptimes, from_date, to_date, inclusive_to).values():
+            uptimes.extend(server_uptimes)
+        for uuid, t_from, t_to, name in union_sessions([None, t_from, t_to, None] for t_from, t_to in uptimes):
+            yield t_from, t_to
+
+    def online_players(self):
+        """
+        Returns the players online right now on any server,
+        as `uuid -> [name, join_time, [server names]]`, `join_time` being their earliest join.
+        """
+        online = {}
+        for server, server_online in self.map_servers(directory_online).items():
+            for name, (uuid, join_time, login_count) in server_online.items():
+                player = online.setdefault(uuid, [name, join_time, []])
+                if join_time < player[1]:
+                    player[:2] = name, join_time
+                player[2].append(server)
+        return online
+
+    def online_counts(self, from_date=None, to_date=None, inclusive_to=False):
+        """
+        Returns the number of players online anywhere in the network over time,
+        as a list of `(t, count)`, one for every time the count changes.
+        """
+        changes = {}
+        for sessions in self.collect_user_sessions(from_date, to_date, inclusive_to).values():
+            for uuid, t_from, t_to, name in sessions:
+                changes[t_from] = changes.get(t_from, 0) + 1
+                changes[t_to] = changes.get(t_to, 0) - 1
+        counts = []
+        count = 0
+        for t in sorted(changes):
+            if changes[t]:
+                count += changes[t]
+                counts.append((t, count))
+        return counts
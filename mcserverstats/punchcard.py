@@ -0,0 +1,226 @@
+"""
+Hour-of-week activity of players, for drawing punchcards.
+
+All sessions are converted to NumPy arrays once and every statistic is
+computed with array operations, so years of sessions take well under a
+second instead of one Python loop iteration per session and hour.
+
+Times are binned in local time. A session spanning a DST transition is
+binned by the local times of its start and end, so it gains or loses the
+shifted hour.
+"""
+import csv
+from operator import itemgetter
+import time
+import numpy as np
+from mcserverstats import timeutils
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK_HOURS = 7 * 24
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday, Monday is 0
+MAX_ACTIVE_GRID = 1 << 26  # days times players, above that daily active players are counted by sorting
+WEEKDAYS = 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
+
+def session_arrays(sessions):
+    """
+    Converts sessions `[uuid, t_from, t_to, name]` to arrays.
+    Returns a dict with
+    `uuids`: list of all players, by first appearance,
+    `names`: the name of each player's last session,
+    `player`: the index into `uuids` of each session,
+    `t_from`, `t_to`: the epoch seconds of each session.
+    """
+    count = len(sessions)
+    indices = dict.fromkeys(map(itemgetter(0), sessions))
+    for index, uuid in enumerate(indices):
+        indices[uuid] = index
+    player = np.fromiter(map(indices.__getitem__, map(itemgetter(0), sessions)), dtype=np.intp, count=count)
+    t_from = np.fromiter(map(itemgetter(1), sessions), dtype=np.int64, count=count)
+    t_to = np.fromiter(map(itemgetter(2), sessions), dtype=np.int64, count=count)
+    # only the sessions starting at their player's last start can have the name to show
+    last_start = np.full(len(indices), np.iinfo(np.int64).min)
+    np.maximum.at(last_start, player, t_from)
+    names = [None] * len(indices)
+    for i in np.flatnonzero(t_from == last_start[player]).tolist():
+        names[player[i]] = sessions[i][3]
+    uuids = list(indices)
+    return {
+        'uuids': uuids,
+        'names': names,
+        'player': player,
+        't_from': t_from,
+        't_to': t_to,
+    }
+
+def to_local(epochs):
+    """
+    Shifts the epoch seconds in `epochs` by the local UTC offset at that time,
+    so integer division by `DAY` gives local days since 1970-01-01.
+    The offset is looked up once per day, and once per hour
+    only on days where it changes.
+    """
+    if len(epochs) == 0:
+        return epochs.copy()
+    first_hour = int(epochs.min()) // HOUR
+    num_days = (int(epochs.max()) // HOUR - first_hour) // 24 + 1
+    day_offsets = [time.localtime((first_hour + day * 24) * HOUR).tm_gmtoff for day in range(num_days + 1)]
+    offsets = np.repeat(np.array(day_offsets[:-1], dtype=np.int64), 24)
+    for day in range(num_days):
+        if day_offsets[day] != day_offsets[day + 1]:
+            offsets[day * 24:(day + 1) * 24] = [time.localtime((first_hour + day * 24 + hour) * HOUR).tm_gmtoff
+                                                for hour in range(24)]
+    return epochs + offsets[epochs // HOUR - first_hour]
+
+def hour_of_week_seconds(player, local_from, local_to, num_players):
+    """
+    Returns the online seconds of each player in each hour of the week,
+    as a `num_players x 7 x 24` array, days starting at Monday.
+
+    Each session adds its partial first and last hour directly,
+    and its full hours in between as whole weeks plus a wrapping run
+    of hours, which is summed up with a cumulative sum.
+    """
+    h_from = local_from // HOUR
+    h_to = local_to // HOUR
+    same = h_from == h_to
+    bin_from = (h_from + EPOCH_WEEKDAY * 24) % WEEK_HOURS
+    bin_to = (h_to + EPOCH_WEEKDAY * 24) % WEEK_HOURS
+    size = num_players * WEEK_HOURS
+
+    # partial first and last hours
+    first_seconds = np.where(same, local_to - local_from, (h_from + 1) * HOUR - local_from)
+    last_seconds = np.where(same, 0, local_to - h_to * HOUR)
+    seconds = np.bincount(player * WEEK_HOURS + bin_from, weights=first_seconds, minlength=size)
+    seconds += np.bincount(player * WEEK_HOURS + bin_to, weights=last_seconds, minlength=size)
+
+    # full hours: whole weeks cover every hour, the rest is a run from run_start
+    full_hours = np.maximum(h_to - h_from - 1, 0)
+    whole_weeks = np.bincount(player, weights=full_hours // WEEK_HOURS, minlength=num_players)
+    run_length = full_hours % WEEK_HOURS
+    run_start = (bin_from + 1) % WEEK_HOURS
+    run_end = run_start + run_length
+    wraps = run_end > WEEK_HOURS
+    # runs are added as +1 at their start and -1 at their end, a wrapping run
+    # is split into one run up to the end of the week and one from its start
+    width = WEEK_HOURS + 1
+    has_run = run_length > 0
+    edges = np.concatenate((
+        (player * width + run_start)[has_run],
+        (player * width + np.where(wraps, WEEK_HOURS, run_end))[has_run],
+        (player * width)[wraps],
+        (player * width + run_end - WEEK_HOURS)[wraps],
+    ))
+    signs = np.concatenate((
+        np.ones(np.count_nonzero(has_run)),
+        -np.ones(np.count_nonzero(has_run)),
+        np.ones(np.count_nonzero(wraps)),
+        -np.ones(np.count_nonzero(wraps)),
+    ))
+    runs = np.bincount(edges, weights=signs, minlength=num_players * width)
+    runs = np.cumsum(runs.reshape(num_players, width), axis=1)[:, :WEEK_HOURS]
+
+    seconds = seconds.reshape(num_players, WEEK_HOURS) + (runs + whole_weeks[:, None]) * HOUR
+    return seconds.reshape(num_players, 7, 24)
+
+def hour_of_week_counts(local_start, local_end):
+    """
+    Returns how often each hour of the week occurs from `local_start` up to `local_end`,
+    as a `7 x 24` array, to turn online seconds into average online players.
+    """
+    hours = np.arange(local_start // HOUR, -(-local_end // HOUR))
+    counts = np.bincount((hours + EPOCH_WEEKDAY * 24) % WEEK_HOURS, minlength=WEEK_HOURS)
+    return counts.reshape(7, 24)
+
+def daily_active_players(player, local_from, local_to, num_players):
+    """
+    Counts the players that were online on each local day.
+    Returns a tuple of the days, as `datetime64[D]` array, and the counts.
+    """
+    active = local_to > local_from
+    player, local_from, local_to = player[active], local_from[active], local_to[active]
+    if len(player) == 0:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64)
+    day_from = local_from // DAY
+    day_last = (local_to - 1) // DAY
+    first_day = day_from.min()
+    # one entry per session and day it touches
+    num_days = day_last - day_from + 1
+    starts = np.cumsum(num_days) - num_days
+    day_in_session = np.arange(num_days.sum()) - np.repeat(starts, num_days)
+    days = np.repeat(day_from - first_day, num_days) + day_in_session
+    players = np.repeat(player, num_days)
+    total_days = day_last.max() - first_day + 1
+    if total_days * num_players <= MAX_ACTIVE_GRID:
+        active = np.zeros((total_days, num_players), dtype=bool)
+        active[days, players] = True
+        counts = np.count_nonzero(active, axis=1)
+    else:  # too many players and days for a grid of them, sort the pairs instead
+        keys = np.unique(days * num_players + players)
+        counts = np.bincount(keys // num_players, minlength=total_days)
+    dates = np.datetime64('1970-01-01', 'D') + first_day + np.arange(total_days)
+    return dates, counts
+
+def compute_activity(sessions, t_start=None, t_end=None):
+    """
+    Computes the activity of the sessions `[uuid, t_from, t_to, name]`.
+    `t_start` and `t_end` default to the first start and last end of all sessions,
+    they only set the range over which `average_online` is averaged.
+
+    Returns a dict with
+    `uuids`, `names`: all players and their latest names,
+    `player_seconds`: online seconds of each player per hour of the week,
+                      `len(uuids) x 7 x 24`, days starting at Monday,
+    `server_seconds`: the same summed up over all players, `7 x 24`,
+    `average_online`: average number of online players per hour of the week, `7 x 24`,
+    `days`, `daily_active`: each local day and the number of players online on that day.
+    """
+    arrays = session_arrays(sessions)
+    num_players = len(arrays['uuids'])
+    local_from = to_local(arrays['t_from'])
+    local_to = to_local(arrays['t_to'])
+    player_seconds = hour_of_week_seconds(arrays['player'], local_from, local_to, num_players)
+    server_seconds = player_seconds.sum(axis=0)
+    if len(sessions):
+        local_start = to_local(np.array([arrays['t_from'].min() if t_start is None else t_start]))[0]
+        local_end = to_local(np.array([arrays['t_to'].max() if t_end is None else t_end]))[0]
+        occurrences = hour_of_week_counts(local_start, local_end)
+    else:
+        occurrences = np.zeros((7, 24), dtype=np.int64)
+    average_online = server_seconds / np.maximum(occurrences * HOUR, 1)
+    days, daily_active = daily_active_players(arrays['player'], local_from, local_to, num_players)
+    return {
+        'uuids': arrays['uuids'],
+        'names': arrays['names'],
+        'player_seconds': player_seconds,
+        'server_seconds': server_seconds,
+        'average_online': average_online,
+        'days': days,
+        'daily_active': daily_active,
+    }
+
+def collect_activity(logs, from_date=None, to_date=None, inclusive_to=False):
+    """
+    Computes the activity of all sessions of the `LogDirectory` in the given range,
+    see `compute_activity`. `average_online` is averaged over the whole range,
+    or from the first session if there is no `from_date`.
+    """
+    user_sessions = logs.collect_user_sessions(from_date, to_date, inclusive_to)
+    sessions = [session for player_sessions in user_sessions.values() for session in player_sessions]
+    return compute_activity(sessions, timeutils.date_str_to_epoch(from_date),
+                            timeutils.date_str_to_epoch(to_date or logs.latest_log_date_str()))
+
+def punchcard_rows(matrix):
+    """
+    Converts a `7 x 24` hour-of-week matrix to the table read by the Punchcard renderer:
+    a header row of hours, then one row per weekday starting with its name.
+    """
+    rows = [[''] + [str(hour) for hour in range(24)]]
+    for weekday, values in zip(WEEKDAYS, np.asarray(matrix).tolist()):
+        rows.append([weekday] + values)
+    return rows
+
+def write_punchcard_csv(matrix, csv_path):
+    """Writes `punchcard_rows(matrix)` to `csv_path`."""
+    with open(csv_path, 'w', newline='') as csv_file:
+        csv.writer(csv_file).writerows(punchcard_rows(matrix))
@@ -0,0 +1,124 @@
+"""
+Online seconds of each player per day, summed up once per converted log,
+so totals over long ranges do not have to look at every session again.
+"""
+from functools import lru_cache
+import json
+import logging
+import os
+from mcserverstats import stats, timeutils
+
+logger = logging.getLogger('logalyzer')
+
+ROLLUPS_NAME = 'rollups.json'
+ROLLUPS_VERSION = 1
+day_fmt = '%Y-%m-%d'
+
+def day_of(epoch):
+    return timeutils.epoch_to_date_str(epoch, day_fmt)
+
+@lru_cache(maxsize=4096)
+def next_midnight(day_str):
+    return timeutils.date_str_to_epoch(timeutils.add_to_date_str(day_str, days=1))
+
+def is_midnight(epoch):
+    return timeutils.date_str_to_epoch(day_of(epoch)) == epoch
+
+def log_signature(log_file):
+    """
+    `[size, mtime]` of the converted log, or of the log itself if it has no cache,
+    so a rollup is recomputed whenever its log is converted again.
+    """
+    try:
+        stat = os.stat(log_file.cache_path)
+    except (OSError, IOError):
+        stat = os.stat(log_file.source_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def is_stale(log_file):
+    """
+    Whether the cache of `log_file` is out of date, see `LogFile.stale_reason`,
+    so its rollup has to be computed again after converting it.
+    Logs without a cache, only kept in a `LogIndex`, are trusted.
+    """
+    return not log_file.been_read and os.path.isfile(log_file.cache_path) and log_file.needs_convert()
+
+def add_seconds(totals, uuid, seconds, name, t_from):
+    """
+    Adds to `totals`: `uuid -> [seconds, name, t_from]`,
+    keeping the name of the session that started last.
+    """
+    total = totals.get(uuid)
+    if total is None:
+        totals[uuid] = [seconds, name, t_from]
+    else:
+        total[0] += seconds
+        if t_from >= total[2]:
+            total[1:] = name, t_from
+
+def rollup_sessions(times):
+    """
+    Sums up the sessions `[uuid, t_from, t_to, name]` of one log per day.
+    Returns a dict with
+    `days`: `day_str -> uuid -> [seconds, name, t_from]`,
+    `first_start`, `last_end`: the earliest start and latest end of all sessions.
+    """
+    days = {}
+    for uuid, t_from, t_to, name in times:
+        day_str = day_of(t_from)
+        piece_from = t_from
+        while piece_from < t_to:
+            piece_to = min(t_to, next_midnight(day_str))
+            add_seconds(days.setdefault(day_str, {}), uuid, piece_to - piece_from, name, t_from)
+            piece_from = piece_to
+            day_str = day_of(piece_to)
+    return {
+        'days': days,
+        'first_start': min((session[1] for session in times), default=None),
+        'last_end': max((session[2] for session in times), default=None),
+    }
+
+class Rollups:
+    """
+    The rollups of all logs of a directory, stored in `rollups.json`
+    next to the logs. A log's rollup is recomputed when the log's cache
+    changed, see `log_signature`; `latest.log` is never rolled up.
+    """
+
+    def __init__(self, rollups_path):
+        self.rollups_path = rollups_path
+        self.logs = {}  # log_name -> rollup, see `rollup_sessions`
+        self.changed = False
+        try:
+            with open(rollups_path) as rollups_file:
+                data = json.load(rollups_file)
+        except (OSError, IOError, ValueError):
+            return  # not created yet or unreadable, recompute everything
+        if data.get('version') == ROLLUPS_VERSION:
+            self.logs = data['logs']
+
+    def get(self, log_file):
+        """
+        Returns the rollup of `log_file`, reading it and updating its rollup if it changed.
+        """
+        rollup = self.logs.get(log_file.log_name)
+        if rollup is not None and rollup['signature'] == log_signature(log_file) and not is_stale(log_file):
+            stats.count('rollup hits')
+            return rollup
+        log_file.read_log()
+        logger.debug('Rolling up %s', log_file.log_name)
+        rollup = rollup_sessions(log_file.times)
+        rollup['signature'] = log_signature(log_file)
+        self.logs[log_file.log_name] = rollup
+        self.changed = True
+        stats.count('rollup updates')
+        return rollup
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp_path = '%s.%i.tmp' % (self.rollups_path, os.getpid())
+        with open(tmp_path, 'w') as rollups_file:
+            json.dump({'version': ROLLUPS_VERSION, 'logs': self.logs}, rollups_file)
+        os.replace(tmp_path, self.rollups_path)
+        self.changed = False
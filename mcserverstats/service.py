@@ -0,0 +1,212 @@
+"""
+HTTP service answering stats queries from one `LogDirectory` kept in memory.
+
+    GET /totals?from=<date>&to=<date>         online seconds and name of each player, JSON
+    GET /sessions?from=<date>&to=<date>       sessions of each player, JSON
+    GET /timeline.png?from=<date>&to=<date>   timeline image, needs cairo
+    GET /timeline.html?from=<date>&to=<date>  timeline page, needs cairo
+
+Dates are `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS`, both are optional and
+mean the same as for `onlineTimes` and `timelineDay`.
+
+Responses are cached along with the size and mtime of every log they
+were computed from: the logs of the requested days, the log before them,
+whose online players carry over, and `latest.log` if the range reaches
+past the last of those logs. A cached response is used as long as none of those changed.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+import http.server
+import json
+import logging
+import os
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlsplit
+from mcserverstats import logalyzer, stats, timeutils
+
+logger = logging.getLogger('logalyzer')
+
+class BadRequest(Exception):
+    pass
+
+def parse_date(query, key):
+    values = query.get(key)
+    if not values or not values[0]:
+        return None
+    date_str = timeutils.ensure_full_date(values[0])
+    try:
+        timeutils.date_str_to_epoch(date_str)
+    except ValueError:
+        raise BadRequest('invalid %s date: %s' % (key, values[0]))
+    return date_str
+
+class StatsService:
+    """
+    Answers requests for `logs_dir`, see the module docstring.
+
+    :param workers: see `LogDirectory`
+    :param max_responses: number of responses to keep cached, least recently used ones are dropped
+    """
+
+    def __init__(self, logs_dir, workers=None, max_responses=256):
+        self.logs_dir = logs_dir
+        self.workers = workers
+        self.max_responses = max_responses
+        self.logs = None
+        self.log_stats = {}  # log name -> (size, mtime_ns), as of the last request
+        self.responses = OrderedDict()  # request key -> (signature, content type, body)
+        self.lock = threading.Lock()  # the LogDirectory is used by one request at a time
+
+    def scan_logs_dir(self):
+        log_stats = {}
+        for entry in os.scandir(self.logs_dir):
+            if entry.name.endswith('.log.gz') and not entry.name.startswith('.'):
+                log_name = entry.name[:-len('.log.gz')]
+            elif entry.name == 'latest.log':
+                log_name = 'latest'
+            else:
+                continue
+            stat = entry.stat()
+            log_stats[log_name] = (stat.st_size, stat.st_mtime_ns)
+        return log_stats
+
+    def refresh(self):
+        """
+        Brings the `LogDirectory` up to date with the files:
+        it is opened again if any rotated log was added, removed or changed,
+        and forgets `latest.log` if only that changed.
+        """
+        log_stats = self.scan_logs_dir()
+        rotated = lambda all_stats: dict((name, stat) for name, stat in all_stats.items() if name != 'latest')
+        if self.logs is None or rotated(log_stats) != rotated(self.log_stats):
+            logger.info('Opening %s', self.logs_dir)
+            self.logs = logalyzer.LogDirectory(self.logs_dir, self.workers)
+        elif log_stats.get('latest') != self.log_stats.get('latest'):
+            self.logs.forget_latest()
+        self.log_stats = log_stats
+
+    def range_signature(self, from_date, to_date):
+        """Sizes and mtimes of all logs a query from `from_date` to `to_date` reads."""
+        from_day, to_day, inclusive_to = self.logs.date_to_log_day(from_date, to_date)
+        all_logs = self.logs.sorted_log_name_tuples
+        name_tuples = self.logs.iter_log_name_tuples_between(from_day, to_day, inclusive_to)
+        # same condition as in read_interval_iter
+        reads_latest = not to_day or not name_tuples or self.logs.read_last_event(
+            self.logs.log_files[name_tuples[-1]]) < timeutils.date_str_to_epoch(to_day)
+        first = bisect_left(all_logs, name_tuples[0]) if name_tuples else len(all_logs)
+        if first > 0:
+            name_tuples = [all_logs[first - 1]] + name_tuples
+        log_names = [self.logs.join_from_compare(name_tuple) for name_tuple in name_tuples]
+        if reads_latest:
+            log_names.append('latest')
+        return tuple((log_name, self.log_stats.get(log_name)) for log_name in log_names)
+
+    def get(self, path, query):
+        """
+        Returns `content type, body` of the response to `path` with the parsed `query`.
+        Raises `KeyError` for unknown paths and `BadRequest` for invalid queries.
+        """
+        handler = self.handlers[path]
+        from_date, to_date = parse_date(query, 'from'), parse_date(query, 'to')
+        with self.lock:
+            self.refresh()
+            if path.startswith('/timeline') and not from_date:
+                # the 24h before the last log event, like timelineDay
+                from_date = timeutils.add_to_date_str(self.logs.latest_log_date_str(), days=-1)
+            key = path, from_date, to_date
+            signature = self.range_signature(from_date, to_date)
+            cached = self.responses.get(key)
+            if cached is not None and cached[0] == signature:
+                self.responses.move_to_end(key)
+                stats.count('response cache hits')
+                return cached[1:]
+            stats.count('response cache misses')
+            content_type, body = handler(self, from_date, to_date)
+            self.responses[key] = signature, content_type, body
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.max_responses:
+                self.responses.popitem(last=False)
+            return content_type, body
+
+    def totals_json(self, from_date, to_date):
+        totals = self.logs.collect_totals(from_date, to_date)
+        data = dict((uuid, {'seconds': seconds, 'name': name}) for uuid, (seconds, name) in totals.items())
+        return 'application/json', json.dumps(data, sort_keys=True).encode()
+
+    def sessions_json(self, from_date, to_date):
+        user_sessions = self.logs.collect_user_sessions(from_date, to_date)
+        data = dict((uuid, [[t_from, t_to, name] for uuid, t_from, t_to, name in sessions])
+                    for uuid, sessions in user_sessions.items())
+        return 'application/json', json.dumps(data, sort_keys=True).encode()
+
+    def timeline(self, from_date, to_date, suffix):
+        from mcserverstats import timeline  # needs cairo
+        timeline_data = timeline.get_timeline_data(self.logs, from_date, to_date)
+        title = '%s to %s' % (timeutils.human_date_str(from_date),
+                              timeutils.human_date_str(to_date) or 'last activity')
+        with tempfile.TemporaryDirectory() as out_dir:
+            out_path = os.path.join(out_dir, 'timeline' + suffix)
+            if suffix == '.png':
+                timeline.draw_timeline(timeline_data, out_path, title)
+            else:
+                timeline.write_timeline_html_page(timeline_data, out_path, title)
+            with open(out_path, 'rb') as out_file:
+                return out_file.read()
+
+    def timeline_png(self, from_date, to_date):
+        return 'image/png', self.timeline(from_date, to_date, '.png')
+
+    def timeline_html(self, from_date, to_date):
+        return 'text/html; charset=utf-8', self.timeline(from_date, to_date, '.html')
+
+    handlers = {
+        '/totals': totals_json,
+        '/sessions': sessions_json,
+        '/timeline.png': timeline_png,
+        '/timeline.html': timeline_html,
+    }
+
+class StatsRequestHandler(http.server.BaseHTTPRequestHandler):
+    service = None  # StatsService, set by make_server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            self.service.handlers[url.path]
+        except KeyError:
+            return self.send_json_error(404, 'unknown path %s, try one of %s'
+                                        % (url.path, ', '.join(sorted(self.service.handlers))))
+        try:
+            content_type, body = self.service.get(url.path, parse_qs(url.query))
+        except BadRequest as e:
+            return self.send_json_error(400, str(e))
+        except ImportError as e:
+            return self.send_json_error(501, 'timelines need cairo: %s' % e)
+        except Exception as e:
+            logger.exception('Failed to answer %s', self.path)
+            return self.send_json_error(500, '%s: %s' % (type(e).__name__, e))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json_error(self, status, message):
+        body = json.dumps({'error': message}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.info('%s %s', self.address_string(), fmt % args)
+
+def make_server(service, host='127.0.0.1', port=8080):
+    """
+    Returns a `ThreadingHTTPServer` for `service`, call its `serve_forever` to start it.
+    Port 0 picks a free port, see `server.server_address`.
+    """
+    handler = type('BoundStatsRequestHandler', (StatsRequestHandler,), {'service': service})
+    return http.server.ThreadingHTTPServer((host, port), handler)
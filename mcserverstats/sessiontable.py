@@ -0,0 +1,141 @@
+"""
+Compact storage for sessions `[uuid, t_from, t_to, name]`.
+
+A list per session costs well over a hundred bytes: the list itself and
+its two int objects, on top of the strings. A `SessionTable` keeps
+sessions as four array columns instead, UUIDs and names as indices into
+a `StringTable` and times as int64, about 24 bytes per session.
+The logs of a `LogDirectory` share one `StringTable`, so every UUID and
+name is stored once however many sessions it appears in.
+
+Reading a session returns a new list `[uuid, t_from, t_to, name]`, so
+code written for lists of sessions works unchanged, but changing that
+list does not change the table.
+"""
+from array import array
+from collections.abc import Sequence
+
+NONE = -2 ** 63  # stored for `None`, same as in the cache files
+INF = 2 ** 63 - 1  # stored for `float('inf')`, the end of sessions still online
+
+def _to_int(value):
+    if value is None:
+        return NONE
+    if value == float('inf'):
+        return INF
+    return value
+
+def _from_int(value):
+    if value == NONE:
+        return None
+    if value == INF:
+        return float('inf')
+    return value
+
+class StringTable:
+    """Interns strings as small ints, in the order they were first seen."""
+    __slots__ = ('strings', 'ids')
+
+    def __init__(self):
+        self.strings = []  # id -> string
+        self.ids = {}  # string -> id
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+class SessionTable(Sequence):
+    """
+    Sessions `[uuid, t_from, t_to, name]` in array columns, see the module docstring.
+
+    :param sessions: sessions to start with, lists or another `SessionTable`
+    :param strings: `StringTable` to intern UUIDs and names in, a new one if None
+    """
+    __slots__ = ('strings', 'uuid_ids', 't_from', 't_to', 'name_ids')
+
+    def __init__(self, sessions=(), strings=None):
+        self.strings = strings if strings is not None else StringTable()
+        self.uuid_ids = array('I')
+        self.t_from = array('q')
+        self.t_to = array('q')
+        self.name_ids = array('I')
+        self.extend(sessions)
+
+    def append(self, session):
+        uuid, t_from, t_to, name = session
+        self.uuid_ids.append(self.strings.intern(uuid))
+        self.t_from.append(_to_int(t_from))
+        self.t_to.append(_to_int(t_to))
+        self.name_ids.append(self.strings.intern(name))
+
+    def extend(self, sessions):
+        if isinstance(sessions, SessionTable):
+            if sessions.strings is self.strings:
+                self.uuid_ids.extend(sessions.uuid_ids)
+                self.name_ids.extend(sessions.name_ids)
+            else:
+                strings, intern = sessions.strings.strings, self.strings.intern
+                self.uuid_ids.extend(intern(strings[i]) for i in sessions.uuid_ids)
+                self.name_ids.extend(intern(strings[i]) for i in sessions.name_ids)
+            self.t_from.extend(sessions.t_from)
+            self.t_to.extend(sessions.t_to)
+        else:
+            for session in sessions:
+                self.append(session)
+
+    def session(self, i):
+        strings = self.strings.strings
+        return [strings[self.uuid_ids[i]], _from_int(self.t_from[i]),
+                _from_int(self.t_to[i]), strings[self.name_ids[i]]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.select(range(len(self))[i])
+        return self.session(i)
+
+    def __len__(self):
+        return len(self.t_from)
+
+    def __iter__(self):
+        strings = self.strings.strings
+        for uuid_id, t_from, t_to, name_id in zip(self.uuid_ids, self.t_from, self.t_to, self.name_ids):
+            if t_from == NONE or t_to == NONE or t_to == INF:
+                yield [strings[uuid_id], _from_int(t_from), _from_int(t_to), strings[name_id]]
+            else:
+                yield [strings[uuid_id], t_from, t_to, strings[name_id]]
+
+    def __eq__(self, other):
+        if not isinstance(other, (SessionTable, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'SessionTable(%r)' % self.to_lists()
+
+    def select(self, indices):
+        """Returns a new `SessionTable`, sharing the strings, with the sessions at `indices` in that order."""
+        table = SessionTable(strings=self.strings)
+        for column, selected in ((self.uuid_ids, table.uuid_ids), (self.t_from, table.t_from),
+                                 (self.t_to, table.t_to), (self.name_ids, table.name_ids)):
+            selected.extend(map(column.__getitem__, indices))
+        return table
+
+    def to_lists(self):
+        """Returns the sessions as a list of lists, as before there were tables."""
+        return list(self)
+
+    def nbytes(self):
+        """Bytes taken by the columns, not counting the shared strings."""
+        return sum(column.buffer_info()[1] * column.itemsize
+                   for column in (self.uuid_ids, self.t_from, self.t_to, self.name_ids))
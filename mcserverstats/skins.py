@@ -0,0 +1,130 @@
+"""
+Player skins, downloaded once and kept on disk between runs.
+
+Each skin is stored as `<name>.png` in the cache directory. A skin's
+mtime is the time it was downloaded, it is downloaded again once it is
+older than `ttl`. Its atime is set whenever it is used, and when the
+cache grows above `max_bytes`, the least recently used skins are removed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import urlopen
+from mcserverstats import stats
+
+logger = logging.getLogger('logalyzer')
+
+SKIN_URL = 'http://skins.minecraft.net/MinecraftSkins/%s.png'
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'mcserverstats', 'skins')
+
+class SkinCache:
+    """
+    Skins of players by name, as PNG bytes.
+
+    :param skin_url: URL of a skin, `%s` is replaced with the player name
+    :param max_bytes: total size of the cached skins to keep
+    :param ttl: seconds after which a skin is downloaded again
+    :param workers: number of concurrent downloads in `prefetch`
+    """
+
+    def __init__(self, cache_dir=None, skin_url=SKIN_URL, max_bytes=16 << 20, ttl=7 * 24 * 3600,
+                 workers=8, timeout=10):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.skin_url = skin_url
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.workers = workers
+        self.timeout = timeout
+        self.unavailable = set()  # names that could not be downloaded during this run
+        self.lock = threading.Lock()
+
+    def skin_path(self, name):
+        return os.path.join(self.cache_dir, quote(name, safe='') + '.png')
+
+    def get(self, name):
+        """
+        Returns the PNG bytes of the skin of `name`, downloading it if it is
+        not cached or has expired, or None if it is not available.
+        An expired skin is still used if it cannot be downloaded again.
+        """
+        skin_path = self.skin_path(name)
+        skin_bytes = None
+        try:
+            with open(skin_path, 'rb') as skin_file:
+                skin_bytes = skin_file.read()
+            mtime = os.stat(skin_path).st_mtime
+        except (OSError, IOError):
+            mtime = None
+        if skin_bytes is not None and time.time() - mtime < self.ttl:
+            os.utime(skin_path, (time.time(), mtime))  # mark as recently used
+            stats.count('skin cache hits')
+            return skin_bytes
+        downloaded = self.download(name)
+        if downloaded is None and skin_bytes is not None:
+            logger.info('Using expired skin of %s', name)
+            os.utime(skin_path, (time.time(), mtime))
+            return skin_bytes
+        return downloaded
+
+    def download(self, name):
+        """Downloads and stores the skin of `name`, returns its bytes or None."""
+        with self.lock:
+            if name in self.unavailable:
+                return None
+        url = self.skin_url % quote(name)
+        logger.info('Downloading skin of %s', name)
+        stats.count('skin downloads')
+        try:
+            with urlopen(url, timeout=self.timeout) as response:
+                skin_bytes = response.read()
+        except (HTTPError, URLError, OSError) as e:
+            logger.warning('Could not download skin of %s from %s: %s', name, url, e)
+            with self.lock:
+                self.unavailable.add(name)
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        skin_path = self.skin_path(name)
+        tmp_path = '%s.%i.%i.tmp' % (skin_path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as skin_file:
+            skin_file.write(skin_bytes)
+        os.replace(tmp_path, skin_path)
+        return skin_bytes
+
+    def prefetch(self, names):
+        """
+        Gets the skins of all `names` concurrently, then evicts old skins.
+        Returns a dict `name -> PNG bytes or None`.
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        with stats.timer('skin prefetch'), ThreadPoolExecutor(max_workers=self.workers) as executor:
+            skins = dict(zip(names, executor.map(self.get, names)))
+        self.evict()
+        return skins
+
+    def evict(self):
+        """Removes the least recently used skins until the cache fits into `max_bytes`."""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.png')]
+        except (OSError, IOError):
+            return  # nothing cached yet
+        skins = []
+        for entry in entries:
+            stat = entry.stat()
+            skins.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for atime, size, path in skins)
+        for atime, size, path in sorted(skins):
+            if total <= self.max_bytes:
+                break
+            logger.debug('Evicting skin %s', path)
+            os.remove(path)
+            total -= size
+            stats.count('skin evictions')
@@ -0,0 +1,100 @@
+"""
+Layout of a zoomable timeline, as a pyramid of square tiles.
+
+Level 0 fits the whole time range into one tile width, every further
+level doubles the horizontal resolution, up to the level where an hour
+is as wide as on a timeline drawn by `draw_timeline`. Rows keep their
+height on all levels, so a level is `2 ** level` tiles wide and as many
+tiles high as the rows need.
+
+On each level the spans of a row that are less than a pixel apart are
+merged, so no tile ever has more than a few spans per row to draw,
+however long the time range is.
+"""
+from bisect import bisect_right
+import math
+
+TILE_SIZE = 256
+
+def merge_sessions(spans, min_gap):
+    """
+    Merges the spans `(t_from, t_to)`, sorted by their start, that overlap
+    or are less than `min_gap` seconds apart.
+    Returns a list of `[t_from, t_to]`.
+    """
+    merged = []
+    for t_from, t_to in spans:
+        if merged and t_from - merged[-1][1] < min_gap:
+            if t_to > merged[-1][1]:
+                merged[-1][1] = t_to
+        else:
+            merged.append([t_from, t_to])
+    return merged
+
+class TileLayout:
+    """
+    Positions of the spans of `rows` in the tiles of each level.
+
+    :param rows: one list of spans `(t_from, t_to)` per row
+    :param row_height: pixel height of each row
+    :param hour_width: pixel width of an hour on the most detailed level
+    """
+
+    def __init__(self, t_start, t_end, rows, row_height, hour_width=40, tile_size=TILE_SIZE):
+        self.t_start = t_start
+        self.t_end = max(t_end, t_start + 1)
+        self.rows = [sorted(row) for row in rows]
+        self.row_height = row_height
+        self.tile_size = tile_size
+        full_width = (self.t_end - t_start) / 3600 * hour_width
+        self.max_level = max(0, math.ceil(math.log2(full_width / tile_size))) if full_width > tile_size else 0
+        self.tiles_y = max(1, math.ceil(len(rows) * row_height / tile_size))
+        self.merged = {}  # (level, row) -> (merged spans, their ends)
+
+    def tiles_x(self, level):
+        return 2 ** level
+
+    def seconds_per_pixel(self, level):
+        return (self.t_end - self.t_start) / (self.tile_size * self.tiles_x(level))
+
+    def to_pixel(self, level, t):
+        """Horizontal pixel of the epoch `t` on `level`, counted from the first tile."""
+        return (t - self.t_start) / self.seconds_per_pixel(level)
+
+    def spans(self, level, row):
+        """Returns the merged spans of `row` on `level` and a list of their ends."""
+        key = level, row
+        if key not in self.merged:
+            merged = merge_sessions(self.rows[row], self.seconds_per_pixel(level))
+            self.merged[key] = merged, [t_to for t_from, t_to in merged]
+        return self.merged[key]
+
+    def tile_rows(self, tile_y):
+        first = tile_y * self.tile_size // self.row_height
+        end = -(-(tile_y + 1) * self.tile_size // self.row_height)
+        return range(first, min(end, len(self.rows)))
+
+    def tile_spans(self, level, tile_x, tile_y):
+        """Yields `row, t_from, t_to` of all merged spans overlapping the tile."""
+        seconds = self.tile_size * self.seconds_per_pixel(level)
+        t_from = self.t_start + tile_x * seconds
+        t_to = t_from + seconds
+        for row in self.tile_rows(tile_y):
+            merged, ends = self.spans(level, row)
+            for i in range(bisect_right(ends, t_from), len(merged)):
+                if merged[i][0] >= t_to:
+                    break
+                yield row, merged[i][0], merged[i][1]
+
+    def nonempty_tiles(self, level):
+        """Returns the sorted `(tile_x, tile_y)` of all tiles of `level` with any span in them."""
+        last_x = self.tiles_x(level) - 1
+        found = set()
+        for tile_y in range(self.tiles_y):
+            for row in self.tile_rows(tile_y):
+                for t_from, t_to in self.spans(level, row)[0]:
+                    first = int(self.to_pixel(level, t_from) // self.tile_size)
+                    last = int(self.to_pixel(level, t_to) // self.tile_size)
+                    for tile_x in range(max(0, first), min(last, last_x) + 1):
+                        found.add((tile_x, tile_y))
+        return sorted(found)
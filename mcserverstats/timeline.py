@@ -1,6 +1,8 @@
 import base64
-from urllib.request import urlopen
-from mcserverstats import timeutils
+import io
+import json
+import os
+from mcserverstats import skins, stats, tiles, timeutils
 
 try:
     import cairocffi as cairo
@@ -61,6 +63,7 @@ default_settings = {
     'color_f': [1.0, 1.0, 1.0],
 
     'color_from_uuid': color_from_uuid,
+    'batch_drawing': True,
 }
 
 def color_from_char(color_char, settings):
@@ -77,17 +80,39 @@ LEFT = 'left'
 CENTER = 'center'
 RIGHT = 'right'
 
-def fit_text(c, text, max_w):
-    width = lambda: c.text_extents(text)[2]
-    if not max_w or not text or width() <= max_w:
+def text_extents(c, text, extents_cache=None):
+    """
+    `c.text_extents(text)`, memoized in `extents_cache` if given,
+    which must only be used with one font face and size.
+    """
+    if extents_cache is None:
+        return c.text_extents(text)
+    try:
+        return extents_cache[text]
+    except KeyError:
+        extents = extents_cache[text] = c.text_extents(text)
+        return extents
+
+def fit_text(c, text, max_w, extents_cache=None):
+    """
+    Shortens `text` and appends `~` until it is at most `max_w` wide,
+    returns an empty string if not even one character fits.
+    The length is found by binary search over the prefixes.
+    """
+    width = lambda text: text_extents(c, text, extents_cache)[2]
+    if not max_w or not text or width(text) <= max_w:
         return text  # done
     ellipsis = '~'
-    text += ellipsis
-    while width() > max_w and text != ellipsis:
-        text = text[:-2] + ellipsis
-    return text if text != ellipsis else ''
+    fitting, too_long = 0, len(text)  # lengths of prefixes, with ellipsis
+    while too_long - fitting > 1:
+        length = (fitting + too_long) // 2
+        if width(text[:length] + ellipsis) <= max_w:
+            fitting = length
+        else:
+            too_long = length
+    return text[:fitting] + ellipsis if fitting else ''
 
-def draw_text(c, text, color, x_left, y_center, align=LEFT, max_w=None, shadow=None):
+def draw_text(c, text, color, x_left, y_center, align=LEFT, max_w=None, shadow=None, extents_cache=None):
     """
     :param c: cairo drawing context
     :param text: the text to draw
@@ -97,11 +122,12 @@ def draw_text(c, text, color, x_left, y_center, align=LEFT, max_w=None, shadow=N
     :param align: 'left', 'center', 'right'
     :param max_w: maximum width the text might use, set this to 0 for center/right alignment starting from x_left
     :param shadow: tuple of (color, (offset_x, offset_y))
+    :param extents_cache: dict to memoize text extents in, see `text_extents`
     """
-    text = fit_text(c, text, max_w)
+    text = fit_text(c, text, max_w, extents_cache)
     if not text:
         return  # do not draw
-    x_bearing, y_bearing, text_width, text_height, x_advance, y_advance = c.text_extents(text)
+    x_bearing, y_bearing, text_width, text_height, x_advance, y_advance = text_extents(c, text, extents_cache)
     if not max_w:  # set for centering/right aligning
         max_w = 0
     x = x_left - x_bearing
@@ -121,7 +147,7 @@ def draw_text(c, text, color, x_left, y_center, align=LEFT, max_w=None, shadow=N
     c.show_text(text)
     return text_width
 
-def draw_rounded_rect(c, color, x, y, w, h, radius=0, border=None):
+def rounded_rect_path(c, x, y, w, h, radius=0):
     if radius == 0:
         c.rectangle(x, y, w, h)
     else:
@@ -133,6 +159,17 @@ def draw_rounded_rect(c, color, x, y, w, h, radius=0, border=None):
         c.arc(x + radius, y + h - radius, radius, 90 * degrees, 180 * degrees)
         c.arc(x + radius, y + radius, radius, 180 * degrees, 270 * degrees)
         c.close_path()
+
+def draw_rounded_rect(c, color, x, y, w, h, radius=0, border=None):
+    draw_rounded_rects(c, color, [(x, y, w, h)], radius, border)
+
+def draw_rounded_rects(c, color, rects, radius=0, border=None):
+    """
+    Draws all `rects` `(x, y, w, h)` as one path,
+    with a single fill and a single stroke for the border.
+    """
+    for x, y, w, h in rects:
+        rounded_rect_path(c, x, y, w, h, radius)
     c.set_source_rgba(*color)
     if not border:
         c.fill()
@@ -147,14 +184,52 @@ def dark_border(width, color):
     r, g, b = map(lambda c: c / 2, color)
     return width, r, g, b
 
-skin_cache = {}
+skin_cache = {}  # name -> cairo surface of the skin, or None if unavailable
+skin_store = skins.SkinCache()
 hat_rendering_disabled = False
 
+def configure_skins(**kwargs):
+    """Replaces the on-disk skin cache, see `skins.SkinCache` for the arguments."""
+    global skin_store
+    skin_store = skins.SkinCache(**kwargs)
+    skin_cache.clear()
+
+def skin_surface(skin_bytes, name):
+    if skin_bytes is None:
+        return None
+    try:
+        return cairo.ImageSurface.create_from_png(io.BytesIO(skin_bytes))
+    except Exception as e:  # cairo raises its own error types, depending on the binding
+        import sys
+        print('Invalid skin of %s: %s' % (name, e), file=sys.stderr)
+        return None
+
+def prefetch_skins(names):
+    """Downloads the skins of all `names` that are not loaded yet, concurrently."""
+    missing = [name for name in names if name not in skin_cache]
+    for name, skin_bytes in skin_store.prefetch(missing).items():
+        skin_cache[name] = skin_surface(skin_bytes, name)
+
+def draw_placeholder_head(c, x, y, h):
+    c.save()
+    c.translate(x, y)
+    c.scale(h/8, h/8)
+    c.set_source_rgb(0.6, 0.6, 0.6)
+    c.rectangle(0, 0, 8, 8)
+    c.fill()
+    c.set_source_rgb(0.25, 0.25, 0.25)
+    c.rectangle(1, 3, 2, 1)  # eyes
+    c.rectangle(5, 3, 2, 1)
+    c.rectangle(3, 5, 2, 1)  # mouth
+    c.fill()
+    c.restore()
+
 def draw_head(c, x, y, h, name):
     if name not in skin_cache:
-        print('Downloading skin of', name)
-        skin_url = 'http://skins.minecraft.net/MinecraftSkins/%s.png' % name
-        skin_cache[name] = cairo.ImageSurface.create_from_png(urlopen(skin_url))
+        skin_cache[name] = skin_surface(skin_store.get(name), name)
+    if skin_cache[name] is None:
+        draw_placeholder_head(c, x, y, h)
+        return
     c.save()
     c.translate(x, y)
     c.scale(h/8, h/8)
@@ -177,6 +252,16 @@ def draw_head(c, x, y, h, name):
                 copy_8x8_at(40)  # hat
     c.restore()
 
+def draw_session_label(c, s, name, x, y, w, name_horiz_border, extents_cache=None):
+    t_x = x + name_horiz_border
+    h_y = y + s.name_border
+    t_y = h_y + s.name_height / 2
+    if w > s.name_height + 2 * s.name_border:
+        draw_head(c, t_x, h_y, s.name_height, name)
+    draw_text(c, name, s.name_color, t_x, t_y, max_w=w - 2 * name_horiz_border,
+              shadow=(s.name_shadow_color, s.name_shadow_offset), extents_cache=extents_cache)
+
+@stats.timed('render png')
 def draw_timeline(timeline_data, img_path, title='', im_width=None, settings=default_settings, **kwargs):
     """
     /-----border------\
@@ -201,6 +286,7 @@ def draw_timeline(timeline_data, img_path, title='', im_width=None, settings=def
     s = SettingsDict(**settings)
 
     t_start, t_end, lines, uptimes = timeline_data
+    prefetch_skins(session[3] for line in lines for session in line)
     if not im_width:
         im_width = int((t_end - t_start) / 3600 * s.scale_gap)  # TODO
 
@@ -253,31 +339,34 @@ def draw_timeline(timeline_data, img_path, title='', im_width=None, settings=def
                   CENTER, None, shadow=(s.scale_shadow_color, s.scale_shadow_offset))
 
     # draw uptimes
-    for t_from, t_to in uptimes:
-        x = s.border + (t_from - t_start) * h_stretch
-        w = (t_to - t_from) * h_stretch
-        draw_rounded_rect(c, s.uptimes_color, x, scale_box_height,
-                          w, s.uptimes_height,
-                          s.uptimes_height, (2, 0,0,0))
-
-    # draw sessions
+    draw_rounded_rects(c, s.uptimes_color, [(s.border + (t_from - t_start) * h_stretch, scale_box_height,
+                                             (t_to - t_from) * h_stretch, s.uptimes_height)
+                                            for t_from, t_to in uptimes],
+                       s.uptimes_height, (2, 0,0,0))
+
+    # draw sessions: all boxes of one color at once, then heads and names on top
     y_offset = s.border + scale_box_height + s.uptimes_height
     c.set_font_size(s.name_height)
+    boxes = {}  # color -> [(x, y, w, h)]
+    labels = []  # (name, x, y, w)
     for i, line in enumerate(lines):
         y = i * line_box_height + y_offset
         for session in line:
             uuid, t_from, t_to, name = session
-            color = s.color_from_uuid(uuid, settings)
+            color = tuple(s.color_from_uuid(uuid, settings))
             x = s.border + (t_from - t_start) * h_stretch
             w = (t_to - t_from) * h_stretch
-            draw_rounded_rect(c, color, x, y, w, line_height, s.name_radius, dark_border(2, color))
-            t_x = x + name_horiz_border
-            h_y = y + s.name_border
-            t_y = h_y + s.name_height / 2
-            if w > s.name_height + 2 * s.name_border:
-                draw_head(c, t_x, h_y, s.name_height, name)
-            draw_text(c, name, s.name_color, t_x, t_y, max_w=w - 2 * name_horiz_border,
-                      shadow=(s.name_shadow_color, s.name_shadow_offset))
+            if s.batch_drawing:
+                boxes.setdefault(color, []).append((x, y, w, line_height))
+                labels.append((name, x, y, w))
+            else:  # one session after another, only for comparing in benchmarks
+                draw_rounded_rect(c, color, x, y, w, line_height, s.name_radius, dark_border(2, color))
+                draw_session_label(c, s, name, x, y, w, name_horiz_border)
+    for color, rects in boxes.items():
+        draw_rounded_rects(c, color, rects, s.name_radius, dark_border(2, color))
+    extents_cache = {}  # all names have the same font size
+    for name, x, y, w in labels:
+        draw_session_label(c, s, name, x, y, w, name_horiz_border, extents_cache)
 
     # save image
     surface.write_to_png(img_path)
@@ -288,7 +377,6 @@ def surface_to_base64(surface):
     try:
         img_bytes = surface.write_to_png()  # works with newer versions of cairo
     except TypeError:
-        import io
         with io.BytesIO() as sio:
             surface.write_to_png(sio)
             img_bytes = sio.getvalue()
@@ -320,9 +408,35 @@ def player_head_img_base64(name, height=32):
         head_base64_cache[name] = surface_to_base64(surface)
     return head_base64_cache[name]
 
+def head_sprite_base64(names, height=32, columns=16):
+    """
+    Draws the heads of all `names` into one image, `columns` heads per row.
+    Returns the image as base64 data URL, or None if there are no names.
+    """
+    if not names:
+        return None
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, min(len(names), columns) * height,
+                                 -(-len(names) // columns) * height)
+    c = cairo.Context(surface)
+    for i, name in enumerate(names):
+        draw_head(c, i % columns * height, i // columns * height, height, name)
+    return surface_to_base64(surface)
+
 def get_timeline_html(timeline_data, title='', hour_width=30, html_style_players=default_html_style_players):
+    with io.StringIO() as out_file:
+        write_timeline_html(out_file, timeline_data, title, hour_width, html_style_players)
+        return out_file.getvalue()
+
+def write_timeline_html(out_file, timeline_data, title='', hour_width=30,
+                        html_style_players=default_html_style_players, head_height=16, sprite_columns=16):
+    """
+    Writes the HTML timeline to the file object `out_file`, one player row at a time.
+    All heads are drawn into a single sprite sheet, each shown via its CSS offset.
+    """
     t_start, t_end, lines, uptimes = timeline_data
     hour_width = int(hour_width)
+    last_names = [line[-1][-1] for line in lines]
+    prefetch_skins(last_names)
 
     sec_per_hour = 3600
     sec_to_screen = lambda t: t * hour_width / sec_per_hour
@@ -335,23 +449,6 @@ def get_timeline_html(timeline_data, title='', hour_width=30, html_style_players
             'start': start, 'duration': duration - 4,
         }
 
-    template_player_sessions = \
-        '<tr><td class="tl_sessions tl_user_%(name)s">' \
-        '%(sessions)s' \
-        '</td><td><img height="16px" src="%(head_b64)s"/>&nbsp;%(name)s</td></tr>'
-    html_all_player_sessions = []
-    for line in lines:
-        last_name = line[-1][-1]
-        html_sessions = ''
-        for uuid, t_from, t_to, name in line:
-            html_sessions += session_to_html(t_from, t_to)
-        html_all_player_sessions.append(template_player_sessions % {
-            'name': last_name,
-            'sessions': html_sessions,
-            'head_b64': player_head_img_base64(last_name),
-        })
-    html_all_player_sessions = ''.join(html_all_player_sessions)
-
     html_uptimes = ''.join(session_to_html(t_from, t_to) for t_from, t_to in uptimes)
 
     html_hours = []
@@ -366,6 +463,12 @@ def get_timeline_html(timeline_data, title='', hour_width=30, html_style_players
         html_hours.append('<span>%s</span>' % hour_text)
     html_hours = ''.join(html_hours)
 
+    # heads are drawn at twice their size, like the images they replace
+    head_sprite = head_sprite_base64(list(dict.fromkeys(last_names)), 2 * head_height, sprite_columns)
+    head_positions = dict((name, i) for i, name in enumerate(dict.fromkeys(last_names)))
+    columns = min(len(head_positions), sprite_columns)
+    rows = -(-len(head_positions) // sprite_columns)
+
     page_data = {
         'title_text': title,
         'hour_width': hour_width,
@@ -374,11 +477,14 @@ def get_timeline_html(timeline_data, title='', hour_width=30, html_style_players
         'hour_offset': bg_offset - hour_width/2,
         'sessions_width': sec_to_screen(t_end - t_start),
         'style_players': html_style_players,
+        'style_heads': '.tl_head{display:inline-block;width:%ipx;height:%ipx;vertical-align:baseline;'
+                       'background-image:url(%s);background-size:%ipx %ipx}'
+                       % (head_height, head_height, head_sprite, columns * head_height, rows * head_height)
+                       if head_sprite else '',
         'hours': html_hours,
         'uptimes': html_uptimes,
-        'players': html_all_player_sessions,
     }
-    template_timeline = \
+    template_timeline_start = \
         '<style type="text/css">' \
         '.timeline td{margin:0px;padding:0px}' \
         '.timeline span{display:inline-block;overflow:hidden}' \
@@ -388,27 +494,229 @@ def get_timeline_html(timeline_data, title='', hour_width=30, html_style_players
         'border-radius:8px;-moz-border-radius:8px}' \
         '.tl_uptimes span{background-color:#0f0;border-color:black;height:6px;top:5px}' \
         '%(style_players)s' \
+        '%(style_heads)s' \
         '</style><table class="timeline" style="border-collapse:collapse">' \
         '<tr><td class="tl_hours" style="min-width:%(sessions_width).3fpx;padding-left:%(hour_offset).3fpx">' \
         '%(hours)s' \
         '</td><td>Hours</td></tr>' \
         '<tr><td class="tl_uptimes">' \
         '%(uptimes)s' \
-        '</td><td>Server&nbsp;online</td></tr>' \
-        '%(players)s' \
-        '<tr><td colspan=2 align="center" class="tl_title" style="font-size:20px">%(title_text)s</td></tr>' \
-        '</table>'
-    return template_timeline % page_data
+        '</td><td>Server&nbsp;online</td></tr>'
+    out_file.write(template_timeline_start % page_data)
+
+    template_player_start = '<tr><td class="tl_sessions tl_user_%(name)s">'
+    template_player_end = \
+        '</td><td><span class="tl_head" style="background-position:%(head_x)ipx %(head_y)ipx"></span>' \
+        '&nbsp;%(name)s</td></tr>'
+    for line, last_name in zip(lines, last_names):
+        position = head_positions[last_name]
+        out_file.write(template_player_start % {'name': last_name})
+        out_file.write(''.join(session_to_html(t_from, t_to) for uuid, t_from, t_to, name in line))
+        out_file.write(template_player_end % {
+            'name': last_name,
+            'head_x': -(position % sprite_columns) * head_height,
+            'head_y': -(position // sprite_columns) * head_height,
+        })
+
+    out_file.write('<tr><td colspan=2 align="center" class="tl_title" style="font-size:20px">%s</td></tr>'
+                   '</table>' % title)
 
+@stats.timed('render html')
 def write_timeline_html_page(timeline_data, page_path, title='', hour_width=30):
-    html_page = '<html><body style="margin:0px;background-color:#aaa">' \
-                + get_timeline_html(timeline_data, title, hour_width) + \
-                '</body></html>'
     with open(page_path, 'w') as out_file:
-        out_file.write(html_page)
+        out_file.write('<html><body style="margin:0px;background-color:#aaa">')
+        write_timeline_html(out_file, timeline_data, title, hour_width)
+        out_file.write('</body></html>')
+
+########## tiled timeline ##########
 
-def get_timeline_data(logs, from_date=None, to_date=None):
-    lines = list(logs.collect_user_sessions(from_date, to_date).values())
+def draw_tile(layout, lines, level, tile_x, tile_y, s, extents_cache=None):
+    """
+    Draws one tile of `layout`, row 0 being the uptimes and row `i` the sessions of `lines[i-1]`.
+    Returns the cairo surface, or None if the tile is empty.
+    """
+    line_height = 2 * s.name_border + s.name_height
+    name_horiz_border = max(s.name_border, min(s.name_radius, s.name_height / 2 + s.name_border))
+    seconds_per_pixel = layout.seconds_per_pixel(level)
+    surface = c = None
+    for row, t_from, t_to in layout.tile_spans(level, tile_x, tile_y):
+        if c is None:
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, layout.tile_size, layout.tile_size)
+            c = cairo.Context(surface)
+            c.select_font_face(s.font_name)
+            c.set_font_size(s.name_height)
+        # spans are positioned on the whole level, so names crossing tile edges line up
+        x = layout.to_pixel(level, t_from) - tile_x * layout.tile_size
+        w = max(1, (t_to - t_from) / seconds_per_pixel)
+        y = row * layout.row_height - tile_y * layout.tile_size + s.line_border / 2
+        if row == 0:
+            draw_rounded_rect(c, s.uptimes_color, x, y + (line_height - s.uptimes_height) / 2,
+                              w, s.uptimes_height, s.uptimes_height, (2, 0, 0, 0))
+            continue
+        uuid, name = lines[row - 1][-1][0], lines[row - 1][-1][3]
+        color = s.color_from_uuid(uuid, s)
+        draw_rounded_rect(c, color, x, y, w, line_height, s.name_radius, dark_border(2, color))
+        if w > s.name_height + 2 * s.name_border:
+            draw_head(c, x + name_horiz_border, y + s.name_border, s.name_height, name)
+            draw_text(c, name, s.name_color, x + name_horiz_border, y + s.name_border + s.name_height / 2,
+                      max_w=w - 2 * name_horiz_border, shadow=(s.name_shadow_color, s.name_shadow_offset),
+                      extents_cache=extents_cache)
+    return surface
+
+@stats.timed('render tiles')
+def write_timeline_tiles(timeline_data, out_dir, title='', settings=default_settings, **kwargs):
+    """
+    Writes a zoomable timeline to `out_dir`: the tiles of each level
+    as `tiles/<level>/<x>_<y>.png`, leaving out empty ones, and `index.html`,
+    which only loads the tiles in view. See `tiles.TileLayout`.
+    """
+    s = SettingsDict(**dict(settings, **kwargs))
+    t_start, t_end, lines, uptimes = timeline_data
+    prefetch_skins(line[-1][3] for line in lines)
+    rows = [uptimes] + [[(t_from, t_to) for uuid, t_from, t_to, name in line] for line in lines]
+    row_height = s.line_border + 2 * s.name_border + s.name_height
+    layout = tiles.TileLayout(t_start, t_end, rows, row_height, s.scale_gap)
+    extents_cache = {}  # all names have the same font size
+    for level in range(layout.max_level + 1):
+        level_dir = os.path.join(out_dir, 'tiles', str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for tile_x, tile_y in layout.nonempty_tiles(level):
+            surface = draw_tile(layout, lines, level, tile_x, tile_y, s, extents_cache)
+            if surface is not None:
+                surface.write_to_png(os.path.join(level_dir, '%i_%i.png' % (tile_x, tile_y)))
+                stats.count('tiles written')
+    viewer_data = {
+        'title': title,
+        't_start': layout.t_start,
+        't_end': layout.t_end,
+        'max_level': layout.max_level,
+        'tile_size': layout.tile_size,
+        'tiles_y': layout.tiles_y,
+        'row_height': row_height,
+        'rows': ['Server online'] + [line[-1][3] for line in lines],
+        'heads': [''] + [player_head_img_base64(line[-1][3]) for line in lines],
+    }
+    with open(os.path.join(out_dir, 'index.html'), 'w') as out_file:
+        out_file.write(tiles_viewer_template.replace('%(viewer_data)s', json.dumps(viewer_data)))
+    return layout
+
+tiles_viewer_template = \
+    '<html><head><meta charset="utf-8"><style type="text/css">' \
+    'body{margin:0px;background-color:#aaa;font-family:sans-serif}' \
+    '#view{position:absolute;top:0px;bottom:0px;left:0px;right:0px;overflow:auto}' \
+    '#canvas{position:relative}' \
+    '#canvas img.tile{position:absolute}' \
+    '#names,#axis{position:absolute;background-color:rgba(170,170,170,0.9);z-index:1}' \
+    '#names div{position:absolute;white-space:nowrap;overflow:hidden}' \
+    '#axis span{position:absolute;border-left:1px solid black;padding-left:2px;font-size:12px}' \
+    '#corner{position:fixed;top:0px;left:0px;z-index:2;background-color:#aaa}' \
+    '</style></head><body><div id="view"><div id="canvas">' \
+    '<div id="names"></div><div id="axis"></div></div></div>' \
+    '<div id="corner"><button id="zoom_in">+</button><button id="zoom_out">-</button> <b id="title"></b></div>' \
+    '<script>\n' \
+    'var tl = %(viewer_data)s;\n' \
+    'var NAMES_WIDTH = 150, AXIS_HEIGHT = 30;\n' \
+    'var view = document.getElementById("view"), canvas = document.getElementById("canvas");\n' \
+    'var names = document.getElementById("names"), axis = document.getElementById("axis");\n' \
+    'var level = 0, loaded = {};\n' \
+    'document.getElementById("title").textContent = tl.title;\n' \
+    'function secondsPerPixel() { return (tl.t_end - tl.t_start) / (tl.tile_size * Math.pow(2, level)); }\n' \
+    'function setLevel(newLevel, centerX) {\n' \
+    '  newLevel = Math.max(0, Math.min(tl.max_level, newLevel));\n' \
+    '  if (centerX === undefined) centerX = (view.clientWidth - NAMES_WIDTH) / 2;\n' \
+    '  var t = tl.t_start + (view.scrollLeft + centerX) * secondsPerPixel();\n' \
+    '  level = newLevel;\n' \
+    '  Array.prototype.slice.call(canvas.querySelectorAll("img.tile")).forEach(function(img) { canvas.removeChild(img); });\n' \
+    '  loaded = {};\n' \
+    '  canvas.style.width = NAMES_WIDTH + tl.tile_size * Math.pow(2, level) + "px";\n' \
+    '  canvas.style.height = AXIS_HEIGHT + tl.row_height * tl.rows.length + "px";\n' \
+    '  view.scrollLeft = (t - tl.t_start) / secondsPerPixel() - centerX;\n' \
+    '  update();\n' \
+    '}\n' \
+    'function update() {\n' \
+    '  var size = tl.tile_size, left = view.scrollLeft, top = view.scrollTop;\n' \
+    '  names.style.left = left + "px";\n' \
+    '  axis.style.top = top + "px";\n' \
+    '  var lastX = Math.min(Math.pow(2, level) - 1, Math.floor((left + view.clientWidth - NAMES_WIDTH) / size));\n' \
+    '  var lastY = Math.min(tl.tiles_y - 1, Math.floor((top + view.clientHeight - AXIS_HEIGHT) / size));\n' \
+    '  for (var x = Math.floor(left / size); x <= lastX; x++) {\n' \
+    '    for (var y = Math.floor(top / size); y <= lastY; y++) {\n' \
+    '      if (loaded[x + "_" + y]) continue;\n' \
+    '      loaded[x + "_" + y] = true;\n' \
+    '      var img = document.createElement("img");\n' \
+    '      img.className = "tile";\n' \
+    '      img.onerror = function() { this.style.display = "none"; };  // empty tiles are not written\n' \
+    '      img.style.left = NAMES_WIDTH + x * size + "px";\n' \
+    '      img.style.top = AXIS_HEIGHT + y * size + "px";\n' \
+    '      img.src = "tiles/" + level + "/" + x + "_" + y + ".png";\n' \
+    '      canvas.insertBefore(img, names);\n' \
+    '    }\n' \
+    '  }\n' \
+    '  drawAxis(left, left + view.clientWidth - NAMES_WIDTH);\n' \
+    '}\n' \
+    'function drawAxis(fromX, toX) {\n' \
+    '  var spp = secondsPerPixel(), steps = [1, 2, 3, 6, 12, 24, 48, 168, 336, 672, 1344, 2688, 8736];\n' \
+    '  var step = steps.filter(function(hours) { return hours * 3600 / spp >= 60; })[0] || steps[steps.length - 1];\n' \
+    '  var html = [], t = Math.ceil((tl.t_start + fromX * spp) / 3600) * 3600, tTo = tl.t_start + toX * spp;\n' \
+    '  for (; t < tTo; t += 3600) {\n' \
+    '    var date = new Date(t * 1000), hour = date.getHours();\n' \
+    '    var day = Math.round((date.getTime() / 1000 - date.getTimezoneOffset() * 60) / 86400);\n' \
+    '    if (step < 24 ? hour % step : hour || (day - 4) % (step / 24)) continue;\n' \
+    '    var label = step < 24 ? hour + ":00" : date.getFullYear() + "-" + (date.getMonth() + 1) + "-" + date.getDate();\n' \
+    '    html.push("<span style=\\"left:" + (NAMES_WIDTH + (t - tl.t_start) / spp) + "px\\">" + label + "</span>");\n' \
+    '  }\n' \
+    '  axis.innerHTML = html.join("");\n' \
+    '}\n' \
+    'names.style.top = AXIS_HEIGHT + "px";\n' \
+    'names.style.width = NAMES_WIDTH + "px";\n' \
+    'names.style.height = tl.row_height * tl.rows.length + "px";\n' \
+    'axis.style.left = "0px";\n' \
+    'axis.style.width = "100%";\n' \
+    'axis.style.height = AXIS_HEIGHT + "px";\n' \
+    'tl.rows.forEach(function(name, row) {\n' \
+    '  var div = document.createElement("div");\n' \
+    '  div.style.top = row * tl.row_height + "px";\n' \
+    '  div.style.lineHeight = tl.row_height + "px";\n' \
+    '  if (tl.heads[row]) { var head = document.createElement("img"); head.src = tl.heads[row]; head.height = 16; div.appendChild(head); }\n' \
+    '  div.appendChild(document.createTextNode(" " + name));\n' \
+    '  names.appendChild(div);\n' \
+    '});\n' \
+    'view.addEventListener("scroll", update);\n' \
+    'window.addEventListener("resize", update);\n' \
+    'view.addEventListener("wheel", function(e) {\n' \
+    '  if (!e.ctrlKey) return;\n' \
+    '  e.preventDefault();\n' \
+    '  setLevel(level + (e.deltaY < 0 ? 1 : -1), e.clientX - NAMES_WIDTH);\n' \
+    '});\n' \
+    'document.getElementById("zoom_in").onclick = function() { setLevel(level + 1); };\n' \
+    'document.getElementById("zoom_out").onclick = function() { setLevel(level - 1); };\n' \
+    'setLevel(0);\n' \
+    '</script></body></html>'
+
+def write_timeline(timeline_data, out_path, title=''):
+    """
+    Writes a PNG or HTML timeline, depending on the extension of `out_path`,
+    or tiles if it is a directory or ends in a slash.
+    """
+    out_type = out_path.lower().rsplit('.', 1)[-1]
+    if out_path.endswith(('/', os.sep)) or os.path.isdir(out_path):
+        write_timeline_tiles(timeline_data, out_path, title)
+    elif out_type in ('html', 'htm'):
+        write_timeline_html_page(timeline_data, out_path, title)
+    elif out_type == 'png':
+        draw_timeline(timeline_data, out_path, title)
+    else:
+        raise ValueError('Unknown output type %s' % out_type)
+
+@stats.timed('timeline data')
+def get_timeline_data(logs, from_date=None, to_date=None, whitelist=None):
+    """
+    Returns `t_start, t_end, lines, uptimes` to draw a timeline of,
+    `lines` being the sessions of each player, only of the UUIDs in `whitelist` if set.
+    `logs` can be anything with the queries of a `LogDirectory`,
+    like a `ServerNetwork` or a `batch.SessionSnapshot`.
+    """
+    lines = list(logs.collect_user_sessions(from_date, to_date, whitelist=whitelist).values())
     uptimes = list(logs.collect_uptimes(from_date, to_date))
     t_start = int(min(uptimes[0][0] if uptimes else float('inf'),
                       timeutils.date_str_to_epoch(from_date) \
@@ -13,6 +13,43 @@ def date_str_to_epoch(date_str, time_str=midnight_str):
     epoch = int(time.mktime(time.strptime(date_str, date_str_fmt)))
     return epoch
 
+class DayClock:
+    """
+    Converts `HH:MM:SS` times of one day to epoch seconds,
+    giving the same results as `date_str_to_epoch(day_str, time_str)`.
+
+    On days without a DST transition the time is added to the
+    midnight epoch, which is only computed once.
+    Days with a transition fall back to `date_str_to_epoch`.
+    Results are memoized per time string.
+    """
+
+    def __init__(self, day_str):
+        self.day_str = day_str
+        self.midnight = date_str_to_epoch(day_str)
+        next_midnight = date_str_to_epoch(add_to_date_str(day_str, days=1))
+        self.uniform = next_midnight - self.midnight == 24 * 3600
+        self.cache = {}
+
+    def to_epoch(self, time_str):
+        try:
+            return self.cache[time_str]
+        except KeyError:
+            pass
+        epoch = None
+        if self.uniform:
+            try:
+                hours, minutes, seconds = map(int, time_str.split(':'))
+            except ValueError:
+                pass  # let strptime raise or handle unusual formats
+            else:
+                if 0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60:
+                    epoch = self.midnight + hours * 3600 + minutes * 60 + seconds
+        if epoch is None:
+            epoch = date_str_to_epoch(self.day_str, time_str)
+        self.cache[time_str] = epoch
+        return epoch
+
 def epoch_to_date_str(epoch, fmt=date_str_fmt):
     date_str = time.strftime(fmt, time.localtime(epoch))
     return date_str
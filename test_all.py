@@ -1,8 +1,31 @@
+import asyncio
+import base64
 import glob
+import gzip
+import http.server
+import io
+import json
 import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
+import urllib.request
 import yaml
-from mcserverstats import logalyzer, timeutils
+from mcserverstats import aio, batch, intervals, logalyzer, logcache, logindex, loggen, network, service, sessiontable, \
+    skins, stats, tiles, timeutils
+try:
+    from mcserverstats import punchcard
+except ImportError:
+    punchcard = None  # needs numpy
+try:
+    from mcserverstats import timeline
+except ImportError:
+    timeline = None  # needs cairo
 
 UUID_HHL = '808e727f-895a-4ac2-b246-4b6da2ca9451'
 UUID_ULEXOS = 'a1d94087-e9c0-412f-b90f-cff2c224d44f'
@@ -16,6 +39,30 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(1426114800, timeutils.date_str_to_epoch('2015-03-12', '00:00:00'))
         self.assertEqual(1426119001, timeutils.date_str_to_epoch('2015-03-12 01:10:01'))
 
+    def test_day_clock(self):
+        clock = timeutils.DayClock('2015-03-12')
+        self.assertEqual(1426114800, clock.to_epoch('00:00:00'))
+        self.assertEqual(1426119001, clock.to_epoch('01:10:01'))
+        self.assertEqual(1426119001, clock.to_epoch('01:10:01'))  # memoized
+
+    def test_day_clock_dst(self):
+        old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Berlin'
+        time.tzset()
+        try:
+            for day_str in ('2015-03-28', '2015-03-29', '2015-03-30', '2015-10-25', '2015-10-26'):
+                clock = timeutils.DayClock(day_str)
+                for seconds in range(0, 24 * 3600, 59):
+                    time_str = '%02i:%02i:%02i' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+                    self.assertEqual(timeutils.date_str_to_epoch(day_str, time_str),
+                                     clock.to_epoch(time_str), day_str + ' ' + time_str)
+        finally:
+            if old_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = old_tz
+            time.tzset()
+
     def test_epoch_to_date_str(self):
         self.assertEqual('2015-03-12 00:00:00', timeutils.epoch_to_date_str(1426114800))
         self.assertEqual('2015-03-12 00:00:09', timeutils.epoch_to_date_str(1426114809))
@@ -32,6 +79,68 @@ class TestUtils(unittest.TestCase):
         self.assertEqual('2015-03-14 01:02:03', timeutils.add_to_date_str('2015-03-12 05:02:03', days=2, hours=-4))
 
 
+class TestDispatcher(unittest.TestCase):
+
+    def test_literal_prefix(self):
+        self.assertEqual('[Server thread/INFO]: ', logalyzer.literal_prefix('^\\[Server thread/INFO\\]: (.*)$'))
+        self.assertEqual('ab', logalyzer.literal_prefix('abc?'))
+        self.assertEqual('', logalyzer.literal_prefix('ab|cd'))
+        self.assertEqual('', logalyzer.literal_prefix('(?i)abc'))
+
+    def test_same_as_sequential(self):
+        dispatcher = logalyzer.action_dispatcher()
+        count = 0
+        for log_path in glob.iglob('test_logs/*.log'):
+            with open(log_path, 'rb') as log_file:
+                for line in log_file:
+                    line_after_time = line.decode('latin_1')[11:]
+                    expected = None
+                    for regex, action in logalyzer.log_actions:
+                        match = regex.match(line_after_time)
+                        if match:
+                            expected = action, match.groups()
+                            break
+                    self.assertEqual(expected, dispatcher.match(line_after_time), line)
+                    count += expected is not None
+        self.assertLess(0, count, 'No actions matched')
+
+    def test_custom_actions(self):
+        def found_a(log_file, line_nr, seconds, x): pass
+        def found_b(log_file, line_nr, seconds): pass
+        actions = [(re.compile('^a(\\d)$'), found_a), (re.compile('^a|b'), found_b)]
+        dispatcher = logalyzer.ActionDispatcher(actions)
+        self.assertIsNone(dispatcher.prefixes)
+        self.assertEqual((found_a, ('1',)), dispatcher.match('a1'))
+        self.assertEqual((found_b, ()), dispatcher.match('ax'))
+        self.assertEqual((found_b, ()), dispatcher.match('b'))
+        self.assertIsNone(dispatcher.match('c'))
+
+
+class TestScanner(unittest.TestCase):
+
+    def test_block_same_as_lines(self):
+        lines = []
+        for log_path in sorted(glob.iglob('test_logs/*.log')):
+            with open(log_path, 'rb') as log_file:
+                lines.extend(line if line.endswith(b'\n') else line + b'\n' for line in log_file)
+        lines += [b'[12:00:00] [Server thread/INFO]: [@: Set block]\n', b'no timestamp\n', b'\n',
+                  b'[12:00:01] [Server thread/INFO]: \xe4\xf6 lost connection: Disconnected\n',
+                  b'[12:00:02] [Server thread/INFO]: Stopping server\n']
+        rand = random.Random(42)
+        for i in range(20):
+            rand.shuffle(lines)
+            by_line = logalyzer.LogScanner('2015-01-04')
+            for line in lines:
+                by_line.feed(line)
+            by_block = logalyzer.LogScanner('2015-01-04')
+            split = rand.randrange(len(lines))
+            by_block.feed_block(b''.join(lines[:split]))
+            by_block.feed_block(b''.join(lines[split:]))
+            for attr in ('started', 'first_event', 'last_event', 'line_no', 'events'):
+                self.assertEqual(getattr(by_line, attr), getattr(by_block, attr), attr)
+        self.assertLess(0, len(by_line.events), 'No actions matched')
+
+
 class TestYaml(unittest.TestCase):
 
     def test_compare_yaml(self):
@@ -39,15 +148,67 @@ class TestYaml(unittest.TestCase):
         count = 0
         for expected_path in glob.iglob('test_logs/*.expected.yaml'):
             with open(expected_path, 'r') as expected_file:
-                expected_data = yaml.load(expected_file)
-            log_path = expected_path.replace('expected', 'log')
-            with open(log_path, 'r') as log_file:
-                real_data = yaml.load(log_file)
-            log_name = os.path.split(log_path)[1]
+                expected_data = yaml.safe_load(expected_file)
+            cache_path = expected_path.replace('expected.yaml', 'log.bin')
+            real_data, meta = logcache.read_cache(cache_path)
+            log_name = os.path.split(cache_path)[1]
             self.assertDictEqual(expected_data, real_data, log_name)
             count += 1
         self.assertEqual(4, count, 'Not all .expected.yaml were read')
 
+    def test_migrate_yaml(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            expected_data = logalyzer.LogDirectory(logs_dir).collect_data()
+            for log_file in logalyzer.LogDirectory(logs_dir).read_interval_iter():
+                log_file.write_yaml()
+            for cache_path in glob.glob(logs_dir + '/*.log.bin'):
+                os.remove(cache_path)
+            logs = logalyzer.LogDirectory(logs_dir)
+            self.assertFalse(any(log_file.needs_convert() for log_file in logs.log_files.values()
+                                 if log_file.log_name != 'latest'))
+            self.assertEqual(expected_data, logs.collect_data())
+            self.assertEqual(4, len(glob.glob(logs_dir + '/*.log.bin')))
+
+
+class TestLogCache(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = {
+            'started': True, 'stopped': None, 'first_event': 10, 'last_event': None,
+            'online': {'notch': [UUID_HHL, 11, 2], 'jeb_': ['jeb_', None, 1]},
+            'times': [[UUID_HHL, 1, 2, 'HHL'], [UUID_ULEXOS, None, 5, 'Ulexos'], [UUID_HHL, 6, 7, 'HHL_']],
+            'deaths': [[UUID_HHL, 3, 'was slain by Zombie', 'HHL']],
+            'advancements': [[UUID_ULEXOS, 4, 'Stone Age', 'Ulexos'], [UUID_HHL, 4, 'Stone Age', 'HHL']],
+            'chat': {'HHL': [UUID_HHL, 5, 12]},
+        }
+        buf = io.BytesIO()
+        logcache.dump(data, buf, {'answer': 42})
+        buf.seek(0)
+        self.assertEqual((data, {'answer': 42}), logcache.load(buf))
+
+    def test_bad_format(self):
+        self.assertRaises(logcache.CacheFormatError, logcache.load, io.BytesIO(b'started: true'))
+        buf = io.BytesIO()
+        logcache.dump({}, buf)
+        self.assertRaises(logcache.CacheFormatError, logcache.load, io.BytesIO(buf.getvalue()[:-3]))
+
+    def test_corrupt(self):
+        buf = io.BytesIO()
+        logcache.dump({'started': True, 'online': {'HHL': [UUID_HHL, 11, 1]}, 'times': [[UUID_HHL, 1, 2, 'HHL']],
+                       'chat': {'HHL': [UUID_HHL, 5, 12]}}, buf, {'answer': 42})
+        cache_bytes = buf.getvalue()
+        # cut short by whole rows, or longer than written
+        for broken in (cache_bytes[:-8], cache_bytes[:-32], cache_bytes + b'\0' * 8):
+            self.assertRaises(logcache.CacheFormatError, logcache.load, io.BytesIO(broken))
+        for pos in range(logcache.HEADER.size, len(cache_bytes)):
+            broken = bytearray(cache_bytes)
+            broken[pos] ^= 0xff
+            try:
+                logcache.load(io.BytesIO(bytes(broken)))
+            except logcache.CacheFormatError:
+                pass
+
 
 class TestSessions(unittest.TestCase):
 
@@ -216,5 +377,1119 @@ class TestSessions(unittest.TestCase):
         self.assertDictEqual({}, user_sessions)
 
 
+def copy_test_logs(logs_dir):
+    for log_path in glob.glob('test_logs/*.log.gz') + ['test_logs/latest.log']:
+        shutil.copy2(log_path, logs_dir)
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_same_as_sequential(self):
+        with tempfile.TemporaryDirectory() as seq_dir, tempfile.TemporaryDirectory() as par_dir:
+            copy_test_logs(seq_dir)
+            copy_test_logs(par_dir)
+            seq_data = logalyzer.LogDirectory(seq_dir).collect_data()
+            par_logs = logalyzer.LogDirectory(par_dir, workers=2)
+            par_data = par_logs.collect_data()
+            self.assertEqual(seq_data, par_data)
+            converted = sorted(os.path.basename(p) for p in glob.glob(seq_dir + '/*.log.bin'))
+            self.assertEqual(4, len(converted))
+            for name in converted:
+                with open(os.path.join(seq_dir, name), 'rb') as seq_file, \
+                        open(os.path.join(par_dir, name), 'rb') as par_file:
+                    self.assertEqual(seq_file.read(), par_file.read(), name)
+            self.assertTrue(all(log_file.pending_scan is None
+                                for log_file in par_logs.log_files.values()))
+
+
+class TestLogIndex(unittest.TestCase):
+
+    def test_same_as_files(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            expected = logalyzer.LogDirectory(logs_dir).collect_data(None, '2015-01-04 05:00:00')
+            expected_sessions = logalyzer.LogDirectory(logs_dir).collect_user_sessions()
+            expected_uptimes = list(logalyzer.LogDirectory(logs_dir).collect_uptimes(None, '2015-01-04'))
+
+            logs = logalyzer.LogDirectory(logs_dir, index=True)
+            self.assertEqual(expected, logs.collect_data(None, '2015-01-04 05:00:00'))
+            logs.index.close()
+
+            # the index alone is enough, no log needs to be read or converted again
+            for cache_path in glob.glob(logs_dir + '/*.log.bin'):
+                os.remove(cache_path)
+            logs = logalyzer.LogDirectory(logs_dir, index=True)
+            self.assertEqual(expected, logs.collect_data(None, '2015-01-04 05:00:00'))
+            self.assertEqual(expected_uptimes, list(logs.collect_uptimes(None, '2015-01-04')))
+            self.assertEqual(expected_sessions, logs.collect_user_sessions())
+            self.assertEqual([], glob.glob(logs_dir + '/*.log.bin'))
+            logs.index.close()
+
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logs = logalyzer.LogDirectory(logs_dir)
+            index = logindex.LogIndex(os.path.join(logs_dir, logindex.INDEX_NAME))
+            self.assertEqual(4, len(index.update(logs)))
+            self.assertEqual([], index.update(logalyzer.LogDirectory(logs_dir)))
+
+            changed_path = os.path.join(logs_dir, '2015-01-04-1.log.gz')
+            os.utime(changed_path, (0, 0))
+            os.remove(os.path.join(logs_dir, '2015-01-04-2.log.gz'))
+            self.assertEqual(['2015-01-04-1'], index.update(logalyzer.LogDirectory(logs_dir)))
+            names = [name for name, in index.db.execute('SELECT log_name FROM logs ORDER BY log_key')]
+            self.assertEqual(['2015-01-01-1', '2015-01-02-1', '2015-01-04-1'], names)
+            index.close()
+
+
+class TestStaleCache(unittest.TestCase):
+
+    def replace_log(self, logs_dir, log_name, old, new):
+        with open('test_logs/%s.log' % log_name, 'rb') as log_file:
+            log_bytes = log_file.read()
+        self.assertIn(old, log_bytes)
+        with gzip.open(os.path.join(logs_dir, log_name + '.log.gz'), 'wb') as log_file:
+            log_file.write(log_bytes.replace(old, new))
+
+    def assert_same_as_fresh(self, logs_dir, logs):
+        with tempfile.TemporaryDirectory() as fresh_dir:
+            for log_path in glob.glob(logs_dir + '/*.log.gz') + [logs_dir + '/latest.log']:
+                shutil.copy2(log_path, fresh_dir)
+            fresh = logalyzer.LogDirectory(fresh_dir)
+            self.assertEqual(fresh.collect_data(), logs.collect_data())
+            self.assertEqual(fresh.collect_user_sessions(), logs.collect_user_sessions())
+
+    def test_unchanged(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            self.assertEqual(4, len(logalyzer.LogDirectory(logs_dir).refresh_stale()))
+            self.assertEqual([], logalyzer.LogDirectory(logs_dir).refresh_stale())
+
+            # same content, only the mtime changed
+            log_path = os.path.join(logs_dir, '2015-01-02-1.log.gz')
+            os.utime(log_path, (0, 0))
+            self.assertEqual([], logalyzer.LogDirectory(logs_dir).refresh_stale())
+            data, meta = logcache.read_cache(os.path.join(logs_dir, '2015-01-02-1.log.bin'))
+            self.assertEqual(0, meta['source']['mtime'])
+            self.assertEqual('2015-01-01-1', meta['prev_log'])
+
+    def test_replaced_log(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logalyzer.LogDirectory(logs_dir).collect_data()
+
+            # HHL leaves an hour earlier, the same players are online at the end
+            self.replace_log(logs_dir, '2015-01-02-1', b'[04:00:00]', b'[03:00:00]')
+            logs = logalyzer.LogDirectory(logs_dir)
+            self.assertEqual(['2015-01-02-1'], logs.refresh_stale())
+            self.assert_same_as_fresh(logs_dir, logs)
+
+            # Offlinegott joins later, and is still online in the following logs
+            self.replace_log(logs_dir, '2015-01-01-1', b'[08:00:00] [Server thread/INFO]: Offlinegott[',
+                             b'[08:30:00] [Server thread/INFO]: Offlinegott[')
+            logs = logalyzer.LogDirectory(logs_dir)
+            self.assertEqual(['2015-01-01-1', '2015-01-02-1', '2015-01-04-1', '2015-01-04-2'], logs.refresh_stale())
+            self.assert_same_as_fresh(logs_dir, logs)
+
+    def test_queries_convert_stale_logs(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logalyzer.LogDirectory(logs_dir).collect_data()
+            self.replace_log(logs_dir, '2015-01-01-1', b'[08:00:00] [Server thread/INFO]: Offlinegott[',
+                             b'[08:30:00] [Server thread/INFO]: Offlinegott[')
+            for workers in (None, 2):
+                self.assert_same_as_fresh(logs_dir, logalyzer.LogDirectory(logs_dir, workers))
+
+    def test_parser_version(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            expected = logalyzer.LogDirectory(logs_dir).collect_data()
+            parser_version = logalyzer.PARSER_VERSION
+            logalyzer.PARSER_VERSION += 1
+            try:
+                logs = logalyzer.LogDirectory(logs_dir)
+                self.assertTrue(all(logs.log_files[name_tuple].needs_convert()
+                                    for name_tuple in logs.sorted_log_name_tuples))
+                self.assertEqual(expected, logs.collect_data())
+                self.assertEqual([], logalyzer.LogDirectory(logs_dir).refresh_stale())
+            finally:
+                logalyzer.PARSER_VERSION = parser_version
+            self.assertEqual(4, len(logalyzer.LogDirectory(logs_dir).refresh_stale()))
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logalyzer.LogDirectory(logs_dir, index=True).index.close()
+            index = logindex.LogIndex(os.path.join(logs_dir, logindex.INDEX_NAME))
+
+            self.replace_log(logs_dir, '2015-01-02-1', b'[04:00:00]', b'[03:00:00]')
+            self.assertEqual(['2015-01-02-1'], index.update(logalyzer.LogDirectory(logs_dir)))
+            self.replace_log(logs_dir, '2015-01-01-1', b'[08:00:00] [Server thread/INFO]: Offlinegott[',
+                             b'[08:30:00] [Server thread/INFO]: Offlinegott[')
+            self.assertEqual(['2015-01-01-1', '2015-01-02-1', '2015-01-04-1', '2015-01-04-2'],
+                             index.update(logalyzer.LogDirectory(logs_dir)))
+            index.close()
+
+            logs = logalyzer.LogDirectory(logs_dir, index=True)
+            self.assert_same_as_fresh(logs_dir, logs)
+            logs.index.close()
+
+
+class TestLatestCheckpoint(unittest.TestCase):
+
+    LATEST_MTIME = 1420398000  # 2015-01-04 20:00:00
+
+    def append_latest(self, logs_dir, text):
+        latest_path = os.path.join(logs_dir, 'latest.log')
+        with open(latest_path, 'ab') as latest_file:
+            latest_file.write(text.encode('latin_1'))
+        os.utime(latest_path, (self.LATEST_MTIME, self.LATEST_MTIME))
+
+    def collect(self, logs_dir):
+        offsets = []
+        scan_log = logalyzer.scan_log
+
+        def recording_scan_log(source_path, day_str, log_name=None, offset=0, line_no=0):
+            if log_name == 'latest':
+                offsets.append(offset)
+            return scan_log(source_path, day_str, log_name, offset, line_no)
+
+        logalyzer.scan_log = recording_scan_log
+        try:
+            data = logalyzer.LogDirectory(logs_dir).collect_data()
+        finally:
+            logalyzer.scan_log = scan_log
+        return data, offsets
+
+    def full_parse(self, logs_dir):
+        os.remove(os.path.join(logs_dir, 'latest.log.checkpoint'))
+        data, offsets = self.collect(logs_dir)
+        self.assertEqual([0], offsets)
+        return data
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            with open(os.path.join(logs_dir, 'latest.log'), 'rb') as latest_file:
+                latest_size = latest_file.read().rindex(b'\n') + 1  # last line is incomplete
+            data, offsets = self.collect(logs_dir)
+            self.assertEqual([0], offsets)
+            data, offsets = self.collect(logs_dir)
+            self.assertEqual([latest_size], offsets)
+
+            self.append_latest(logs_dir, '\n[17:00:00] [User Authenticator #9/INFO]: UUID of player HHL is %s\n'
+                                         '[17:00:00] [Server thread/INFO]: HHL[/1.2.3.4:5] logged in with'
+                                         ' entity id 1 at (0.5, 64.0, 0.5)\n'
+                                         '[18:00:00] [Server thread/INFO]: Ulexos lost conn' % UUID_HHL)
+            data, offsets = self.collect(logs_dir)
+            self.assertEqual([latest_size], offsets)
+            self.assertEqual(self.full_parse(logs_dir), data)
+            self.assertIn('Ulexos', data[1])
+
+            # complete the partial line
+            self.append_latest(logs_dir, 'ection: Disconnected\n')
+            data, offsets = self.collect(logs_dir)
+            self.assertEqual(1, len(offsets))
+            self.assertLess(latest_size, offsets[0])
+            self.assertEqual(self.full_parse(logs_dir), data)
+            self.assertEqual({'HHL': [UUID_HHL, 1420387200, 1]}, data[1])
+            self.assertIn([UUID_ULEXOS, 1420380000, 1420390800, 'Ulexos'], data[0])
+
+    def test_forget_latest(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logs = logalyzer.LogDirectory(logs_dir)
+            expected = logs.collect_data()
+            logs.forget_latest()
+            offsets = []
+            scan_log = logalyzer.scan_log
+
+            def recording_scan_log(source_path, day_str, log_name=None, offset=0, line_no=0):
+                if log_name == 'latest':
+                    offsets.append(offset)
+                return scan_log(source_path, day_str, log_name, offset, line_no)
+
+            logalyzer.scan_log = recording_scan_log
+            try:
+                self.assertEqual(expected, logs.collect_data())
+            finally:
+                logalyzer.scan_log = scan_log
+            self.assertEqual(1, len(offsets))
+            self.assertLess(0, offsets[0])  # resumed from the checkpoint
+
+    def test_rotated(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            self.collect(logs_dir)
+            latest_path = os.path.join(logs_dir, 'latest.log')
+            with open(latest_path, 'rb') as latest_file:
+                lines = latest_file.readlines()
+            os.remove(latest_path)
+            self.append_latest(logs_dir, b''.join(lines[:-2]).decode('latin_1'))
+            data, offsets = self.collect(logs_dir)
+            self.assertEqual([0], offsets)
+            self.assertEqual(self.full_parse(logs_dir), data)
+
+
+class TestFollow(unittest.TestCase):
+
+    def write_latest(self, logs_dir, text, mode='ab', mtime=TestLatestCheckpoint.LATEST_MTIME):
+        latest_path = os.path.join(logs_dir, 'latest.log')
+        with open(latest_path, mode) as latest_file:
+            latest_file.write(text.encode('latin_1'))
+        os.utime(latest_path, (mtime, mtime))
+
+    def test_follow(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            follower = logalyzer.LogDirectory(logs_dir).follow(poll_interval=0.01)
+            events = iter(follower)
+            self.assertEqual({'Ulexos': [UUID_ULEXOS, 1420380000, 1]}, follower.online)
+
+            self.write_latest(logs_dir, '\n[17:00:00] [User Authenticator #9/INFO]: UUID of player HHL is %s\n'
+                                        '[17:00:00] [Server thread/INFO]: HHL[/1.2.3.4:5] logged in with'
+                                        ' entity id 1 at (0.5, 64.0, 0.5)\n'
+                                        '[17:30:00] [Server thread/INFO]: Ulexos lost conn' % UUID_HHL)
+            event = next(events)
+            self.assertEqual(('uuid', 'HHL', UUID_HHL), (event.kind, event.name, event.uuid))
+            event = next(events)
+            self.assertEqual(('join', 1420387200, 'HHL', UUID_HHL, 1), event[:1] + event[3:])
+            self.assertIn('HHL', follower.online)
+
+            self.write_latest(logs_dir, 'ection: Disconnected\n')
+            event = next(events)
+            self.assertEqual(('leave', 1420389000, 'Ulexos', UUID_ULEXOS), event[:1] + event[3:6])
+            self.assertEqual({'HHL': [UUID_HHL, 1420387200, 1]}, follower.online)
+
+            # rotation, the server crashed and got restarted the next day
+            latest_path = os.path.join(logs_dir, 'latest.log')
+            with open(latest_path, 'rb') as latest_file, \
+                    gzip.open(os.path.join(logs_dir, '2015-01-04-3.log.gz'), 'wb') as gz_file:
+                gz_file.write(latest_file.read())
+            os.remove(latest_path)
+            self.write_latest(logs_dir, '[10:00:00] [Server thread/INFO]: Starting minecraft server version 1.8.3\n'
+                                        '[10:05:00] [Server thread/INFO]: Gjum[/1.2.3.4:5] logged in with'
+                                        ' entity id 2 at (0.5, 64.0, 0.5)\n',
+                              mtime=TestLatestCheckpoint.LATEST_MTIME + 24 * 3600)
+            event = next(events)
+            self.assertEqual(('leave', 1420389000, 'HHL', UUID_HHL, 'Server Crash'), event[:1] + event[3:])
+            self.assertEqual('start', next(events).kind)
+            event = next(events)
+            self.assertEqual(('join', 1420448700, 'Gjum', 'Gjum'), event[:1] + event[3:6])
+            self.assertEqual({'Gjum': ['Gjum', 1420448700, 1]}, follower.online)
+            follower.close()
+
+
+class TestIntervals(unittest.TestCase):
+
+    def test_overlapping(self):
+        rand = random.Random(42)
+        sessions = []
+        for i in range(500):
+            t_from = rand.randrange(0, 100000)
+            sessions.append(['uuid%i' % (i % 7), t_from, t_from + rand.choice((10, 100, 5000)), 'name'])
+        sessions.append(['open', 50000, float('inf'), 'open'])
+        index = intervals.SessionIntervalIndex(sessions)
+        for i in range(100):
+            t_from = rand.randrange(-1000, 110000)
+            t_to = t_from + rand.randrange(1, 20000)
+            expected = [s for s in sessions if s[1] < t_to and s[2] > t_from]
+            self.assertEqual(expected, index.overlapping(t_from, t_to))
+        self.assertEqual(sessions, index.overlapping(float('-inf'), float('inf')))
+        self.assertEqual([], intervals.SessionIntervalIndex([]).overlapping(0, 10))
+        table_index = intervals.SessionIntervalIndex(sessiontable.SessionTable(sessions))
+        for t_from, t_to in ((-1000, 0), (20000, 30000), (49000, 51000), (float('-inf'), float('inf'))):
+            self.assertEqual(index.overlapping(t_from, t_to), table_index.overlapping(t_from, t_to))
+
+
+class TestSessionTable(unittest.TestCase):
+
+    def test_compatible_with_lists(self):
+        sessions = [['uuid1', 100, 200, 'one'], ['uuid2', 150, float('inf'), 'two'],
+                    ['uuid1', 300, 400, 'uno'], ['uuid1', None, 500, 'one']]
+        table = sessiontable.SessionTable(sessions)
+        self.assertEqual(sessions, table.to_lists())
+        self.assertEqual(sessions, table)
+        self.assertEqual(4, len(table))
+        self.assertEqual(['uuid1', 300, 400, 'uno'], table[2])
+        self.assertEqual(['uuid1', None, 500, 'one'], table[-1])
+        self.assertEqual(sessions[1:3], table[1:3].to_lists())
+        self.assertEqual(['uuid1', 'one', 'uuid2', 'two', 'uno'], table.strings.strings)
+        for (uuid, t_from, t_to, name), session in zip(table, sessions):
+            self.assertEqual(session, [uuid, t_from, t_to, name])
+
+    def test_extend(self):
+        strings = sessiontable.StringTable()
+        first = sessiontable.SessionTable([['uuid1', 1, 2, 'one']], strings)
+        shared = sessiontable.SessionTable([['uuid2', 3, 4, 'two']], strings)
+        other = sessiontable.SessionTable([['uuid3', 5, 6, 'three'], ['uuid1', 7, 8, 'one']])
+        first.extend(shared)
+        first.extend(other)
+        first.append(['uuid2', 9, 10, 'two'])
+        self.assertEqual([['uuid1', 1, 2, 'one'], ['uuid2', 3, 4, 'two'], ['uuid3', 5, 6, 'three'],
+                          ['uuid1', 7, 8, 'one'], ['uuid2', 9, 10, 'two']], first)
+        self.assertEqual(['uuid1', 'one', 'uuid2', 'two', 'uuid3', 'three'], strings.strings)
+
+    def test_log_files_share_strings(self):
+        logs = logalyzer.LogDirectory('test_logs')
+        table, online = logs.collect_session_table()
+        self.assertEqual(logs.collect_data(), (table.to_lists(), online))
+        for log_file in logs.log_files.created.values():
+            self.assertIs(logs.strings, log_file.times.strings)
+        with self.assertRaises(AttributeError):
+            logs.log_files['latest'].unknown_attribute = True
+
+
+class TestLazyDirectory(unittest.TestCase):
+
+    def test_names_between(self):
+        logs = logalyzer.LogDirectory('test_logs')
+        days = ['2014-12-31', '2015-01-01', '2015-01-02', '2015-01-03', '2015-01-04', '2015-01-05', None]
+        for from_log in days:
+            for to_log in days:
+                for inclusive_to in (False, True):
+                    expected = logs.sorted_log_name_tuples
+                    if from_log is not None:
+                        from_split = logs.split_for_compare(from_log)
+                        expected = [log for log in expected if from_split <= log[:3]]
+                    if to_log is not None:
+                        to_split = logs.split_for_compare(to_log)
+                        expected = [log for log in expected
+                                    if log[:3] < to_split or inclusive_to and log[:3] == to_split]
+                    self.assertEqual(expected, list(logs.iter_log_name_tuples_between(from_log, to_log, inclusive_to)))
+
+    def test_lazy_log_files(self):
+        logs = logalyzer.LogDirectory('test_logs')
+        self.assertEqual({}, logs.log_files.created)
+        log_file = logs.log_files[(2015, 1, 4, 1)]
+        self.assertEqual(1, len(logs.log_files.created))
+        self.assertEqual('2015-01-02-1', log_file.prev_log.log_name)
+        self.assertIs(log_file, logs.log_files['latest'].prev_log.prev_log)
+        self.assertIsNone(logs.log_files[(2015, 1, 1, 1)].prev_log)
+        self.assertNotIn((2015, 1, 3, 1), logs.log_files)
+        self.assertEqual(list(logs.sorted_log_name_tuples) + ['latest'], list(logs.log_files))
+
+    def test_session_indexes_bounded(self):
+        logs = logalyzer.LogDirectory('test_logs', max_session_indexes=2)
+        first = logs.session_index('2015-01-01', '2015-01-02')
+        logs.session_index('2015-01-02', '2015-01-04')
+        self.assertIs(first, logs.session_index('2015-01-01', '2015-01-02'))
+        logs.session_index('2015-01-04', '2015-01-05')
+        self.assertEqual([logs.date_to_log_day('2015-01-01', '2015-01-02'),
+                          logs.date_to_log_day('2015-01-04', '2015-01-05')], list(logs.session_indexes))
+
+
+class TestLogGen(unittest.TestCase):
+
+    def test_generated_logs(self):
+        with tempfile.TemporaryDirectory() as logs_dir, tempfile.TemporaryDirectory() as other_dir:
+            generator = loggen.LogGenerator(players=8, days=4, rotations=3, crash_chance=0.3,
+                                            double_join_chance=0.2, noise_per_event=3, seed=1)
+            log_names = generator.write(logs_dir)
+            self.assertEqual(log_names, loggen.generate_logs(other_dir, players=8, days=4, rotations=3, crash_chance=0.3,
+                                                             double_join_chance=0.2, noise_per_event=3, seed=1))
+            for log_name in log_names[:-1]:
+                with open(os.path.join(logs_dir, log_name + '.log.gz'), 'rb') as log_file, \
+                        open(os.path.join(other_dir, log_name + '.log.gz'), 'rb') as other_file:
+                    self.assertEqual(gzip.decompress(log_file.read()), gzip.decompress(other_file.read()))
+            self.assertEqual(12, len(log_names))
+            self.assertEqual('latest', log_names[-1])
+
+            logs = logalyzer.LogDirectory(logs_dir)
+            sessions = logs.collect_user_sessions()
+            self.assertLess(0, sum(len(user_sessions) for user_sessions in sessions.values()))
+            for user_sessions in sessions.values():
+                for uuid, t_from, t_to, name in user_sessions:
+                    self.assertLessEqual(t_from, t_to)
+            self.assertEqual(set(generator.online), set(logs.log_files['latest'].online))
+
+
+class TestPlayerEvents(unittest.TestCase):
+
+    def test_actions(self):
+        dispatcher = logalyzer.action_dispatcher()
+
+        def match(line):
+            found = dispatcher.match(line)
+            return found and (found[0].__name__,) + tuple(found[1])
+
+        self.assertEqual(('found_death', 'HHL', 'was slain by Zombie'),
+                         match('[Server thread/INFO]: HHL was slain by Zombie'))
+        self.assertEqual(('found_death', 'HHL', 'drowned'), match('[Server thread/INFO]: HHL drowned'))
+        self.assertEqual(('found_advancement', 'HHL', 'Diamonds!'),
+                         match('[Server thread/INFO]: HHL has made the advancement [Diamonds!]'))
+        self.assertEqual(('found_advancement', 'HHL', 'Taking Inventory'),
+                         match('[Server thread/INFO]: HHL has just earned the achievement [Taking Inventory]'))
+        self.assertEqual(('found_chat', 'HHL'), match('[Server thread/INFO]: <HHL> I was slain by a zombie'))
+        self.assertEqual(('found_chat', 'HHL'), match('[Server thread/INFO]: [Not Secure] <HHL> hi'))
+        self.assertEqual(('found_chat', 'HHL'), match('[Async Chat Thread - #3/INFO]: <HHL> hi'))
+        self.assertIsNone(match('[Server thread/INFO]: [Server] crash, was still on: XXX'))
+        self.assertIsNone(match('[Server thread/INFO]: HHL was kicked for floating too long!'))
+
+    def test_generated_events(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            generator = loggen.LogGenerator(players=8, days=3, rotations=2, noise_per_event=10, seed=2)
+            generator.write(logs_dir)
+            logs = logalyzer.LogDirectory(logs_dir)
+            deaths = logs.collect_deaths()
+            self.assertLess(0, sum(generator.deaths.values()))
+            self.assertEqual(generator.deaths, dict((name, count) for count, name in deaths.values()))
+            advancements = logs.collect_advancements()
+            self.assertEqual(generator.advancements,
+                             dict((user_advancements[0][2], [advancement for seconds, advancement, name in user_advancements])
+                                  for user_advancements in advancements.values()))
+            activity = logs.collect_last_activity()
+            self.assertEqual(generator.messages, dict((name, messages) for last_active, last_chat, messages, name
+                                                      in activity.values() if messages))
+            for last_active, last_chat, messages, name in activity.values():
+                self.assertTrue(last_chat is None or last_chat <= last_active)
+
+            # the events of a day are cropped to it, and survive loading the converted logs
+            day_deaths = logs.collect_deaths('2015-01-02', '2015-01-03')
+            self.assertEqual(day_deaths, logalyzer.LogDirectory(logs_dir).collect_deaths('2015-01-02', '2015-01-03'))
+            day_start, day_end = timeutils.date_str_to_epoch('2015-01-02'), timeutils.date_str_to_epoch('2015-01-03')
+            self.assertEqual(sum(1 for uuid, seconds, message, name in logs.iter_player_events('deaths')
+                                 if day_start <= seconds < day_end),
+                             sum(count for count, name in day_deaths.values()))
+
+
+class TestStats(unittest.TestCase):
+
+    def tearDown(self):
+        stats.enable(False)
+        stats.reset()
+
+    def test_disabled(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logalyzer.LogDirectory(logs_dir).collect_user_sessions()
+        self.assertEqual({'counters': {}, 'timers': {}}, logalyzer.LogDirectory.get_stats())
+
+    def test_counters(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logalyzer.LogDirectory.enable_stats()
+            logalyzer.LogDirectory(logs_dir).collect_user_sessions()
+            logalyzer.LogDirectory(logs_dir).collect_user_sessions()
+            recorded = logalyzer.LogDirectory.get_stats()
+        counters = recorded['counters']
+        self.assertEqual(6, counters['logs scanned'])  # all logs, then the rest of latest.log
+        self.assertEqual(4, counters['cache hits'])
+        self.assertEqual(9, counters['lines matched: found_join'])
+        self.assertEqual(sum(os.path.getsize(path) for path in glob.glob('test_logs/2*.log')),
+                         counters['bytes decompressed'])
+        self.assertEqual(2, recorded['timers']['collect sessions']['calls'])
+        self.assertEqual(6, recorded['timers']['scan']['calls'])
+
+
+class TestRollups(unittest.TestCase):
+
+    def summed_sessions(self, logs_dir, from_date, to_date):
+        totals = {}
+        for uuid, sessions in logalyzer.LogDirectory(logs_dir).collect_user_sessions(from_date, to_date).items():
+            totals[uuid] = [sum(t_to - t_from for uuid, t_from, t_to, name in sessions), sessions[-1][3]]
+        return totals
+
+    def test_same_as_sessions(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            # spans the change to summer time
+            loggen.generate_logs(logs_dir, players=6, days=10, rotations=2, crash_chance=0.3,
+                                 start_day='2015-03-24', seed=2)
+            logalyzer.LogDirectory(logs_dir).collect_data()  # convert all logs
+            ranges = [(None, None), ('2015-03-26', None), (None, '2015-03-30'), ('2015-03-28', '2015-03-31'),
+                      ('2015-03-29 01:30:00', '2015-03-29 04:00:00'), ('2015-03-25 12:34:56', '2015-03-30 07:00:00'),
+                      ('2015-03-31 18:00:00', None)]
+            for from_date, to_date in ranges:
+                expected = self.summed_sessions(logs_dir, from_date, to_date)
+                self.assertEqual(expected, logalyzer.LogDirectory(logs_dir).collect_totals(from_date, to_date),
+                                 (from_date, to_date))
+            self.assertTrue(os.path.isfile(os.path.join(logs_dir, 'rollups.json')))
+
+    def test_reconverted_log(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            expected = self.summed_sessions(logs_dir, None, None)
+            self.assertEqual(expected, logalyzer.LogDirectory(logs_dir).collect_totals())
+
+            # HHL leaves an hour earlier
+            with open('test_logs/2015-01-02-1.log', 'rb') as log_file:
+                log_bytes = log_file.read().replace(b'[04:00:00]', b'[03:00:00]')
+            with gzip.open(os.path.join(logs_dir, '2015-01-02-1.log.gz'), 'wb') as log_file:
+                log_file.write(log_bytes)
+            os.remove(os.path.join(logs_dir, '2015-01-02-1.log.bin'))
+            totals = logalyzer.LogDirectory(logs_dir).collect_totals()
+            hhl = '808e727f-895a-4ac2-b246-4b6da2ca9451'
+            self.assertEqual(expected[hhl][0] - 3600, totals[hhl][0])
+            self.assertEqual(self.summed_sessions(logs_dir, None, None), totals)
+
+    def test_replaced_log(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            ranged = logalyzer.LogDirectory(logs_dir).collect_totals('2015-01-01', '2015-01-04 12:00:00')
+            expected = self.summed_sessions(logs_dir, None, None)
+            self.assertEqual(expected, logalyzer.LogDirectory(logs_dir).collect_totals())
+
+            # HHL leaves an hour earlier, the cache of the log is left in place
+            with open('test_logs/2015-01-02-1.log', 'rb') as log_file:
+                log_bytes = log_file.read().replace(b'[04:00:00]', b'[03:00:00]')
+            with gzip.open(os.path.join(logs_dir, '2015-01-02-1.log.gz'), 'wb') as log_file:
+                log_file.write(log_bytes)
+            hhl = '808e727f-895a-4ac2-b246-4b6da2ca9451'
+            totals = logalyzer.LogDirectory(logs_dir).collect_totals('2015-01-01', '2015-01-04 12:00:00')
+            self.assertEqual(ranged[hhl][0] - 3600, totals[hhl][0])
+            totals = logalyzer.LogDirectory(logs_dir).collect_totals()
+            self.assertEqual(expected[hhl][0] - 3600, totals[hhl][0])
+            self.assertEqual(self.summed_sessions(logs_dir, None, None), totals)
+
+
+@unittest.skipIf(punchcard is None, 'needs numpy')
+class TestPunchcard(unittest.TestCase):
+
+    def setUp(self):
+        self.old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Berlin'
+        time.tzset()
+
+    def tearDown(self):
+        if self.old_tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.old_tz
+        time.tzset()
+
+    def hour_pieces(self, sessions):
+        """Yields `uuid, local datetime, seconds` for every piece of a session in one local hour."""
+        for uuid, t_from, t_to, name in sessions:
+            local_from = t_from + time.localtime(t_from).tm_gmtoff
+            local_to = t_to + time.localtime(t_to).tm_gmtoff
+            while local_from < local_to:
+                piece_to = min(local_to, (local_from // 3600 + 1) * 3600)
+                yield uuid, time.gmtime(local_from), piece_to - local_from
+                local_from = piece_to
+
+    def test_same_as_loops(self):
+        rand = random.Random(3)
+        t_start = timeutils.date_str_to_epoch('2015-03-20')  # spans the change to summer time
+        sessions = []
+        for i in range(500):
+            uuid = 'uuid%i' % rand.randrange(8)
+            t_from = t_start + rand.randrange(30 * 24 * 3600)
+            length = rand.choice((rand.randrange(7200), rand.randrange(3 * 24 * 3600), rand.randrange(20 * 24 * 3600)))
+            sessions.append([uuid, t_from, t_from + length, 'name%i' % i])
+        activity = punchcard.compute_activity(sessions)
+
+        expected = {}  # uuid -> weekday -> hour -> seconds
+        expected_days = {}  # day_str -> uuids
+        for uuid, local_time, seconds in self.hour_pieces(sessions):
+            hours = expected.setdefault(uuid, [[0] * 24 for weekday in range(7)])
+            hours[local_time.tm_wday][local_time.tm_hour] += seconds
+            expected_days.setdefault(time.strftime('%Y-%m-%d', local_time), set()).add(uuid)
+        for uuid, player_seconds in zip(activity['uuids'], activity['player_seconds'].tolist()):
+            self.assertEqual(expected[uuid], player_seconds, uuid)
+        self.assertEqual(sum(sum(map(sum, hours)) for hours in expected.values()),
+                         activity['server_seconds'].sum())
+        daily_active = dict((str(day), count) for day, count
+                            in zip(activity['days'], activity['daily_active'].tolist()) if count)
+        self.assertEqual(dict((day_str, len(uuids)) for day_str, uuids in expected_days.items()), daily_active)
+        last_names = dict((session[0], session[3]) for session in sorted(sessions, key=lambda session: session[1]))
+        self.assertEqual([last_names[uuid] for uuid in activity['uuids']], activity['names'])
+
+    def test_log_directory(self):
+        activity = punchcard.collect_activity(logalyzer.LogDirectory('test_logs'), '2015-01-01', '2015-01-05')
+        self.assertEqual(['2015-01-01', '2015-01-02', '2015-01-03', '2015-01-04'], [str(day) for day in activity['days']])
+        self.assertEqual(3, len(activity['uuids']))
+        totals = logalyzer.LogDirectory('test_logs').collect_totals('2015-01-01', '2015-01-05')
+        for uuid, seconds in zip(activity['uuids'], activity['player_seconds'].sum(axis=(1, 2)).tolist()):
+            self.assertEqual(totals[uuid][0], seconds)
+
+        rows = punchcard.punchcard_rows(activity['average_online'])
+        self.assertEqual(8, len(rows))
+        self.assertEqual(['Monday'], rows[1][:1])
+        self.assertEqual(25, len(rows[7]))
+
+    def test_range_wider_than_sessions(self):
+        # two whole weeks, Monday to Monday, the test logs only span a few days of the first
+        activity = punchcard.collect_activity(logalyzer.LogDirectory('test_logs'), '2014-12-29', '2015-01-12')
+        self.assertEqual((activity['server_seconds'] / (2 * 3600)).tolist(), activity['average_online'].tolist())
+
+    def test_empty(self):
+        activity = punchcard.compute_activity([])
+        self.assertEqual([], activity['uuids'])
+        self.assertEqual((7, 24), activity['average_online'].shape)
+        self.assertEqual(0, len(activity['daily_active']))
+
+
+class TestSkins(unittest.TestCase):
+
+    def setUp(self):
+        self.skins = dict(('Player%i' % i, b'skin%i' % i + b'.' * 1000) for i in range(20))
+        self.requests = []
+        test = self
+
+        class SkinHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.rsplit('/', 1)[-1][:-len('.png')]
+                test.requests.append(name)
+                if name not in test.skins:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(test.skins[name])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SkinHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.skin_url = 'http://127.0.0.1:%i/skins/%%s.png' % self.server.server_address[1]
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def skin_cache(self, **kwargs):
+        return skins.SkinCache(self.cache_dir, skin_url=self.skin_url, **kwargs)
+
+    def test_prefetch_and_reuse(self):
+        names = sorted(self.skins) + ['Unknown']
+        fetched = self.skin_cache().prefetch(names + names)
+        self.assertEqual(self.skins, dict((name, fetched[name]) for name in self.skins))
+        self.assertIsNone(fetched['Unknown'])
+        self.assertEqual(sorted(names), sorted(self.requests))
+
+        # a new run reads the skins from disk
+        self.requests.clear()
+        self.assertEqual(self.skins['Player3'], self.skin_cache().get('Player3'))
+        self.assertEqual([], self.requests)
+
+    def test_ttl(self):
+        self.skin_cache().get('Player1')
+        self.skins['Player1'] = b'new skin'
+        self.assertNotEqual(b'new skin', self.skin_cache().get('Player1'))
+        self.assertEqual(b'new skin', self.skin_cache(ttl=0).get('Player1'))
+
+        # expired skins are still used when the server has none
+        del self.skins['Player1']
+        self.assertEqual(b'new skin', self.skin_cache(ttl=0).get('Player1'))
+
+    def test_evict_least_recently_used(self):
+        cache = self.skin_cache(max_bytes=5500)
+        for i, name in enumerate(['Player0', 'Player1', 'Player2', 'Player3', 'Player4']):
+            cache.get(name)
+            os.utime(cache.skin_path(name), (1000 + i, time.time()))
+        os.utime(cache.skin_path('Player0'), (2000, time.time()))  # used most recently
+        cache.prefetch(['Player5'])
+        self.assertEqual(['Player0.png', 'Player2.png', 'Player3.png', 'Player4.png', 'Player5.png'],
+                         sorted(os.listdir(self.cache_dir)))
+
+
+class RecordingContext:
+    """Stands in for a cairo context, text is 7px per character, `i` 3px, `W` 12px and `~` 5px."""
+
+    def __init__(self):
+        self.calls = []
+        self.measured = []
+
+    def text_extents(self, text):
+        self.measured.append(text)
+        width = sum({'i': 3, 'W': 12, '~': 5}.get(char, 7) for char in text)
+        return 0, -8, width, 10, width, 0
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append(name)
+
+
+@unittest.skipIf(timeline is None, 'needs cairo')
+class TestTimelineDrawing(unittest.TestCase):
+
+    @staticmethod
+    def linear_fit_text(c, text, max_w):
+        """`fit_text` before it used binary search"""
+        width = lambda: c.text_extents(text)[2]
+        if not max_w or not text or width() <= max_w:
+            return text
+        text += '~'
+        while width() > max_w and text != '~':
+            text = text[:-2] + '~'
+        return text if text != '~' else ''
+
+    def test_fit_text(self):
+        c = RecordingContext()
+        for text in ('', 'i', 'W', 'HHL', 'Offlinegott', 'WiWiWiWiWi', 'iiiiiiiiiiiiiiiiWWW'):
+            for max_w in [None] + list(range(0, 140)):
+                expected = self.linear_fit_text(c, text, max_w)
+                self.assertEqual(expected, timeline.fit_text(c, text, max_w), (text, max_w))
+                self.assertEqual(expected, timeline.fit_text(c, text, max_w, {}), (text, max_w))
+        self.assertEqual('Offlinegott', timeline.fit_text(c, 'Offlinegott', 73))  # just fits
+        self.assertEqual('Offli~', timeline.fit_text(c, 'Offlinegott', 40))
+        self.assertEqual('', timeline.fit_text(c, 'Offlinegott', 11))  # not even one character fits
+
+        # the cache is only filled once per text
+        extents_cache = {}
+        c.measured.clear()
+        for i in range(3):
+            timeline.fit_text(c, 'Offlinegott', 40, extents_cache)
+        self.assertEqual(len(c.measured), len(set(c.measured)))
+
+    def test_draw_rounded_rects(self):
+        c = RecordingContext()
+        timeline.draw_rounded_rects(c, (1, 0, 0), [(0, 0, 10, 10), (20, 0, 10, 10), (40, 0, 10, 10)], 3, (2, 0, 0, 0))
+        self.assertEqual(1, c.calls.count('fill_preserve'))
+        self.assertEqual(1, c.calls.count('stroke'))
+        self.assertEqual(3, c.calls.count('close_path'))
+        c = RecordingContext()
+        timeline.draw_rounded_rects(c, (1, 0, 0), [(0, 0, 10, 10), (20, 0, 10, 10)])
+        self.assertEqual(['rectangle', 'rectangle', 'set_source_rgba', 'fill'], c.calls)
+
+
+@unittest.skipIf(timeline is None, 'needs cairo')
+class TestTimelineHtml(unittest.TestCase):
+
+    def setUp(self):
+        self.skin_store = timeline.skin_store
+        self.cache_dir = tempfile.mkdtemp()
+        # nothing listens there, all players get the placeholder head
+        timeline.configure_skins(cache_dir=self.cache_dir, skin_url='http://127.0.0.1:1/%s.png')
+        self.timeline_data = timeline.get_timeline_data(logalyzer.LogDirectory('test_logs'),
+                                                        '2015-01-01', '2015-01-05')
+
+    def tearDown(self):
+        timeline.skin_store = self.skin_store
+        timeline.skin_cache.clear()
+        shutil.rmtree(self.cache_dir)
+
+    @staticmethod
+    def png_size(data_url):
+        png_bytes = base64.b64decode(data_url[len('data:image/png;base64,'):])
+        return int.from_bytes(png_bytes[16:20], 'big'), int.from_bytes(png_bytes[20:24], 'big')
+
+    def test_same_as_not_streamed(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            page_path = os.path.join(out_dir, 'timeline.html')
+            timeline.write_timeline_html_page(self.timeline_data, page_path, 'Title')
+            with open(page_path) as page_file:
+                page = page_file.read()
+        self.assertEqual('<html><body style="margin:0px;background-color:#aaa">'
+                         + timeline.get_timeline_html(self.timeline_data, 'Title') + '</body></html>', page)
+
+    def test_head_sprite(self):
+        out_file = io.StringIO()
+        timeline.write_timeline_html(out_file, self.timeline_data, head_height=16, sprite_columns=2)
+        html = out_file.getvalue()
+        names = [line[-1][3] for line in self.timeline_data[2]]
+        self.assertEqual(3, len(names))
+        offsets = re.findall(r'tl_user_(\w+)">.*?background-position:(-?\d+)px (-?\d+)px', html)
+        self.assertEqual([(name, str(-(i % 2) * 16), str(-(i // 2) * 16)) for i, name in enumerate(names)], offsets)
+        self.assertIn('background-size:32px 32px', html)
+
+        sprite = timeline.head_sprite_base64(names, 32, 2)
+        self.assertEqual((64, 64), self.png_size(sprite))
+        self.assertIn('url(%s)' % sprite, html)
+        self.assertEqual((96, 32), self.png_size(timeline.head_sprite_base64(names, 32, 16)))
+        self.assertIsNone(timeline.head_sprite_base64([]))
+
+
+class TestTiles(unittest.TestCase):
+
+    def test_merge_sessions(self):
+        self.assertEqual([[0, 20], [25, 30]], tiles.merge_sessions([(0, 10), (10.5, 20), (25, 30), (26, 27)], 1))
+        self.assertEqual([[0, 10], [10.5, 20]], tiles.merge_sessions([(0, 10), (10.5, 20)], 0.5))
+        self.assertEqual([], tiles.merge_sessions([], 10))
+
+    def test_layout(self):
+        rand = random.Random(4)
+        t_start = 1420070400
+        rows = []
+        for row in range(20):
+            starts = sorted(rand.randrange(t_start, t_start + 28 * 24 * 3600) for i in range(200))
+            rows.append([(t_from, t_from + rand.randrange(1, 3600)) for t_from in starts])
+        layout = tiles.TileLayout(t_start, t_start + 28 * 24 * 3600, rows, row_height=40, hour_width=40)
+        self.assertEqual(7, layout.max_level)  # 28 days * 24 hours * 40px fit into 2**7 tiles
+        self.assertLessEqual(layout.seconds_per_pixel(layout.max_level), 3600 / 40)
+        self.assertEqual(4, layout.tiles_y)
+        self.assertEqual(range(6, 13), layout.tile_rows(1))
+
+        previous_spans = 0
+        for level in range(layout.max_level + 1):
+            spans = set()
+            found_tiles = set(layout.nonempty_tiles(level))
+            for tile_x, tile_y in found_tiles:
+                tile_spans = list(layout.tile_spans(level, tile_x, tile_y))
+                self.assertLessEqual(len(tile_spans), 7 * layout.tile_size)  # at most one per pixel and row
+                spans.update(tile_spans)
+            # every merged span is in some tile, and the tiles cover the original spans
+            merged = set((row, t_from, t_to) for row in range(len(rows)) for t_from, t_to in layout.spans(level, row)[0])
+            self.assertEqual(merged, spans)
+            for row, t_from, t_to in spans:
+                self.assertTrue(all(t_to <= span_from or span_to <= t_from or t_from <= span_from and span_to <= t_to
+                                    for span_from, span_to in rows[row]))
+            self.assertGreaterEqual(len(spans), previous_spans)
+            previous_spans = len(spans)
+        finest = layout.seconds_per_pixel(layout.max_level)
+        self.assertEqual(sum(len(tiles.merge_sessions(row, finest)) for row in rows), previous_spans)
+
+
+class TestNetwork(unittest.TestCase):
+
+    def test_union_sessions(self):
+        sessions = [['u', 50, 60, 'b'], ['u', 0, 10, 'a'], ['u', 10, 20, 'a'], ['u', 15, 18, 'c'], ['u', 30, 40, 'd']]
+        self.assertEqual([['u', 0, 20, 'c'], ['u', 30, 40, 'd'], ['u', 50, 60, 'b']], network.union_sessions(sessions))
+
+    def test_server_names(self):
+        servers = network.ServerNetwork(['/srv/lobby/logs', '/srv/survival', '/backup/lobby/logs/'], workers=None)
+        self.assertEqual(['lobby', 'survival', 'lobby-2'], list(servers.servers))
+        self.assertEqual(['a', 'b'], network.split_logs_dirs('a%sb%s' % (os.pathsep, os.pathsep)))
+
+    def test_same_players_on_two_servers(self):
+        with tempfile.TemporaryDirectory() as lobby_dir, tempfile.TemporaryDirectory() as survival_dir:
+            copy_test_logs(lobby_dir)
+            copy_test_logs(survival_dir)
+            single = logalyzer.LogDirectory('test_logs')
+            expected_sessions = dict((uuid, network.union_sessions(sessions))
+                                     for uuid, sessions in single.collect_user_sessions().items())
+            expected_totals = single.collect_totals()
+            for workers in (None, 2):
+                with network.ServerNetwork([lobby_dir, survival_dir], workers) as servers:
+                    # the same sessions on both servers are only counted once
+                    self.assertEqual(expected_sessions, servers.collect_user_sessions())
+                    self.assertEqual(expected_totals, servers.collect_totals())
+                    server_totals = servers.collect_server_totals()
+                    self.assertEqual([expected_totals, expected_totals], list(server_totals.values()))
+                    self.assertEqual(list(single.collect_uptimes()), list(servers.collect_uptimes()))
+                    online = servers.online_players()
+                    self.assertEqual(sorted(player[0] for player in online.values()),
+                                     sorted(single.log_files['latest'].online))
+                    self.assertTrue(all(len(player[2]) == 2 for player in online.values()))
+
+    def test_online_counts(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            servers = network.ServerNetwork([logs_dir, 'test_logs'], workers=None)
+            counts = servers.online_counts('2015-01-01', '2015-01-03')
+            self.assertEqual(0, counts[-1][1])
+            self.assertTrue(all(count >= 0 for t, count in counts))
+            self.assertEqual(sorted(counts), counts)
+            # the integral of online players is the sum of all online times
+            seconds = sum(count * (t_next - t) for (t, count), (t_next, next_count) in zip(counts, counts[1:]))
+            self.assertEqual(sum(total[0] for total in servers.collect_totals('2015-01-01', '2015-01-03').values()),
+                             seconds)
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_joined_requests(self):
+        with tempfile.TemporaryDirectory() as logs_dir:
+            copy_test_logs(logs_dir)
+            logs = aio.AsyncLogDirectory(logs_dir)
+            scans = []
+            scan_log = logalyzer.scan_log
+            def counting_scan_log(source_path, *args, **kwargs):
+                scans.append(source_path)
+                return scan_log(source_path, *args, **kwargs)
+            logalyzer.scan_log = counting_scan_log
+            try:
+                results = await asyncio.gather(*[logs.collect_user_sessions('2015-01-01', '2015-01-04')
+                                                 for i in range(10)])
+            finally:
+                logalyzer.scan_log = scan_log
+            self.assertTrue(scans)
+            self.assertEqual(len(set(scans)), len(scans))  # every log converted once
+            self.assertTrue(all(result is results[0] for result in results))
+            expected = logalyzer.LogDirectory(logs_dir).collect_user_sessions('2015-01-01', '2015-01-04')
+            self.assertEqual(expected, results[0])
+            self.assertEqual({}, logs.pending)
+
+            uptimes, totals = await asyncio.gather(logs.collect_uptimes(), logs.collect_totals())
+            self.assertEqual(list(logalyzer.LogDirectory(logs_dir).collect_uptimes()), uptimes)
+            self.assertEqual(logalyzer.LogDirectory(logs_dir).collect_totals(), totals)
+
+    async def test_read_interval_iter(self):
+        logs = aio.AsyncLogDirectory('test_logs')
+        log_names = [log_file.log_name async for log_file in logs.read_interval_iter('2015-01-02')]
+        self.assertEqual([log_file.log_name for log_file in logalyzer.LogDirectory('test_logs').read_interval_iter('2015-01-02')],
+                         log_names)
+        self.assertEqual(['2015-01-02-1', '2015-01-04-1', '2015-01-04-2', 'latest'], log_names)
+
+
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.logs_dir = tempfile.mkdtemp()
+        copy_test_logs(self.logs_dir)
+        self.service = service.StatsService(self.logs_dir)
+        self.computed = []
+        def counting(handler):
+            def inner(service, from_date, to_date):
+                self.computed.append(handler.__name__)
+                return handler(service, from_date, to_date)
+            return inner
+        self.service.handlers = dict((path, counting(handler)) for path, handler in service.StatsService.handlers.items())
+        self.server = service.make_server(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.logs_dir)
+
+    def get_json(self, path):
+        url = 'http://127.0.0.1:%i%s' % (self.server.server_address[1], path.replace(' ', '%20'))
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read().decode())
+
+    def test_totals_and_sessions(self):
+        totals = self.get_json('/totals')
+        expected = logalyzer.LogDirectory(self.logs_dir).collect_totals()
+        self.assertEqual(dict((uuid, {'seconds': seconds, 'name': name}) for uuid, (seconds, name) in expected.items()),
+                         totals)
+        sessions = self.get_json('/sessions?from=2015-01-02&to=2015-01-04 12:00:00')
+        expected = logalyzer.LogDirectory(self.logs_dir).collect_user_sessions('2015-01-02', '2015-01-04 12:00:00')
+        self.assertEqual(dict((uuid, [session[1:] for session in user_sessions])
+                              for uuid, user_sessions in expected.items()), sessions)
+        self.assertEqual(['totals_json', 'sessions_json'], self.computed)
+
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.get_json('/nothing')
+        self.assertEqual(404, cm.exception.code)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.get_json('/totals?from=yesterday')
+        self.assertEqual(400, cm.exception.code)
+
+        def failing(service, from_date, to_date):
+            return {}['missing']
+        self.service.handlers['/totals'] = failing
+        with self.assertRaises(urllib.error.HTTPError) as cm, self.assertLogs('logalyzer', 'ERROR'):
+            self.get_json('/totals?from=2015-01-02')
+        self.assertEqual(500, cm.exception.code)
+
+    def test_invalidation(self):
+        first_day = self.get_json('/totals?from=2015-01-01&to=2015-01-02')
+        until_now = self.get_json('/totals?from=2015-01-04')
+        self.assertEqual(until_now, self.get_json('/totals?from=2015-01-04'))
+        self.assertEqual(first_day, self.get_json('/totals?from=2015-01-01&to=2015-01-02'))
+        self.assertEqual(2, len(self.computed))
+
+        # latest.log grows: only ranges reaching it are computed again
+        latest_path = os.path.join(self.logs_dir, 'latest.log')
+        mtime = os.path.getmtime(latest_path)
+        with open(latest_path, 'a') as latest_file:
+            latest_file.write('[19:00:00] [Server thread/INFO]: <HHL> still here\n')
+        os.utime(latest_path, (mtime, mtime))
+        self.assertEqual(until_now, self.get_json('/totals?from=2015-01-04'))
+        self.assertEqual(first_day, self.get_json('/totals?from=2015-01-01&to=2015-01-02'))
+        self.assertEqual(3, len(self.computed))
+
+        # a log of the last days changes: only ranges covering it are computed again
+        log_path = os.path.join(self.logs_dir, '2015-01-04-2.log.gz')
+        with open('test_logs/2015-01-04-2.log', 'rb') as log_file:
+            log_bytes = log_file.read().replace(b'[13:00:00]', b'[12:30:00]')  # HHL leaves earlier
+        with gzip.open(log_path, 'wb') as log_file:
+            log_file.write(log_bytes)
+        os.remove(os.path.join(self.logs_dir, '2015-01-04-2.log.bin'))
+        self.assertNotEqual(until_now, self.get_json('/totals?from=2015-01-04'))
+        self.assertEqual(first_day, self.get_json('/totals?from=2015-01-01&to=2015-01-02'))
+        self.assertEqual(4, len(self.computed))
+
+    def test_latest_after_gap(self):
+        # latest.log written on a day without rotated logs, so a range ending
+        # before the last rotated log still reads it
+        latest_path = os.path.join(self.logs_dir, 'latest.log')
+        latest_mtime = TestLatestCheckpoint.LATEST_MTIME - 24 * 3600  # 2015-01-03 20:00:00
+        os.utime(latest_path, (latest_mtime, latest_mtime))
+        totals = self.get_json('/totals?from=2015-01-02&to=2015-01-03 23:00:00')
+        self.assertEqual(totals, self.get_json('/totals?from=2015-01-02&to=2015-01-03 23:00:00'))
+        self.assertEqual(1, len(self.computed))
+
+        with open(latest_path, 'a') as latest_file:
+            latest_file.write('ection: Disconnected\n[17:00:00] [Server thread/INFO]: Ulexos lost connection: Disconnected\n')
+        os.utime(latest_path, (latest_mtime, latest_mtime))
+        self.assertNotEqual(totals, self.get_json('/totals?from=2015-01-02&to=2015-01-03 23:00:00'))
+        self.assertEqual(2, len(self.computed))
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_snapshot_like_logs(self):
+        logs = logalyzer.LogDirectory('test_logs')
+        snapshot = batch.SessionSnapshot.from_logs(logs, '2015-01-01', '2015-01-05')
+        all_sessions = logs.collect_user_sessions('2015-01-01', '2015-01-05')
+        self.assertEqual(all_sessions, snapshot.collect_user_sessions('2015-01-01', '2015-01-05'))
+        for from_date, to_date in (('2015-01-01', '2015-01-02'), ('2015-01-02 12:00:00', '2015-01-04'),
+                                   ('2015-01-04', '2015-01-04 15:00:00'), ('2015-01-01', '2015-01-05')):
+            t_start, t_end = timeutils.date_str_to_epoch(from_date), timeutils.date_str_to_epoch(to_date)
+            expected = {}
+            for uuid, sessions in all_sessions.items():
+                for uuid, t_from, t_to, name in sessions:
+                    if min(t_to, t_end) > max(t_from, t_start):
+                        expected.setdefault(uuid, []).append([uuid, max(t_from, t_start), min(t_to, t_end), name])
+            self.assertEqual(expected, snapshot.collect_user_sessions(from_date, to_date))
+            whitelisted = snapshot.collect_user_sessions(from_date, to_date, whitelist={UUID_HHL})
+            self.assertEqual(dict((uuid, s) for uuid, s in expected.items() if uuid == UUID_HHL), whitelisted)
+            for t_from, t_to in snapshot.collect_uptimes(from_date, to_date):
+                self.assertTrue(t_start <= t_from < t_to <= t_end)
+        self.assertEqual({UUID_HHL: 'HHL', UUID_ULEXOS: 'Ulexos', UUID_OFFLINEGOTT: 'Offlinegott'},
+                         snapshot.players('2015-01-01', '2015-01-05'))
+        self.assertEqual(['HHL', 'Offlinegott', 'Ulexos'], snapshot.names())
+
+    def test_jobs(self):
+        days = batch.day_jobs('2015-01-01', '2015-01-04', 'out', 'html')
+        self.assertEqual([os.path.join('out', '2015-01-0%i.html' % day) for day in (1, 2, 3)],
+                         [job.out_path for job in days])
+        self.assertEqual(('2015-01-03 00:00:00', '2015-01-04 00:00:00'), (days[-1].from_date, days[-1].to_date))
+        # 2015-01-01 is a Thursday, in the first ISO week of 2015
+        weeks = batch.week_jobs('2015-01-01', '2015-01-06', 'out')
+        self.assertEqual([(os.path.join('out', '2015-W01.png'), '2014-12-29 00:00:00', '2015-01-05 00:00:00'),
+                          (os.path.join('out', '2015-W02.png'), '2015-01-05 00:00:00', '2015-01-12 00:00:00')],
+                         [job[:3] for job in weeks])
+        snapshot = batch.SessionSnapshot.from_logs(logalyzer.LogDirectory('test_logs'), '2015-01-01', '2015-01-05')
+        players = batch.player_jobs(snapshot, '2015-01-01', '2015-01-05', 'out')
+        self.assertEqual([os.path.join('out', name + '.png') for name in ('HHL', 'Offlinegott', 'Ulexos')],
+                         [job.out_path for job in players])
+        self.assertEqual(frozenset([UUID_HHL]), players[0].whitelist)
+
+    @unittest.skipIf(timeline is None, 'needs cairo')
+    def test_render_jobs(self):
+        requests = []
+
+        class NoSkinHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.path.rsplit('/', 1)[-1][:-len('.png')])
+                self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), NoSkinHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        skin_store = timeline.skin_store
+        snapshot = batch.SessionSnapshot.from_logs(logalyzer.LogDirectory('test_logs'), '2015-01-01', '2015-01-05')
+        pages = []
+        try:
+            for workers in (None, 2):
+                requests.clear()
+                with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as out_dir:
+                    timeline.configure_skins(cache_dir=cache_dir,
+                                             skin_url='http://127.0.0.1:%i/%%s.png' % server.server_address[1])
+                    jobs = batch.day_jobs('2015-01-01', '2015-01-03', os.path.join(out_dir, 'days'), 'html')
+                    self.assertEqual([job.out_path for job in jobs], batch.render_jobs(snapshot, jobs, workers))
+                    page_bytes = []
+                    for job in jobs:
+                        with open(job.out_path, 'rb') as page_file:
+                            page_bytes.append(page_file.read())
+                    pages.append(page_bytes)
+                # skins are fetched once, by the parent, and handed to the workers
+                self.assertEqual(snapshot.names(), sorted(requests))
+        finally:
+            timeline.skin_store = skin_store
+            timeline.skin_cache.clear()
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(pages[0], pages[1])
+        self.assertIn(b'2015', pages[0][0])
+
+
 if __name__ == '__main__':
     unittest.main()